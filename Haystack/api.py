@@ -5,12 +5,476 @@ All the data is passed from the GUI to the functions in this layer.
 Any necessary transformations to the data are made here and the data
 is then passed on to the searchResult and replacer modules.
 """
-from typing import List, Tuple
+import os
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 import libadalang as lal  # type: ignore
 from Haystack import searchresult as sr
 from Haystack import replacer as rep
-from Haystack.location import Location
+from Haystack.location import EditDelta, Location
 from Haystack import exceptions
+from Haystack import contextpool
+from Haystack import unitcache
+from Haystack import serialization
+from Haystack.patternset import DiscriminationNet
+from Haystack.prefilter import Prefilter
+from Haystack.projectindex import ProjectIndex
+from Haystack.resultcache import ResultCache, query_key
+from Haystack.ruleguess import RuleHistory, likely_rules, query_shape
+from Haystack.statistics import SearchStatistics
+
+
+def compile(  # pylint: disable=redefined-builtin
+    search_query: str,
+    parse_rule: lal.GrammarRule = lal.default_grammar_rule,
+    case_insensitive: bool = False,
+) -> "Pattern":
+    """
+    Similar to re.compile; parse search_query once into a pattern that can be
+    matched against any number of files and strings.
+
+    :param search_query: The pattern to search for
+    :param parse_rule: The parse rule used to parse the search query
+    :param case_insensitive: Boolean, enables case insensitive searching
+    :return: The compiled pattern
+    """
+    try:
+        unit = _analyze_string(search_query, parse_rule)
+    except ValueError as error:
+        raise exceptions.PatternParseException from error
+    return Pattern(search_query, parse_rule, case_insensitive, unit)
+
+
+class Pattern:
+    """
+    A compiled search query, similar to the pattern objects returned by re.compile.
+    It holds the parsed search query, the wildcards it uses and the case flag,
+    so the search query only has to be parsed once.
+    Files that lack one of the literal tokens of the pattern are rejected
+    by its prefilter without parsing them.
+
+    :param search_query: The pattern to search for
+    :param parse_rule: The parse rule that was used to parse the search query
+    :param case_insensitive: Boolean, enables case insensitive searching
+    :param unit: The analysis unit containing the parsed search query
+    """
+
+    search_query: str
+    parse_rule: lal.GrammarRule
+    case_insensitive: bool
+    unit: lal.AnalysisUnit
+    tree: sr.PatternNode
+    singular_wildcards: List[str]
+    plural_wildcards: List[str]
+    prefilter: Prefilter
+
+    def __init__(
+        self,
+        search_query: str,
+        parse_rule: lal.GrammarRule,
+        case_insensitive: bool,
+        unit: lal.AnalysisUnit,
+    ):
+        """Constructor method"""
+        self.search_query = search_query
+        self.parse_rule = parse_rule
+        self.case_insensitive = case_insensitive
+        self.unit = unit
+        self.tree = sr.compile_pattern(unit.root)
+        self.singular_wildcards, self.plural_wildcards = sr.find_wildcards(unit.root)
+        self.prefilter = Prefilter(unit.root, case_insensitive)
+
+    def findall_file(
+        self,
+        filepath: str,
+        statistics: Optional[SearchStatistics] = None,
+        cache: Optional[ResultCache] = None,
+    ) -> List[Location]:
+        """
+        Return all matches of the pattern in a file at location filepath.
+
+        :param filepath: The filepath for the file to search in
+        :param statistics: The statistics to record the search of this file in
+        :param cache: The result cache to consult before parsing the file
+        :return: A list of locations where the file matches the pattern
+        """
+        return list(self.finditer_file(filepath, statistics, cache))
+
+    def findall_string(
+        self,
+        to_search: str,
+        to_search_parse_rule: lal.GrammarRule = lal.default_grammar_rule,
+    ) -> List[Location]:
+        """
+        Return all matches of the pattern in the string to_search.
+
+        :param to_search: The string on which the search operation is performed
+        :param to_search_parse_rule: The parse rule used to parse the string on which
+                the search operation is performed
+        :return: A list of locations where the string matches the pattern
+        """
+        return list(self.finditer_string(to_search, to_search_parse_rule))
+
+    def finditer_file(
+        self,
+        filepath: str,
+        statistics: Optional[SearchStatistics] = None,
+        cache: Optional[ResultCache] = None,
+    ) -> Iterator[Location]:
+        """
+        Return an iterator over all matches of the pattern in a file at location filepath.
+        A file rejected by the prefilter is not parsed at all,
+        so it yields no matches even if it contains syntax errors.
+        With a result cache, the matches in a file whose contents were searched
+        before are looked up instead, and the matches of other files are stored.
+
+        :param filepath: The filepath for the file to search in
+        :param statistics: The statistics to record the search of this file in
+        :param cache: The result cache to consult before parsing the file
+        :return: An iterator over the locations where the file matches the pattern
+        """
+        statistics = SearchStatistics() if statistics is None else statistics
+        statistics.files_searched += 1
+        if cache is None:
+            data = None
+            if self.prefilter.tokens:
+                # The prefilter reads the file, so the parser does not have to
+                data = unitcache.get_cache().contents(filepath)
+                if not self.prefilter.accepts(data):
+                    statistics.files_rejected += 1
+                    return iter(())
+            return self._search_file(filepath, data)
+        data = unitcache.get_cache().contents(filepath)
+        if not self.prefilter.accepts(data):
+            statistics.files_rejected += 1
+            return iter(())
+        key = self.cache_key()
+        digest = serialization.content_digest(data)
+        locations = cache.get(key, digest)
+        if locations is not None:
+            statistics.files_cached += 1
+            return iter(locations)
+        try:
+            locations = list(self._search_file(filepath, data))
+        except exceptions.OperandParseException:
+            cache.put(key, digest, None)
+            raise
+        cache.put(key, digest, locations)
+        return iter(locations)
+
+    def cache_key(self) -> str:
+        """Returns the key of the results of the pattern in a result cache."""
+        return query_key(self.tree, self.parse_rule, self.case_insensitive)
+
+    def _search_file(
+        self, filepath: str, data: Optional[bytes] = None
+    ) -> Iterator[Location]:
+        """
+        Parses a file, or takes it from the unit cache, and searches it
+
+        :param filepath: The filepath for the file to search in
+        :param data: The contents of the file, when they were already read
+        :return: An iterator over the locations where the file matches the pattern
+        """
+        try:
+            operand = _analyze_cached_file(filepath, data)
+        except ValueError as error:
+            raise exceptions.OperandParseException from error
+        return _iter_search(
+            self.tree,
+            operand.unit.root,
+            self.case_insensitive,
+            operand.node_index(),
+        )
+
+    def finditer_string(
+        self,
+        to_search: str,
+        to_search_parse_rule: lal.GrammarRule = lal.default_grammar_rule,
+    ) -> Iterator[Location]:
+        """
+        Return an iterator over all matches of the pattern in the string to_search.
+
+        :param to_search: The string on which the search operation is performed
+        :param to_search_parse_rule: The parse rule used to parse the string on which
+                the search operation is performed
+        :return: An iterator over the locations where the string matches the pattern
+        """
+        try:
+            operand = _analyze_string(to_search, to_search_parse_rule)
+        except ValueError as error:
+            raise exceptions.OperandParseException from error
+        return _iter_search(self.tree, operand.root, self.case_insensitive)
+
+    def refind_file(
+        self, filepath: str, locations: List[Location], deltas: List[EditDelta]
+    ) -> List[Location]:
+        """
+        Updates the matches of the pattern in a file after some of its text was replaced.
+        Matches outside the replaced text are moved by the edit deltas instead of being
+        searched for again, only the nodes around the replaced text are searched.
+        The result is the same as that of findall_file on the edited file.
+
+        :param filepath: The filepath for the file that was edited
+        :param locations: The matches of the pattern in the file before the edit
+        :param deltas: The edit deltas of the replacements, as returned by replace_file
+        :return: A list of locations where the edited file matches the pattern
+        """
+        kept, spans = _shift_locations(locations, deltas)
+        try:
+            operand = _analyze_cached_file(filepath)
+        except ValueError as error:
+            raise exceptions.OperandParseException from error
+        index = operand.node_index()
+        found = sr.iter_search(
+            self.tree,
+            operand.unit.root,
+            self.case_insensitive,
+            index,
+            index.overlapping(spans),
+        )
+        # Like a full search, leave out matches inside other matches
+        merged: List[Location] = []
+        for location in sorted(list(found) + kept, key=_span_order):
+            if merged and _position(location, False) <= _position(merged[-1], False):
+                continue
+            merged.append(location)
+        return merged
+
+    def sub_file(self, filepath: str, replacement: str):
+        """
+        Replace all matches of the pattern in a file located by filepath with the replacement.
+
+        :param filepath: The filepath for the file to search in
+        :param replacement: The string to replace the matched text with
+        """
+        self.subn_file(filepath, replacement)
+
+    def subn_file(self, filepath: str, replacement: str) -> int:
+        """
+        Same as sub_file, but also return the number of replacements that were made.
+        The file is left untouched when the pattern does not match.
+
+        :param filepath: The filepath for the file to search in
+        :param replacement: The string to replace the matched text with
+        :return: The number of replacements that were made
+        """
+        data = None
+        if self.prefilter.tokens:
+            data = unitcache.get_cache().contents(filepath)
+            if not self.prefilter.accepts(data):
+                return 0
+        try:
+            operand = _analyze_cached_file(filepath, data)
+        except ValueError as error:
+            raise exceptions.OperandParseException from error
+        locations = _execute_search(
+            self.tree,
+            operand.unit.root,
+            self.case_insensitive,
+            operand.node_index(),
+        )
+        if locations:
+            # The file was read when it was parsed, so hand its contents to the replacer
+            rep.replace_file(filepath, locations, replacement, lines=operand.lines())
+            unitcache.invalidate(filepath)
+        return len(locations)
+
+    def diff_file(self, filepath: str, replacement: str) -> rep.FilePatch:
+        """
+        Dry run of sub_file: return the patch that sub_file would apply to a file,
+        computed from the matches directly, without writing or rereading the file.
+
+        :param filepath: The filepath for the file to search in
+        :param replacement: The string to replace the matched text with
+        :return: The patch of the file, which is empty when the pattern does not match
+        """
+        data = None
+        if self.prefilter.tokens:
+            data = unitcache.get_cache().contents(filepath)
+            if not self.prefilter.accepts(data):
+                return rep.FilePatch(filepath, [])
+        try:
+            operand = _analyze_cached_file(filepath, data)
+        except ValueError as error:
+            raise exceptions.OperandParseException from error
+        locations = _execute_search(
+            self.tree,
+            operand.unit.root,
+            self.case_insensitive,
+            operand.node_index(),
+        )
+        return rep.diff_file(filepath, locations, replacement, lines=operand.lines())
+
+    def diff_string(
+        self,
+        to_replace: str,
+        replacement: str,
+        to_replace_parse_rule: lal.GrammarRule = lal.default_grammar_rule,
+    ) -> rep.FilePatch:
+        """
+        Dry run of sub_string: return the patch that sub_string would apply.
+
+        :param to_replace: The string on which the sub operation is performed
+        :param replacement: The string to replace the matched text with
+        :param to_replace_parse_rule: The parse rule used to parse the string on which the
+                sub operation is performed
+        :return: The patch of the string
+        """
+        locations = self.findall_string(to_replace, to_replace_parse_rule)
+        return rep.diff_string(to_replace, locations, replacement)
+
+    def sub_string(
+        self,
+        to_replace: str,
+        replacement: str,
+        to_replace_parse_rule: lal.GrammarRule = lal.default_grammar_rule,
+    ) -> str:
+        """
+        Replace all matches of the pattern in the to_replace string with the replacement.
+
+        :param to_replace: The string on which the sub operation is performed
+        :param replacement: The string to replace the matched text with
+        :param to_replace_parse_rule: The parse rule used to parse the string on which the
+                sub operation is performed
+        :return: The resulting string after substituting the found matches with the replacement
+        """
+        return self.subn_string(to_replace, replacement, to_replace_parse_rule)[0]
+
+    def subn_string(
+        self,
+        to_replace: str,
+        replacement: str,
+        to_replace_parse_rule: lal.GrammarRule = lal.default_grammar_rule,
+    ) -> Tuple[str, int]:
+        """
+        Same as sub_string, but also return the number of replacements that were made.
+
+        :param to_replace: The string on which the sub operation is performed
+        :param replacement: The string to replace the matched text with
+        :param to_replace_parse_rule: The parse rule used to parse the string on which the
+                sub operation is performed
+        :return: A tuple with the resulting string and the number of replacements
+        """
+        locations = self.findall_string(to_replace, to_replace_parse_rule)
+        return replace_string(to_replace, locations, replacement, None), len(locations)
+
+
+def compile_set(
+    search_queries: Iterable[str],
+    parse_rule: lal.GrammarRule = lal.default_grammar_rule,
+    case_insensitive: bool = False,
+) -> "PatternSet":
+    """
+    Compile many search queries into a set of patterns that are searched for together.
+
+    :param search_queries: The patterns to search for
+    :param parse_rule: The parse rule used to parse the search queries
+    :param case_insensitive: Boolean, enables case insensitive searching
+    :return: The compiled set of patterns
+    """
+    return PatternSet(
+        [compile(query, parse_rule, case_insensitive) for query in search_queries]
+    )
+
+
+class PatternSet:
+    """
+    A set of compiled patterns that are searched for together,
+    in a single traversal of every file or string (see the patternset module).
+    Every match is tagged with the number of its pattern, its position in patterns.
+    A file is only parsed if the prefilter of at least one pattern accepts it,
+    and then only searched for the patterns whose prefilter accepts it.
+
+    :param patterns: The compiled patterns
+    """
+
+    patterns: List[Pattern]
+    net: DiscriminationNet
+
+    def __init__(self, patterns: Iterable[Pattern]):
+        """Constructor method"""
+        self.patterns = list(patterns)
+        self.net = DiscriminationNet(
+            [pattern.tree for pattern in self.patterns],
+            [pattern.case_insensitive for pattern in self.patterns],
+        )
+
+    def findall_file(
+        self, filepath: str, statistics: Optional[SearchStatistics] = None
+    ) -> List[Tuple[int, Location]]:
+        """
+        Return all matches of the patterns in a file at location filepath.
+
+        :param filepath: The filepath for the file to search in
+        :param statistics: The statistics to record the search of this file in
+        :return: A list of tuples with the number of a pattern and the location of a match
+        """
+        return list(self.finditer_file(filepath, statistics))
+
+    def findall_string(
+        self,
+        to_search: str,
+        to_search_parse_rule: lal.GrammarRule = lal.default_grammar_rule,
+    ) -> List[Tuple[int, Location]]:
+        """
+        Return all matches of the patterns in the string to_search.
+
+        :param to_search: The string on which the search operation is performed
+        :param to_search_parse_rule: The parse rule used to parse the string on which
+                the search operation is performed
+        :return: A list of tuples with the number of a pattern and the location of a match
+        """
+        return list(self.finditer_string(to_search, to_search_parse_rule))
+
+    def finditer_file(
+        self, filepath: str, statistics: Optional[SearchStatistics] = None
+    ) -> Iterator[Tuple[int, Location]]:
+        """
+        Return an iterator over all matches of the patterns in a file at location filepath.
+
+        :param filepath: The filepath for the file to search in
+        :param statistics: The statistics to record the search of this file in
+        :return: An iterator over tuples with the number of a pattern
+                and the location of a match
+        """
+        statistics = SearchStatistics() if statistics is None else statistics
+        statistics.files_searched += 1
+        enabled = [True] * len(self.patterns)
+        data = None
+        if any(pattern.prefilter.tokens for pattern in self.patterns):
+            # Read the file once for the prefilters of all patterns and the parser
+            data = unitcache.get_cache().contents(filepath)
+            enabled = [pattern.prefilter.accepts(data) for pattern in self.patterns]
+        if not any(enabled):
+            statistics.files_rejected += 1
+            return iter(())
+        try:
+            operand = _analyze_cached_file(filepath, data)
+        except ValueError as error:
+            raise exceptions.OperandParseException from error
+        return self.net.iter_search(operand.unit.root, operand.node_index(), enabled)
+
+    def finditer_string(
+        self,
+        to_search: str,
+        to_search_parse_rule: lal.GrammarRule = lal.default_grammar_rule,
+    ) -> Iterator[Tuple[int, Location]]:
+        """
+        Return an iterator over all matches of the patterns in the string to_search.
+
+        :param to_search: The string on which the search operation is performed
+        :param to_search_parse_rule: The parse rule used to parse the string on which
+                the search operation is performed
+        :return: An iterator over tuples with the number of a pattern
+                and the location of a match
+        """
+        try:
+            operand = _analyze_string(to_search, to_search_parse_rule)
+        except ValueError as error:
+            raise exceptions.OperandParseException from error
+        return self.net.iter_search(operand.root)
 
 
 def findall_file(
@@ -18,6 +482,7 @@ def findall_file(
     filepath: str,
     parse_rule: lal.GrammarRule = lal.default_grammar_rule,
     case_insensitive: bool = False,
+    cache: Optional[ResultCache] = None,
 ) -> List[Location]:
     """
     Similar to re.findall; return all matches of search_query in a file at location filepath.
@@ -26,17 +491,309 @@ def findall_file(
     :param filepath: The filepath for the file to search in
     :param parse_rule: The parse rule used to parse the search query
     :param case_insensitive: Boolean, enables case insensitive searching
+    :param cache: The result cache to consult before parsing the file
     :return: A list of locations where the file matches the search query
     """
+    return compile(search_query, parse_rule, case_insensitive).findall_file(
+        filepath, cache=cache
+    )
+
+
+def finditer_file(
+    search_query: str,
+    filepath: str,
+    parse_rule: lal.GrammarRule = lal.default_grammar_rule,
+    case_insensitive: bool = False,
+) -> Iterator[Location]:
+    """
+    Similar to re.finditer; return an iterator over all matches of search_query
+    in a file at location filepath.
+    Matches are yielded as soon as they are found, the rest of the file is only
+    searched when more matches are requested.
+
+    :param search_query: The pattern to search for
+    :param filepath: The filepath for the file to search in
+    :param parse_rule: The parse rule used to parse the search query
+    :param case_insensitive: Boolean, enables case insensitive searching
+    :return: An iterator over the locations where the file matches the search query
+    """
+    return compile(search_query, parse_rule, case_insensitive).finditer_file(filepath)
+
+
+def findall_files(
+    search_query: str,
+    filepaths: Iterable[str],
+    parse_rule: lal.GrammarRule = lal.default_grammar_rule,
+    case_insensitive: bool = False,
+    workers: Optional[int] = None,
+    skip_unparsable: bool = False,
+    statistics: Optional[SearchStatistics] = None,
+    index: Optional[ProjectIndex] = None,
+    cache: Optional[ResultCache] = None,
+) -> Iterator[Tuple[str, List[Location]]]:
+    """
+    Search for search_query in many files at once, spread over a pool of worker processes.
+    Every worker parses the search query once and then searches the files it is handed.
+    Results are yielded per file as soon as they are available,
+    so they do not necessarily arrive in the order of filepaths.
+
+    Locations hold the text matched by their wildcards rather than nodes,
+    so they are sent back from the worker processes in a packed binary form.
+
+    With a result cache, files whose contents were searched before are not searched
+    again, and of the other files with identical contents only one is searched.
+    The results of the searched files are stored in the cache.
+
+    :param search_query: The pattern to search for
+    :param filepaths: The filepaths for the files to search in
+    :param parse_rule: The parse rule used to parse the search query
+    :param case_insensitive: Boolean, enables case insensitive searching
+    :param workers: The number of worker processes, defaults to the number of CPUs.
+                    With a single worker the files are searched in this process.
+    :param skip_unparsable: Skip files that could not be parsed instead of raising
+                    an OperandParseException
+    :param statistics: The statistics to record the searched files,
+                    the files rejected by the prefilter and the matches in
+    :param index: The project index used to skip files that cannot match,
+                    it is brought up to date for filepaths first.
+                    Skipped files are not yielded.
+    :param cache: The result cache to consult before searching the files
+    :return: An iterator over tuples of a filepath and the locations found in that file
+    """
+    # Compile the search query here first, so an invalid query is reported right away
+    pattern = compile(search_query, parse_rule, case_insensitive)
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    statistics = SearchStatistics() if statistics is None else statistics
+    if index is not None:
+        filepaths = list(filepaths)
+        candidates = index.candidates(pattern.unit.root, filepaths)
+        statistics.files_searched += len(filepaths) - len(candidates)
+        statistics.files_rejected += len(filepaths) - len(candidates)
+        filepaths = candidates
+
+    if workers <= 1:
+        try:
+            for filepath in filepaths:
+                try:
+                    locations = pattern.findall_file(filepath, statistics, cache)
+                except exceptions.OperandParseException:
+                    statistics.files_unparsable += 1
+                    if not skip_unparsable:
+                        raise
+                    continue
+                statistics.matches += len(locations)
+                yield filepath, locations
+        finally:
+            if cache is not None:
+                cache.flush()
+        return
+
+    yield from _findall_files_parallel(
+        pattern, filepaths, workers, skip_unparsable, statistics, cache
+    )
+
+
+def _findall_files_parallel(
+    pattern: Pattern,
+    filepaths: Iterable[str],
+    workers: int,
+    skip_unparsable: bool,
+    statistics: SearchStatistics,
+    cache: Optional[ResultCache],
+) -> Iterator[Tuple[str, List[Location]]]:
+    """
+    Searches many files in a pool of worker processes for findall_files.
+    The result cache is consulted in this process, before handing out the files.
+
+    :param pattern: The compiled search query
+    :param filepaths: The filepaths for the files to search in
+    :param workers: The number of worker processes
+    :param skip_unparsable: Skip files that could not be parsed instead of raising
+                    an OperandParseException
+    :param statistics: The statistics to record the searched files in
+    :param cache: The result cache to consult before searching the files
+    :return: An iterator over tuples of a filepath and the locations found in that file
+    """
+    # For every file handed to a worker with a result cache: the hash of its contents,
+    # and the files with the same contents that take over its results
+    pending: Dict[str, Tuple[str, List[str]]] = {}
+    if cache is not None:
+        yield from _lookup_files(
+            pattern, filepaths, cache, statistics, skip_unparsable, pending
+        )
+        filepaths = list(pending)
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_search_worker,
+        initargs=(pattern.search_query, pattern.parse_rule, pattern.case_insensitive),
+    )
+    futures: List[Future] = []
     try:
-        operand = _analyze_file(filepath)
-    except ValueError as error:
-        raise exceptions.OperandParseException from error
+        futures = [executor.submit(_search_worker, filepath) for filepath in filepaths]
+        for future in as_completed(futures):
+            filepath, packed, worker_statistics = future.result()
+            statistics.merge(worker_statistics)
+            locations: Optional[List[Location]] = None
+            if packed is not None:
+                locations = serialization.from_binary(packed)[0].locations
+            copies: List[str] = []
+            if cache is not None:
+                digest, copies = pending[filepath]
+                cache.put(pattern.cache_key(), digest, locations)
+                statistics.files_searched += len(copies)
+                statistics.files_cached += len(copies)
+            if locations is None:
+                statistics.files_unparsable += len(copies)
+                if not skip_unparsable:
+                    raise exceptions.OperandParseException(filepath)
+                continue
+            statistics.matches += len(locations) * len(copies)
+            yield filepath, locations
+            for copy in copies:
+                yield copy, list(locations)
+    finally:
+        # Stop handing out work when the caller stops early or an error occurred
+        for future in futures:
+            future.cancel()
+        executor.shutdown()
+        if cache is not None:
+            cache.flush()
+
+
+def _lookup_files(
+    pattern: Pattern,
+    filepaths: Iterable[str],
+    cache: ResultCache,
+    statistics: SearchStatistics,
+    skip_unparsable: bool,
+    pending: Dict[str, Tuple[str, List[str]]],
+) -> Iterator[Tuple[str, List[Location]]]:
+    """
+    Looks up the results of a search of many files in a result cache.
+    Of the files that are not cached, the first file with given contents is added
+    to pending, the files with the same contents are added to its copies.
+
+    :param pattern: The compiled search query
+    :param filepaths: The filepaths for the files to search in
+    :param cache: The result cache to consult
+    :param statistics: The statistics to record the files that need no search in
+    :param skip_unparsable: Skip files cached as unparsable instead of raising
+                    an OperandParseException
+    :param pending: The files that still have to be searched, filled in by this function
+    :return: An iterator over tuples of a filepath and the locations found in that file,
+            for the files that need no search
+    """
+    key = pattern.cache_key()
+    searched: Dict[str, str] = {}
+    for filepath in filepaths:
+        with open(filepath, "rb") as infile:
+            data = infile.read()
+        if not pattern.prefilter.accepts(data):
+            statistics.files_searched += 1
+            statistics.files_rejected += 1
+            yield filepath, []
+            continue
+        digest = serialization.content_digest(data)
+        if digest in searched:
+            pending[searched[digest]][1].append(filepath)
+            continue
+        try:
+            locations = cache.get(key, digest)
+        except exceptions.OperandParseException as error:
+            statistics.files_searched += 1
+            statistics.files_unparsable += 1
+            if not skip_unparsable:
+                raise exceptions.OperandParseException(filepath) from error
+            continue
+        if locations is None:
+            searched[digest] = filepath
+            pending[filepath] = (digest, [])
+            continue
+        statistics.files_searched += 1
+        statistics.files_cached += 1
+        statistics.matches += len(locations)
+        yield filepath, locations
+
+
+def diff_files(
+    search_query: str,
+    filepaths: Iterable[str],
+    replacement: str,
+    parse_rule: lal.GrammarRule = lal.default_grammar_rule,
+    case_insensitive: bool = False,
+    skip_unparsable: bool = False,
+) -> Iterator[rep.FilePatch]:
+    """
+    Dry run of sub_file for many files: yield the patch of every file that
+    the substitution would change, one file at a time, without writing any file.
+    Concatenated, the patches form a unified diff of the whole substitution.
+
+    :param search_query: The pattern to search for
+    :param filepaths: The filepaths for the files to search in
+    :param replacement: The string to replace the matched text with
+    :param parse_rule: The parse rule used to parse the search query
+    :param case_insensitive: Boolean, enables case insensitive searching
+    :param skip_unparsable: Skip files that could not be parsed instead of raising
+                    an OperandParseException
+    :return: An iterator over the patches of the files that would change
+    """
+    pattern = compile(search_query, parse_rule, case_insensitive)
+    for filepath in filepaths:
+        try:
+            patch = pattern.diff_file(filepath, replacement)
+        except exceptions.OperandParseException:
+            if not skip_unparsable:
+                raise
+            continue
+        if patch:
+            yield patch
+
+
+_WORKER_PATTERN: Optional["Pattern"] = None
+
+
+def _init_search_worker(
+    search_query: str, parse_rule: lal.GrammarRule, case_insensitive: bool
+):
+    """
+    Initializes a worker process of findall_files by compiling the search query.
+
+    :param search_query: The pattern to search for
+    :param parse_rule: The parse rule used to parse the search query
+    :param case_insensitive: Boolean, enables case insensitive searching
+    """
+    global _WORKER_PATTERN  # pylint: disable=global-statement
+    _WORKER_PATTERN = compile(search_query, parse_rule, case_insensitive)
+
+
+def _search_worker(
+    filepath: str,
+) -> Tuple[str, Optional[bytes], SearchStatistics]:
+    """
+    Searches a single file in a worker process of findall_files.
+    The locations are sent back in the packed binary form of the serialization
+    module, which is smaller and quicker to produce than pickled locations.
+
+    :param filepath: The filepath for the file to search in
+    :return: A tuple with the filepath, the packed locations found in the file
+            (or None if the file could not be parsed) and the statistics of the search
+    """
+    assert _WORKER_PATTERN is not None
+    statistics = SearchStatistics()
     try:
-        pattern = _analyze_string(search_query, parse_rule)
-    except ValueError as error:
-        raise exceptions.PatternParseException from error
-    return _execute_search(pattern.root, operand.root, case_insensitive)
+        locations = _WORKER_PATTERN.findall_file(filepath, statistics)
+    except exceptions.OperandParseException:
+        statistics.files_unparsable += 1
+        return filepath, None, statistics
+    statistics.matches += len(locations)
+    packed = serialization.to_binary([serialization.FileResults(filepath, locations)])
+    return filepath, packed, statistics
+
+
+# The parse rule that last matched for every search query and case flag in
+# findall_file_try_rules, the least recently used search queries are forgotten first
+TRY_RULES_MEMO_SIZE = 256
+_TRY_RULES_MEMO: "OrderedDict[Tuple[str, bool], lal.GrammarRule]" = OrderedDict()
 
 
 def findall_file_try_rules(
@@ -44,44 +801,166 @@ def findall_file_try_rules(
     filepath: str,
     parse_rules_to_try: List[lal.GrammarRule],
     case_insensitive: bool,
+    history: Optional[RuleHistory] = None,
 ) -> List[Location]:
     """
     Similar to findall_file, except now we try all parse rules until
-    we find one that parses the search query.
+    we find one that parses the search query and matches in the file.
+    The rule that matched the last time the same search query was searched for with
+    the same case flag is tried first, on its own.
+    Next, the rules guessed by guess_parse_rules are tried,
+    ranked in the order they are guessed in, and only if none of them matches,
+    the other rules are tried, ranked in the order they are given in.
+    Each group of rules is tried by compiling the search query with every rule of
+    the group that parses it and searching for all the patterns in a single traversal
+    of the file, which is parsed only once.
+    The matches of the highest ranked rule that matches are returned.
 
     :param search_query: The pattern to search for
     :param filepath: The filepath for the file to search in
     :param parse_rules_to_try: The list of parse rules that the algorithm should try
     :param case_insensitive: Boolean, enables case insensitive searching
-    :return: A list of locations where the file matches the search query
+    :param history: The rule history that ranks the guessed rules and records which
+            rule matched, defaults to no history. The history is not saved,
+            the caller saves it once it is done searching.
+    :return: A list of locations where the file matches the search query.
+            The list is empty if some rule parses the search query but none of the
+            rules that parse it matches in the file. If no rule parses the search
+            query, a ValueError is raised.
     """
-    # If no parse rules are supplied, return a ValueError
+    # If no parse rules are supplied, or none parses the search query, raise a ValueError
     if not parse_rules_to_try:
         raise ValueError
 
-    try:
-        # Try to parse the search query
-        pattern, tried_rules = _analyze_string_try_rules(
-            search_query, parse_rules_to_try
+    key = (search_query, case_insensitive)
+    remembered = _TRY_RULES_MEMO.get(key)
+    parsed = remembered in parse_rules_to_try
+    if parsed:
+        matches = compile(search_query, remembered, case_insensitive).findall_file(
+            filepath
         )
-        operand = _analyze_file(filepath)
-    except ValueError as error:
-        raise error
-
-    # Parsing succeeded, look for any matches
-    matches = _execute_search(pattern.root, operand.root, case_insensitive)
-
-    if not matches:
-        # If no matches were found, we might have selected the wrong parse rule,
-        # define a new list of rules to try and try again
-        parse_rules_to_try = [
-            rule for rule in parse_rules_to_try if rule not in tried_rules
-        ]
-        return findall_file_try_rules(
-            search_query, filepath, parse_rules_to_try, case_insensitive
+        if matches:
+            _TRY_RULES_MEMO.move_to_end(key)
+            return matches
+
+    # The rule that matched before is known not to match this time
+    candidates = [rule for rule in parse_rules_to_try if rule != remembered]
+    guessed = [
+        rule for rule in guess_parse_rules(search_query, history) if rule in candidates
+    ]
+    trees: Set[str] = set()
+    for rules_to_try in [guessed, [rule for rule in candidates if rule not in guessed]]:
+        rules, patterns = _compile_rules(
+            search_query, rules_to_try, case_insensitive, trees
         )
+        if not patterns:
+            continue
+        parsed = True
+        best, matches = _best_matches(PatternSet(patterns), filepath)
+        if matches:
+            _remember_rule(search_query, case_insensitive, rules[best], history)
+            return matches
+    if not parsed:
+        raise ValueError
+    return []
+
+
+def _best_matches(patterns: PatternSet, filepath: str) -> Tuple[int, List[Location]]:
+    """
+    Searches for a set of patterns in a single traversal of a file
+
+    :param patterns: The patterns to search for, the highest ranked pattern first
+    :param filepath: The filepath for the file to search in
+    :return: A tuple with the number of the highest ranked pattern that matches
+            and its matches, or -1 and an empty list if none matches
+    """
+    found: Dict[int, List[Location]] = {}
+    for number, location in patterns.finditer_file(filepath):
+        found.setdefault(number, []).append(location)
+    if not found:
+        return -1, []
+    best = min(found)
+    return best, found[best]
+
+
+def guess_parse_rules(
+    search_query: str, history: Optional[RuleHistory] = None
+) -> List[lal.GrammarRule]:
+    """
+    Guesses which parse rules parse a search query from its shape: its leading keyword
+    and its delimiters, such as a trailing semicolon or an assignment.
+    The rules that matched search queries of the same shape before, as recorded in
+    the rule history, are ranked first, the rule that matched most often first.
+
+    :param search_query: The search query
+    :param history: The rule history, defaults to no history
+    :return: A short list of parse rules, most likely first
+    """
+    shape = query_shape(search_query)
+    names = likely_rules(shape)
+    if history is not None:
+        names = history.ranked(shape) + names
+    guessed: List[lal.GrammarRule] = []
+    for name in names:
+        # Rules the installed version of libadalang does not have are left out
+        rule = getattr(lal.GrammarRule, name, None)
+        if rule is not None and rule not in guessed:
+            guessed.append(rule)
+    return guessed
 
-    return matches
+
+def _remember_rule(
+    search_query: str,
+    case_insensitive: bool,
+    rule: lal.GrammarRule,
+    history: Optional[RuleHistory],
+):
+    """
+    Remembers the parse rule that matched for a search query in findall_file_try_rules
+
+    :param search_query: The search query
+    :param case_insensitive: Whether the search was case insensitive
+    :param rule: The parse rule that matched
+    :param history: The rule history to record the rule in, if any
+    """
+    key = (search_query, case_insensitive)
+    _TRY_RULES_MEMO[key] = rule
+    _TRY_RULES_MEMO.move_to_end(key)
+    if len(_TRY_RULES_MEMO) > TRY_RULES_MEMO_SIZE:
+        _TRY_RULES_MEMO.popitem(last=False)
+    if history is not None:
+        history.record(query_shape(search_query), str(rule))
+
+
+def _compile_rules(
+    search_query: str,
+    parse_rules: List[lal.GrammarRule],
+    case_insensitive: bool,
+    trees: Set[str],
+) -> Tuple[List[lal.GrammarRule], List[Pattern]]:
+    """
+    Compiles a search query with every parse rule that parses it.
+    Rules that parse the search query into a tree that is already known are left out.
+
+    :param search_query: The pattern to compile
+    :param parse_rules: The parse rules to try
+    :param case_insensitive: Boolean, enables case insensitive searching
+    :param trees: The keys of the known trees, which the new trees are added to
+    :return: A tuple with the rules that parse the search query and their patterns
+    """
+    rules: List[lal.GrammarRule] = []
+    patterns: List[Pattern] = []
+    for rule in parse_rules:
+        try:
+            pattern = compile(search_query, rule, case_insensitive)
+        except exceptions.PatternParseException:
+            continue
+        tree = query_key(pattern.tree, None, case_insensitive)
+        if tree not in trees:
+            trees.add(tree)
+            rules.append(rule)
+            patterns.append(pattern)
+    return rules, patterns
 
 
 def findall_string(
@@ -102,15 +981,35 @@ def findall_string(
     :param case_insensitive: Boolean, enables case insensitive searching
     :return: A list of locations where the string matches the search query
     """
-    try:
-        operand = _analyze_string(to_search, to_search_parse_rule)
-    except ValueError as error:
-        raise exceptions.OperandParseException from error
-    try:
-        pattern = _analyze_string(search_query, search_query_parse_rule)
-    except ValueError as error:
-        raise exceptions.PatternParseException from error
-    return _execute_search(pattern.root, operand.root, case_insensitive)
+    return compile(
+        search_query, search_query_parse_rule, case_insensitive
+    ).findall_string(to_search, to_search_parse_rule)
+
+
+def finditer_string(
+    search_query: str,
+    to_search: str,
+    search_query_parse_rule: lal.GrammarRule = lal.default_grammar_rule,
+    to_search_parse_rule: lal.GrammarRule = lal.default_grammar_rule,
+    case_insensitive: bool = False,
+) -> Iterator[Location]:
+    """
+    Similar to re.finditer; return an iterator over all matches of search_query
+    in the string to_search.
+    Matches are yielded as soon as they are found, the rest of the string is only
+    searched when more matches are requested.
+
+    :param search_query: The pattern to search for
+    :param to_search: The string on which the search operation is performed
+    :param search_query_parse_rule: The parse rule used to parse the search query
+    :param to_search_parse_rule: The parse rule used to parse the string on which
+            the search operation is performed
+    :param case_insensitive: Boolean, enables case insensitive searching
+    :return: An iterator over the locations where the string matches the search query
+    """
+    return compile(
+        search_query, search_query_parse_rule, case_insensitive
+    ).finditer_string(to_search, to_search_parse_rule)
 
 
 def sub_file(
@@ -130,8 +1029,7 @@ def sub_file(
     :param parse_rule: The parse rule used to parse the search query
     :param case_insensitive: Boolean, enables case insensitive searching
     """
-    locations = findall_file(search_query, filepath, parse_rule, case_insensitive)
-    replace_file(filepath, locations, replacement)
+    compile(search_query, parse_rule, case_insensitive).sub_file(filepath, replacement)
 
 
 def sub_string(
@@ -155,14 +1053,9 @@ def sub_string(
     :param case_insensitive: Boolean, enables case insensitive searching
     :return: The resulting string after substituting the found matches with the replacement
     """
-    locations = findall_string(
-        search_query,
-        to_replace,
-        search_query_parse_rule,
-        to_replace_parse_rule,
-        case_insensitive,
+    return compile(search_query, search_query_parse_rule, case_insensitive).sub_string(
+        to_replace, replacement, to_replace_parse_rule
     )
-    return replace_string(to_replace, locations, replacement, None)
 
 
 def replace_string(
@@ -192,7 +1085,8 @@ def replace_file(
     replacement: str,
     indexes: List[int] = None,
     output: str = None,
-):
+    streaming: bool = False,
+) -> List[EditDelta]:
     """
     Api wrapper around replacer.replace_file()
 
@@ -204,22 +1098,141 @@ def replace_file(
                     Replace all locations if indexes is None
     :param output: The filepath for the file to write the output to.
                     If None, write to the same file as filepath
+    :param streaming: Memory map the file and copy its untouched bytes to the output,
+                    which bounds the memory use for very large files
+    :return: The edit deltas of the replacements, which Pattern.refind_file uses
+                    to update the other locations in the file
+    """
+    deltas = rep.replace_file(
+        filepath, locations, replacement, indexes, output, streaming=streaming
+    )
+    unitcache.invalidate(filepath if output is None else output)
+    return deltas
+
+
+def replace_files(
+    files: Dict[str, List[Location]],
+    replacement: str,
+    workers: Optional[int] = None,
+    streaming: bool = False,
+    validate: bool = True,
+) -> Dict[str, List[EditDelta]]:
+    """
+    Api wrapper around replacer.replace_files(); replaces in many files, all or nothing.
+    The outputs are staged on a pool of threads. When validation is enabled,
+    every staged output is parsed in the calling thread,
+    and if one does not parse no file is changed.
+
+    :param files: The locations to replace, by the filepath of the file they are in
+    :param replacement: The string to replace the specified locations with
+    :param workers: The number of threads staging the files
+    :param streaming: Memory map the files and copy their untouched bytes to the outputs
+    :param validate: Whether to check that every output still parses,
+                    raising an OperandParseException for the first one that does not
+    :return: The edit deltas of the replacements, by filepath
     """
-    rep.replace_file(filepath, locations, replacement, indexes, output)
+    deltas = rep.replace_files(
+        files,
+        replacement,
+        workers,
+        streaming,
+        _validate_staged_file if validate else None,
+    )
+    for filepath in files:
+        unitcache.invalidate(filepath)
+    return deltas
+
+
+def _validate_staged_file(filepath: str, staged: str):
+    """
+    Checks that the staged output of a replacement in a file still parses
+
+    :param filepath: The filepath of the file the replacement was made in
+    :param staged: The path of the staged output
+    """
+    unit = contextpool.get_pool().parse_file(staged)
+    if unit.diagnostics:
+        raise exceptions.OperandParseException(filepath)
+
+
+def _shift_locations(
+    locations: List[Location], deltas: List[EditDelta]
+) -> Tuple[List[Location], List[Tuple[Tuple[int, int], Tuple[int, int]]]]:
+    """
+    Moves locations past the replacements described by edit deltas
+
+    :param locations: The locations before the replacements
+    :param deltas: The edit deltas, in the order of the text
+    :return: A tuple with the moved locations that do not overlap a replacement,
+            and the spans that have to be searched again: the replaced text,
+            and the text of the locations that did overlap a replacement
+    """
+    kept = list(locations)
+    spans: List[Tuple[Tuple[int, int], Tuple[int, int]]] = []
+    # Every delta is relative to the text before all replacements,
+    # so applying them from the last one backwards keeps them valid
+    for delta in reversed(deltas):
+        spans = [(delta.shift(start), delta.shift(end)) for start, end in spans]
+        spans.append((delta.start, delta.new_end))
+        moved: List[Location] = []
+        for location in kept:
+            shifted = delta.shift_location(location)
+            if shifted is None:
+                start = delta.shift(_position(location, True))
+                spans.append((start, delta.shift(_position(location, False))))
+            else:
+                moved.append(shifted)
+        kept = moved
+    return kept, spans
+
+
+def _position(location: Location, start: bool) -> Tuple[int, int]:
+    """Returns the (line, character) position of the start or the end of a location."""
+    if start:
+        return location.start_line, location.start_char
+    return location.end_line, location.end_char
+
+
+def _span_order(location: Location) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+    """Orders locations by their start, and enclosing locations before enclosed ones."""
+    end_line, end_char = _position(location, False)
+    return _position(location, True), (-end_line, -end_char)
 
 
 def _execute_search(
-    pattern: lal.AdaNode, operand: lal.AdaNode, case_insensitive: bool
+    pattern: Union[lal.AdaNode, sr.PatternNode],
+    operand: lal.AdaNode,
+    case_insensitive: bool,
+    index: Optional[sr.NodeIndex] = None,
 ) -> List[Location]:
     """
     Api wrapper around searchResult.execute_search()
 
-    :param pattern: The parse tree to search for
+    :param pattern: The parse tree to search for, or its compiled pattern
     :param operand: The parse tree to search in
     :param case_insensitive: Whether to enable case insensitive searching
+    :param index: The node index of operand, if one was built before
     :return: The list of locations where the operand matches the search pattern
     """
-    return sr.execute_search(pattern, operand, case_insensitive)
+    return sr.execute_search(pattern, operand, case_insensitive, index)
+
+
+def _iter_search(
+    pattern: Union[lal.AdaNode, sr.PatternNode],
+    operand: lal.AdaNode,
+    case_insensitive: bool,
+    index: Optional[sr.NodeIndex] = None,
+) -> Iterator[Location]:
+    """
+    Api wrapper around searchResult.iter_search()
+
+    :param pattern: The parse tree to search for, or its compiled pattern
+    :param operand: The parse tree to search in
+    :param case_insensitive: Whether to enable case insensitive searching
+    :param index: The node index of operand, if one was built before
+    :return: An iterator over the locations where the operand matches the search pattern
+    """
+    return sr.iter_search(pattern, operand, case_insensitive, index)
 
 
 def _analyze_string(string: str, parse_rule: lal.GrammarRule) -> lal.AnalysisUnit:
@@ -230,9 +1243,8 @@ def _analyze_string(string: str, parse_rule: lal.GrammarRule) -> lal.AnalysisUni
     :param parse_rule: The parse rule used to parse the string
     :return: The analysis unit containing the created parse tree
     """
-    context = lal.AnalysisContext()
-    unit = context.get_from_buffer(
-        "", string, rule=getattr(lal.GrammarRule, parse_rule)
+    unit = contextpool.get_pool().parse_buffer(
+        string, getattr(lal.GrammarRule, parse_rule)
     )
     if not unit.diagnostics:
         return unit
@@ -251,14 +1263,10 @@ def _analyze_string_try_rules(
             and the list of rules that were tried
     """
     tried_rules: List[lal.GrammarRule] = []
-    for idx, rule in enumerate(rules_to_try):
+    for rule in rules_to_try:
         tried_rules.append(rule)
-        if idx != 0:
-            print(rules_to_try[idx - 1], "failed, retrying with", rule)
         try:
-            unit = _analyze_string(string, rule)
-            print("Succeeded with", rule)
-            return unit, tried_rules
+            return _analyze_string(string, rule), tried_rules
         except ValueError:
             pass
     raise ValueError
@@ -266,13 +1274,38 @@ def _analyze_string_try_rules(
 
 def _analyze_file(filepath: str) -> lal.AnalysisUnit:
     """
-    Creates a tree from ada file
+    Creates a tree from ada file.
+    Files that were parsed before and did not change since are taken from the unit cache.
 
     :param filepath: The the filepath for the file to parse into a tree
     :return: An analysis unit containing the tree
     """
-    context = lal.AnalysisContext()
-    unit = context.get_from_file(filepath)
+    return _analyze_cached_file(filepath).unit
+
+
+def _analyze_cached_file(
+    filepath: str, data: Optional[bytes] = None
+) -> unitcache.CachedUnit:
+    """
+    Same as _analyze_file, but returns the whole unit cache entry,
+    which also holds the contents and the node index of the file.
+
+    :param filepath: The the filepath for the file to parse into a tree
+    :param data: The contents of the file, when they were already read
+    :return: The unit cache entry of the file
+    """
+    entry = unitcache.get_cache().get(filepath, data)
+    _check_file_unit(entry.unit)
+    return entry
+
+
+def _check_file_unit(unit: lal.AnalysisUnit) -> lal.AnalysisUnit:
+    """
+    Checks whether an ada file was parsed without errors
+
+    :param unit: The analysis unit of the parsed file
+    :return: The analysis unit, if it contains no diagnostics
+    """
     if not unit.diagnostics:
         return unit
     for diagnostic in unit.diagnostics:
@@ -0,0 +1,135 @@
+"""
+This module manages the libadalang analysis contexts that are used to parse
+search queries and operands.
+Creating a new lal.AnalysisContext for every parse throws away the symbol tables
+and allocations libadalang built up, so instead every thread (of every process)
+reuses one context until it has parsed a configurable number of units.
+"""
+import os
+import threading
+from typing import Optional, Set
+import libadalang as lal  # type: ignore
+
+DEFAULT_POOL_SIZE = 256
+
+
+class ContextPool:
+    """
+    Hands out analysis contexts to the api layer, one per thread and process.
+
+    Parsing a file that the current context already holds would reparse the
+    existing unit and invalidate every node previously taken from it,
+    so in that case (and once the context has parsed `size` units)
+    the context is retired and a fresh one takes its place.
+    Units keep a reference to their own context, so retiring a context
+    never invalidates units that are still in use.
+
+    :param size: The number of units a context parses before it is replaced
+    """
+
+    size: int
+
+    def __init__(self, size: int = DEFAULT_POOL_SIZE):
+        """Constructor method"""
+        if size < 1:
+            raise ValueError("The pool size must be at least 1")
+        self.size = size
+        self._local = threading.local()
+
+    def parse_buffer(self, buffer: str, rule: str) -> lal.AnalysisUnit:
+        """
+        Parses a text fragment in a pooled context
+
+        :param buffer: The string to parse
+        :param rule: The grammar rule used to parse the string
+        :return: The analysis unit containing the parsed tree
+        """
+        state = self._state()
+        # Every buffer gets a unique name, so parsing a buffer never
+        # replaces a unit that was handed out earlier.
+        filename = "__haystack_buffer_" + str(state.parsed) + "__"
+        state.parsed += 1
+        return state.context.get_from_buffer(filename, buffer, rule=rule)
+
+    def parse_file(
+        self, filepath: str, buffer: Optional[bytes] = None
+    ) -> lal.AnalysisUnit:
+        """
+        Parses a file in a pooled context
+
+        :param filepath: The filepath of the file to parse
+        :param buffer: The contents of the file, when they were already read from disk
+        :return: The analysis unit containing the parsed tree
+        """
+        state = self._state()
+        if filepath in state.filenames:
+            state = self._renew()
+        state.filenames.add(filepath)
+        state.parsed += 1
+        if buffer is not None:
+            return state.context.get_from_buffer(filepath, buffer)
+        return state.context.get_from_file(filepath)
+
+    def reset(self):
+        """
+        Drops the context of the current thread,
+        the next parse will start with a fresh context.
+        """
+        self._local.__dict__.clear()
+
+    def _state(self) -> "_ContextState":
+        """
+        Returns the context state of the current thread,
+        creating a new one when none exists yet, when the process was forked
+        or when the current context has parsed enough units.
+        """
+        state = getattr(self._local, "state", None)
+        if state is None or state.pid != os.getpid() or state.parsed >= self.size:
+            state = self._renew()
+        return state
+
+    def _renew(self) -> "_ContextState":
+        """Replaces the context of the current thread with a fresh one."""
+        state = _ContextState()
+        self._local.state = state
+        return state
+
+
+class _ContextState:
+    """The context of one thread, together with some bookkeeping about its use."""
+
+    context: lal.AnalysisContext
+    pid: int
+    parsed: int
+    filenames: Set[str]
+
+    def __init__(self):
+        """Constructor method"""
+        self.context = lal.AnalysisContext()
+        self.pid = os.getpid()
+        self.parsed = 0
+        self.filenames = set()
+
+
+_POOL = ContextPool()
+
+
+def get_pool() -> ContextPool:
+    """Returns the context pool shared by all api entry points."""
+    return _POOL
+
+
+def set_pool_size(size: int):
+    """
+    Changes the number of units a pooled context parses before it is replaced.
+    Contexts that are currently in use are replaced as well.
+
+    :param size: The new pool size
+    """
+    global _POOL  # pylint: disable=global-statement
+    _POOL = ContextPool(size)
+
+
+def reset():
+    """Drops the pooled context of the current thread."""
+    _POOL.reset()
@@ -7,3 +7,11 @@ class OperandParseException(Exception):
 
 class PatternParseException(Exception):
     """Exception raised when a search pattern could not be parsed to an AST"""
+
+
+class RuleFileException(Exception):
+    """Exception raised when a rule file could not be read or contains an invalid rule"""
+
+
+class ResultFormatException(Exception):
+    """Exception raised when serialised search results could not be read"""
@@ -1,23 +1,108 @@
 """
-This module defines the Location data structure.
+This module defines the Location data structure,
+and the EditDelta that describes how a replacement moves locations.
+Locations and the captures of their wildcards only hold numbers and text,
+not the nodes they were matched at, so keeping a location around does not keep
+the analysis unit it was found in alive. The nodes can be looked up again
+in a unit of the same text when they are needed.
+Positions are converted to and from absolute character offsets through a table of
+the offsets at which the lines of the text start.
 """
-from typing import Dict
+import bisect
+from typing import Dict, List, Optional, Tuple, Union
 import libadalang as lal  # type: ignore
 
 
+class Capture:
+    """
+    The text that a wildcard matched, detached from the parse tree it was matched in.
+    Like a node, it has a text attribute, so it can be used in replacements.
+
+    :param text: The text of the matched node
+    :param start: The offset of the start of the node in the searched text
+    :param end: The offset of the end of the node in the searched text, exclusive
+    :param kind: The kind name of the node, which tells it apart from nodes
+            spanning the same text
+    """
+
+    __slots__ = ("text", "start", "end", "kind")
+
+    text: str
+    start: Optional[int]
+    end: Optional[int]
+    kind: Optional[str]
+
+    def __init__(
+        self,
+        text: str,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        kind: Optional[str] = None,
+    ):
+        """Constructor method"""
+        self.text = text
+        self.start = start
+        self.end = end
+        self.kind = kind
+
+    def __repr__(self) -> str:
+        return "Capture(" + repr(self.text) + ")"
+
+    def node(self, unit: lal.AnalysisUnit) -> Optional[lal.AdaNode]:
+        """
+        Looks up the node that was captured
+
+        :param unit: An analysis unit of the text the capture was found in
+        :return: The captured node, or None if the capture has no offsets
+                or the unit holds no such node
+        """
+        if self.start is None or self.end is None:
+            return None
+        starts = line_starts(unit.text)
+        return find_node(
+            unit.root,
+            to_position(starts, self.start),
+            to_position(starts, self.end),
+            self.kind,
+        )
+
+
+# What a wildcard matched: a capture, a list of captures for a plural wildcard,
+# or None for a plural wildcard that matched nothing
+Wildcard = Union[Capture, List[Capture], None]
+
+
 class Location:
     """
     This class stores data about pattern matches, namely where they start, where they end,
     and if any wildcards were used in the match.
     If wildcards were used, it stores what text matched to the wildcard,
     so that this can later be backreferenced in the replacement.
+    Besides the line and character numbers, the location of a match also holds
+    the absolute offsets of its start and end in the searched text,
+    and the kind name of the matched node.
+    Locations that are made up rather than found may lack these.
     """
 
+    __slots__ = (
+        "start_line",
+        "end_line",
+        "start_char",
+        "end_char",
+        "wildcards",
+        "start",
+        "end",
+        "kind",
+    )
+
     start_line: int
     end_line: int
     start_char: int
     end_char: int
-    wildcards: Dict[str, lal.AdaNode]
+    wildcards: Dict[str, Wildcard]
+    start: Optional[int]
+    end: Optional[int]
+    kind: Optional[str]
 
     def __init__(
         self,
@@ -25,13 +110,20 @@ class Location:
         end_line: int,
         start_char: int,
         end_char: int,
-        wildcards: Dict[str, lal.AdaNode],
+        wildcards: Dict[str, Wildcard],
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        kind: Optional[str] = None,
     ):
+        """Constructor method"""
         self.start_line = start_line
         self.end_line = end_line
         self.start_char = start_char
         self.end_char = end_char
         self.wildcards = wildcards
+        self.start = start
+        self.end = end
+        self.kind = kind
 
     def __repr__(self) -> str:
         return (
@@ -43,3 +135,177 @@ class Location:
             + ":"
             + str(self.end_char)
         )
+
+    def node(self, unit: lal.AnalysisUnit) -> Optional[lal.AdaNode]:
+        """
+        Looks up the node that was matched
+
+        :param unit: An analysis unit of the text the location was found in
+        :return: The matched node, or None if the unit holds no such node
+        """
+        return find_node(
+            unit.root,
+            (self.start_line, self.start_char),
+            (self.end_line, self.end_char),
+            self.kind,
+        )
+
+
+def find_node(
+    root: Optional[lal.AdaNode],
+    start: Tuple[int, int],
+    end: Tuple[int, int],
+    kind: Optional[str] = None,
+) -> Optional[lal.AdaNode]:
+    """
+    Finds the outermost node of a tree that spans exactly the text between two positions.
+    Nested nodes can span the same text, the kind name tells them apart.
+
+    :param root: The root of the tree
+    :param start: The (line, character) position of the start of the text
+    :param end: The (line, character) position of the end of the text, exclusive
+    :param kind: The kind name of the node, defaults to any kind
+    :return: The node, or None if no node spans exactly that text
+    """
+    node = root
+    while node is not None:
+        sloc = node.sloc_range
+        node_start = (sloc.start.line, sloc.start.column)
+        node_end = (sloc.end.line, sloc.end.column)
+        if (node_start, node_end) == (start, end) and kind in (None, node.kind_name):
+            return node
+        if start < node_start or node_end < end:
+            return None
+        # Descend into the child that contains the text, if any
+        node = next(
+            (
+                child
+                for child in node.children
+                if child is not None
+                and (child.sloc_range.start.line, child.sloc_range.start.column)
+                <= start
+                and end <= (child.sloc_range.end.line, child.sloc_range.end.column)
+            ),
+            None,
+        )
+    return None
+
+
+def line_starts(text: str) -> List[int]:
+    """
+    Builds the line-start offset table of a text
+
+    :param text: The text, with its line terminators
+    :return: The offset at which every line starts, the first line starts at 0
+    """
+    starts = [0]
+    position = text.find("\n")
+    while position >= 0:
+        starts.append(position + 1)
+        position = text.find("\n", position + 1)
+    return starts
+
+
+def to_offset(starts: List[int], line: int, char: int) -> int:
+    """
+    Turns a position of a location into an absolute character offset
+
+    :param starts: The line-start offset table of the text
+    :param line: The line number, starting at 1
+    :param char: The character number in the line, starting at 1
+    :return: The offset of the position in the text
+    """
+    return starts[line - 1] + char - 1
+
+
+def to_position(starts: List[int], offset: int) -> Tuple[int, int]:
+    """
+    Turns an absolute character offset into a position of a location
+
+    :param starts: The line-start offset table of the text
+    :param offset: The offset in the text
+    :return: The line and character numbers of the offset, both starting at 1
+    """
+    line = bisect.bisect_right(starts, offset)
+    return line, offset - starts[line - 1] + 1
+
+
+class EditDelta:
+    """
+    Describes how a single replacement moved the text of a file:
+    the text from the start up to the old end was replaced by text
+    running from the start up to the new end.
+    Positions are (line, character) tuples, numbered like those of a Location.
+    """
+
+    start: Tuple[int, int]
+    old_end: Tuple[int, int]
+    new_end: Tuple[int, int]
+
+    def __init__(
+        self, start: Tuple[int, int], old_end: Tuple[int, int], new_end: Tuple[int, int]
+    ):
+        self.start = start
+        self.old_end = old_end
+        self.new_end = new_end
+
+    def __repr__(self) -> str:
+        start, old_end, new_end = [
+            str(line) + ":" + str(char)
+            for line, char in (self.start, self.old_end, self.new_end)
+        ]
+        return "EditDelta(" + start + "-" + old_end + " => " + new_end + ")"
+
+    def shift(self, position: Tuple[int, int]) -> Tuple[int, int]:
+        """
+        Maps a position in the text before the replacement to the text after it.
+        Positions inside the replaced text are mapped to the end of the replacement.
+
+        :param position: The (line, character) position before the replacement
+        :return: The (line, character) position after the replacement
+        """
+        if position <= self.start:
+            return position
+        if position < self.old_end:
+            return self.new_end
+        line, char = position
+        if line == self.old_end[0]:
+            # The rest of the last replaced line now follows the end of the replacement
+            return self.new_end[0], char - self.old_end[1] + self.new_end[1]
+        return line + self.new_end[0] - self.old_end[0], char
+
+    def shift_location(self, location: "Location") -> Optional["Location"]:
+        """
+        Moves a location in the text before the replacement to the text after it
+
+        :param location: The location before the replacement
+        :return: The moved location, or None if the location overlaps the replaced text.
+                The moved location and its captures have no offsets,
+                as those depend on the edited text.
+        """
+        start = (location.start_line, location.start_char)
+        end = (location.end_line, location.end_char)
+        if end <= self.start:
+            return location
+        if start < self.old_end:
+            return None
+        (start_line, start_char), (end_line, end_char) = self.shift(start), self.shift(
+            end
+        )
+        return Location(
+            start_line,
+            end_line,
+            start_char,
+            end_char,
+            {key: _without_offsets(value) for key, value in location.wildcards.items()},
+            kind=location.kind,
+        )
+
+
+def _without_offsets(value: Wildcard) -> Wildcard:
+    """Copies what a wildcard matched, leaving out the offsets of the captures."""
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return [Capture(capture.text, kind=capture.kind) for capture in value]
+    return Capture(value.text, kind=value.kind)
@@ -0,0 +1,321 @@
+"""
+This module searches for many patterns at once, in a single traversal of the operand.
+The patterns are stored in a discrimination net: every pattern is flattened to the
+sequence of symbols met when walking it in pre-order (the kind of its root, the
+number of children of every node and the texts of the leaves), and these sequences
+are merged into a trie. Patterns that start the same way share the path checking
+their common start, so for every node of the operand the net is walked once to find
+the few patterns that can match there, however many patterns there are.
+Only those patterns are then compared to the node, by their own matcher.
+"""
+import heapq
+import weakref
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import libadalang as lal  # type: ignore
+from Haystack import searchresult as sr
+from Haystack.location import Location
+
+# The symbols of the net: the kind of the root of a pattern, the number of children
+# of a node, the text of a leaf, or None for a missing child
+Symbol = Any
+_ANY_KIND = ("kind", None)
+# Marks a wildcard in the sequence of symbols of a pattern
+_SKIP = object()
+
+
+class NetNode:
+    """
+    A node of a discrimination net, reached by a sequence of symbols.
+    """
+
+    edges: Dict[Symbol, "NetNode"]
+    # The node reached by skipping a whole subtree of the operand, for wildcards
+    skip: Optional["NetNode"]
+    # The numbers of the patterns whose sequence of symbols ends in this node
+    patterns: List[int]
+
+    def __init__(self):
+        """Constructor method"""
+        self.edges = {}
+        self.skip = None
+        self.patterns = []
+
+
+class DiscriminationNet:
+    """
+    Index of a set of compiled patterns, used to find the patterns that can match
+    a node without comparing the node to each of them.
+    The net is only a filter: it ignores backreferences and treats every wildcard
+    as matching any subtree, so the patterns it finds still have to be matched.
+
+    :param patterns: The compiled patterns
+    :param case_insensitive: For every pattern, whether it is searched case insensitively
+    """
+
+    patterns: List[sr.PatternNode]
+    case_insensitive: List[bool]
+    root: NetNode
+    # The kinds of the roots of the patterns, None if some pattern can match any kind
+    root_kinds: Optional[List[str]]
+
+    def __init__(
+        self, patterns: Sequence[sr.PatternNode], case_insensitive: Sequence[bool]
+    ):
+        """Constructor method"""
+        self.patterns = list(patterns)
+        self.case_insensitive = list(case_insensitive)
+        self.root = NetNode()
+        kinds = set()
+        any_kind = False
+        for number, pattern in enumerate(self.patterns):
+            if not pattern.children:
+                continue  # a pattern consisting of a single leaf never matches
+            symbols = pattern_symbols(pattern, self.case_insensitive[number])
+            if symbols[0] is _SKIP or symbols[0] == _ANY_KIND:
+                any_kind = True
+            else:
+                kinds.add(symbols[0][1])
+            self._insert(symbols, number)
+        self.root_kinds = None if any_kind else sorted(kinds)
+
+    def _insert(self, symbols: List[Symbol], number: int):
+        """
+        Adds the sequence of symbols of a pattern to the net
+
+        :param symbols: The symbols of the pattern
+        :param number: The number of the pattern
+        """
+        node = self.root
+        for symbol in symbols:
+            if symbol is _SKIP:
+                if node.skip is None:
+                    node.skip = NetNode()
+                node = node.skip
+            else:
+                child = node.edges.get(symbol)
+                if child is None:
+                    child = node.edges[symbol] = NetNode()
+                node = child
+        node.patterns.append(number)
+
+    def size(self) -> int:
+        """Returns the number of nodes of the net."""
+        count = 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            count += 1
+            stack.extend(node.edges.values())
+            if node.skip is not None:
+                stack.append(node.skip)
+        return count
+
+    def iter_search(
+        self,
+        operand: lal.AdaNode,
+        index: Optional[sr.NodeIndex] = None,
+        enabled: Optional[Sequence[bool]] = None,
+        nodes: Optional[Iterable[int]] = None,
+    ) -> Iterator[Tuple[int, Location]]:
+        """
+        Yields the matches of all patterns in an operand, visiting its nodes only once.
+        The matches are yielded in pre-order of the operand, and matches of different
+        patterns at the same node in the order of the patterns. Like a search for a
+        single pattern, the descendants of a match are not searched for the same
+        pattern anymore, but they are still searched for the other patterns.
+
+        :param operand: The tree to be searched
+        :param index: The node index of operand, built on the fly if not supplied
+        :param enabled: For every pattern, whether to search for it at all
+        :param nodes: The numbers of the operand nodes to search at, in pre-order,
+                defaults to all nodes of the kinds of the roots of the patterns
+        :return: An iterator over tuples of the number of a pattern and
+                the location of one of its matches
+        """
+        if operand is None:
+            return
+        if index is None:
+            index = sr.NodeIndex(operand)
+        stream = operand_stream(index)
+        matchers: Dict[int, sr.Matcher] = {}
+        skip_until: Dict[int, int] = {}
+        for candidate in self._candidates(index) if nodes is None else nodes:
+            for number in self.retrieve(stream, candidate):
+                if enabled is not None and not enabled[number]:
+                    continue
+                if candidate < skip_until.get(number, 0):
+                    continue  # the candidate lies inside an earlier match
+                matcher = matchers.get(number)
+                if matcher is None:
+                    matcher = sr.Matcher(
+                        self.patterns[number], index, self.case_insensitive[number]
+                    )
+                    matchers[number] = matcher
+                if matcher.match(candidate):
+                    yield number, index.location(candidate, matcher.wildcards())
+                    skip_until[number] = index.ends[candidate]
+
+    def retrieve(self, stream: "OperandStream", number: int) -> List[int]:
+        """
+        Walks the net along the subtree of an operand node
+
+        :param stream: The symbols of the operand
+        :param number: The number of the operand node in its node index
+        :return: The numbers of the patterns that may match the node, in ascending order
+        """
+        start = stream.positions[number]
+        end = stream.ends[start]
+        found: List[int] = []
+        pending: List[Tuple[NetNode, int]] = []
+        if self.root.skip is not None:
+            found.extend(self.root.skip.patterns)
+        for key in (("kind", stream.index.nodes[number].kind_name), _ANY_KIND):
+            child = self.root.edges.get(key)
+            if child is not None:
+                pending.append((child, start))
+        while pending:
+            node, position = pending.pop()
+            if position == end:
+                found.extend(node.patterns)
+                continue
+            if node.skip is not None:
+                pending.append((node.skip, stream.ends[position]))
+            for symbol in stream.symbols[position]:
+                child = node.edges.get(symbol)
+                if child is not None:
+                    pending.append((child, position + 1))
+        return sorted(set(found))
+
+    def _candidates(self, index: sr.NodeIndex) -> Iterator[int]:
+        """Yields the operand nodes of the kinds of the roots of the patterns, in pre-order."""
+        if self.root_kinds is None:
+            yield from range(len(index.nodes))
+        else:
+            yield from heapq.merge(*[index.candidates(k) for k in self.root_kinds])
+
+
+def pattern_symbols(pattern: sr.PatternNode, case_insensitive: bool) -> List[Symbol]:
+    """
+    Flattens a compiled pattern to the sequence of symbols of the discrimination net.
+    Wildcards, and lists with plural wildcards, whose number of children varies,
+    are represented by a symbol that skips any subtree of the operand.
+
+    :param pattern: The root of the compiled pattern
+    :param case_insensitive: Whether the texts of the leaves are compared case insensitively
+    :return: The symbols of the pattern in pre-order
+    """
+    if pattern.singular or pattern.plural:
+        return [_SKIP]
+    symbols: List[Symbol] = [
+        _ANY_KIND if sr.is_wildcard(pattern.text) else ("kind", pattern.kind_name)
+    ]
+    stack: List[Optional[sr.PatternNode]] = [pattern]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            symbols.append(None)
+        elif (node is not pattern and (node.singular or node.plural)) or (
+            node.is_list and node.plural_count
+        ):
+            symbols.append(_SKIP)
+        elif not node.children:
+            symbols.append(_leaf_symbol(node.text, case_insensitive))
+        else:
+            symbols.append(len(node.children))
+            stack.extend(reversed(node.children))
+    return symbols
+
+
+def _leaf_symbol(text: str, case_insensitive: bool) -> Symbol:
+    """Returns the symbol of a leaf, folded to lower case for case insensitive patterns."""
+    return ("~", text.lower()) if case_insensitive else ("=", text)
+
+
+class OperandStream:
+    """
+    The nodes of an operand in pre-order, including its missing children,
+    with the symbols every node can be matched by in the discrimination net.
+
+    :param index: The node index of the operand
+    """
+
+    index: sr.NodeIndex
+    # The symbols of every position: the number of children of a node,
+    # the text of a leaf (case sensitive and insensitive), or None for a missing child
+    symbols: List[Tuple[Symbol, ...]]
+    # The position following the subtree at every position
+    ends: List[int]
+    # The position of every node, by its number in the node index
+    positions: List[int]
+
+    def __init__(self, index: sr.NodeIndex):
+        """Constructor method"""
+        self.index = index
+        self.symbols = []
+        self.positions = [0] * len(index.nodes)
+        items: List[Optional[int]] = []
+        stack: List[Optional[int]] = [0] if index.nodes else []
+        while stack:
+            number = stack.pop()
+            if number is None:
+                self.symbols.append((None,))
+            else:
+                self.positions[number] = len(items)
+                children = index.children[number]
+                if children:
+                    self.symbols.append((len(children),))
+                else:
+                    text = index.texts[number] or ""
+                    self.symbols.append(
+                        (_leaf_symbol(text, False), _leaf_symbol(text, True))
+                    )
+                stack.extend(reversed(children))
+            items.append(number)
+        # The subtree at a position ends where the subtree of its last child ends
+        self.ends = [0] * len(items)
+        for position in reversed(range(len(items))):
+            end = position + 1
+            number = items[position]
+            if number is not None:
+                for _ in index.children[number]:
+                    end = self.ends[end]
+            self.ends[position] = end
+
+
+_STREAMS: "weakref.WeakKeyDictionary[sr.NodeIndex, OperandStream]"
+_STREAMS = weakref.WeakKeyDictionary()
+
+
+def operand_stream(index: sr.NodeIndex) -> OperandStream:
+    """
+    Returns the operand stream of a node index, building it on first use,
+    so that every pattern set searching the same operand shares it.
+
+    :param index: The node index of the operand
+    :return: The operand stream
+    """
+    stream = _STREAMS.get(index)
+    if stream is None:
+        stream = OperandStream(index)
+        _STREAMS[index] = stream
+    return stream
+
+
+def iter_search_many(
+    patterns: Sequence[sr.PatternNode],
+    operand: lal.AdaNode,
+    case_insensitive: bool,
+    index: Optional[sr.NodeIndex] = None,
+) -> Iterator[Tuple[int, Location]]:
+    """
+    Searches for many patterns in a single traversal of the operand
+
+    :param patterns: The compiled patterns to search for
+    :param operand: The parse tree to search in
+    :param case_insensitive: Whether to enable case insensitive searching
+    :param index: The node index of operand, built on the fly if not supplied
+    :return: An iterator over tuples of the number of a pattern in patterns
+            and the location of one of its matches
+    """
+    net = DiscriminationNet(patterns, [case_insensitive] * len(patterns))
+    return net.iter_search(operand, index)
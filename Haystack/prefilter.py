@@ -0,0 +1,100 @@
+"""
+This module contains the prefilter that is applied to files before they are parsed.
+A match of a pattern has to contain every literal token of the pattern
+(everything that is not a wildcard), so a file that lacks one of these tokens
+can be skipped with a plain substring scan instead of a full parse.
+"""
+from typing import List
+import libadalang as lal  # type: ignore
+from Haystack import searchresult as sr
+
+
+class Prefilter:
+    """
+    Class holding the literal tokens of a pattern, used to reject files that cannot match.
+
+    :param pattern: The parse tree of the pattern
+    :param case_insensitive: Whether the search is case insensitive
+    """
+
+    tokens: List[bytes]
+    case_insensitive: bool
+
+    def __init__(self, pattern: lal.AdaNode, case_insensitive: bool):
+        """Constructor method"""
+        self.case_insensitive = case_insensitive
+        self.tokens = _required_tokens(pattern, case_insensitive)
+
+    def accepts(self, data: bytes) -> bool:
+        """
+        Checks whether the contents of a file contain all literal tokens of the pattern
+
+        :param data: The contents of the file
+        :return: False if the pattern can not match anywhere in data
+        """
+        if not self.tokens:
+            return True
+        if self.case_insensitive:
+            data = data.lower()
+        return all(token in data for token in self.tokens)
+
+    def accepts_file(self, filepath: str) -> bool:
+        """
+        Checks whether a file contains all literal tokens of the pattern
+
+        :param filepath: The filepath of the file to check
+        :return: False if the pattern can not match anywhere in the file
+        """
+        if not self.tokens:
+            return True
+        with open(filepath, "rb") as infile:
+            return self.accepts(infile.read())
+
+
+def required_texts(pattern: lal.AdaNode) -> List[str]:
+    """
+    Collects the texts of all leaves of a pattern that are not wildcards.
+    Every match of the pattern contains a leaf with each of these texts.
+
+    :param pattern: The parse tree of the pattern
+    :return: The texts of the literal leaves of the pattern, in pre-order
+    """
+    texts = []
+    stack = [pattern]
+    while stack:
+        node = stack.pop()
+        if node is None or not node.text:
+            continue
+        if sr.is_wildcard(node.text):
+            continue  # anything below a wildcard can match anything
+        if node.children:
+            stack.extend(reversed(node.children))
+            continue
+        texts.append(node.text)
+    return texts
+
+
+def _required_tokens(pattern: lal.AdaNode, case_insensitive: bool) -> List[bytes]:
+    """
+    Encodes the literal leaf texts of a pattern for a byte level scan.
+    Tokens that are contained in another token add nothing and are left out,
+    and the longest (so most selective) tokens come first.
+
+    :param pattern: The parse tree of the pattern
+    :param case_insensitive: Whether to fold the tokens to lower case
+    :return: The tokens every match of the pattern must contain
+    """
+    texts = set()
+    for text in required_texts(pattern):
+        try:
+            # Files are scanned as bytes, only ascii tokens are safe to compare that way
+            token = text.encode("ascii")
+        except UnicodeEncodeError:
+            continue
+        texts.add(token.lower() if case_insensitive else token)
+    tokens = sorted(texts, key=len, reverse=True)
+    return [
+        token
+        for number, token in enumerate(tokens)
+        if not any(token in longer for longer in tokens[:number])
+    ]
@@ -0,0 +1,323 @@
+"""
+This module maintains a persistent index of the files of a project.
+For every file it records which (lower case) leaf texts and which node kinds
+occur in it, and on which lines, in an SQLite database, by default in the
+.haystack directory of the project. user_database places it outside the project
+tree instead, so the project directory is left untouched.
+A match of a pattern has to contain all literal leaf texts of the pattern
+and a node of the kind of its root, so the index can tell which files
+are worth searching without opening any of them.
+The index is brought up to date incrementally: only files whose size,
+modification time and contents changed since they were indexed are parsed again.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import libadalang as lal  # type: ignore
+from Haystack import contextpool
+from Haystack import prefilter
+from Haystack import searchresult as sr
+
+INDEX_DIRECTORY = ".haystack"
+INDEX_FILENAME = "index.sqlite"
+INDEX_VERSION = 1
+# The directory of the index databases of user_database, in the home directory
+USER_INDEX_DIRECTORY = os.path.join(INDEX_DIRECTORY, "indexes")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    parsed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS texts (
+    text TEXT NOT NULL,
+    file_id INTEGER NOT NULL,
+    first_line INTEGER NOT NULL,
+    last_line INTEGER NOT NULL,
+    occurrences INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS kinds (
+    kind TEXT NOT NULL,
+    file_id INTEGER NOT NULL,
+    first_line INTEGER NOT NULL,
+    last_line INTEGER NOT NULL,
+    occurrences INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS texts_text ON texts (text);
+CREATE INDEX IF NOT EXISTS texts_file ON texts (file_id);
+CREATE INDEX IF NOT EXISTS kinds_kind ON kinds (kind);
+CREATE INDEX IF NOT EXISTS kinds_file ON kinds (file_id);
+"""
+
+# Maps a text or kind to its first line, last line and number of occurrences in a file
+_Occurrences = Dict[str, List[int]]
+
+
+class ProjectIndex:
+    """
+    The persistent index of the files in a project directory.
+
+    :param root: The root directory of the project
+    :param database: The filepath of the index database,
+                    defaults to .haystack/index.sqlite in the root directory
+    """
+
+    root: str
+    database: str
+
+    def __init__(self, root: str, database: Optional[str] = None):
+        """Constructor method"""
+        self.root = os.path.abspath(root)
+        if database is None:
+            directory = os.path.join(self.root, INDEX_DIRECTORY)
+            os.makedirs(directory, exist_ok=True)
+            database = os.path.join(directory, INDEX_FILENAME)
+        self.database = database
+        self._connection = sqlite3.connect(database)
+        version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != INDEX_VERSION:
+            # An index written by another version of Haystack is rebuilt from scratch
+            self._connection.executescript(
+                "DROP TABLE IF EXISTS files;"
+                "DROP TABLE IF EXISTS texts;"
+                "DROP TABLE IF EXISTS kinds;"
+            )
+            self._connection.execute("PRAGMA user_version = " + str(INDEX_VERSION))
+        self._connection.executescript(_SCHEMA)
+
+    def update(self, filepaths: Iterable[str]) -> int:
+        """
+        Brings the index up to date for the given files,
+        parsing only the files that changed since they were last indexed.
+
+        :param filepaths: The filepaths of the files to index
+        :return: The number of files that were (re)indexed
+        """
+        indexed = 0
+        with self._connection:
+            for filepath in filepaths:
+                if self._update_file(os.path.abspath(filepath)):
+                    indexed += 1
+        return indexed
+
+    def remove(self, filepath: str):
+        """
+        Removes a file from the index
+
+        :param filepath: The filepath of the file to remove
+        """
+        with self._connection:
+            row = self._connection.execute(
+                "SELECT id FROM files WHERE path = ?", (os.path.abspath(filepath),)
+            ).fetchone()
+            if row is not None:
+                self._delete_file(row[0])
+
+    def candidates(self, pattern: lal.AdaNode, filepaths: Iterable[str]) -> List[str]:
+        """
+        Selects the files that may contain a match of pattern,
+        after bringing the index up to date for them.
+        Files that could not be parsed are always selected,
+        so that searching them reports the error as before.
+
+        :param pattern: The parse tree of the pattern
+        :param filepaths: The filepaths of the files to choose from
+        :return: The filepaths that may match, in the order of filepaths
+        """
+        filepaths = list(filepaths)
+        self.update(filepaths)
+        texts = {text.lower() for text in prefilter.required_texts(pattern)}
+        kind = None if sr.is_wildcard(pattern.text) else pattern.kind_name
+
+        selected: Optional[Set[int]] = None
+        # Start with the rarest text or kind, so the intersections stay small
+        for table, column, value in sorted(
+            [("texts", "text", text) for text in texts]
+            + ([("kinds", "kind", kind)] if kind is not None else []),
+            key=lambda entry: self._count(entry[0], entry[1], entry[2]),
+        ):
+            file_ids = self._file_ids(table, column, value)
+            selected = file_ids if selected is None else selected & file_ids
+            if not selected:
+                break
+
+        result = []
+        for filepath in filepaths:
+            row = self._connection.execute(
+                "SELECT id, parsed FROM files WHERE path = ?",
+                (os.path.abspath(filepath),),
+            ).fetchone()
+            if row is None or not row[1] or selected is None or row[0] in selected:
+                result.append(filepath)
+        return result
+
+    def occurrences(self, text: str) -> List[Tuple[str, int, int]]:
+        """
+        Looks up where a leaf text occurs in the indexed files
+
+        :param text: The text to look up, compared case insensitively
+        :return: A list of tuples with a filepath and the first and last line
+                the text occurs on in that file
+        """
+        return self._connection.execute(
+            "SELECT files.path, texts.first_line, texts.last_line "
+            "FROM texts JOIN files ON files.id = texts.file_id "
+            "WHERE texts.text = ? ORDER BY files.path",
+            (text.lower(),),
+        ).fetchall()
+
+    def close(self):
+        """Closes the index database."""
+        self._connection.close()
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def _update_file(self, filepath: str) -> bool:
+        """
+        Indexes a single file, unless it did not change since it was last indexed
+
+        :param filepath: The absolute filepath of the file to index
+        :return: True if the file was (re)indexed
+        """
+        row = self._connection.execute(
+            "SELECT id, size, mtime_ns, digest FROM files WHERE path = ?", (filepath,)
+        ).fetchone()
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            if row is not None:
+                self._delete_file(row[0])
+            return False
+        if row is not None and (row[1], row[2]) == (stat.st_size, stat.st_mtime_ns):
+            return False
+
+        with open(filepath, "rb") as infile:
+            data = infile.read()
+        digest = hashlib.sha1(data).hexdigest()
+        if row is not None and row[3] == digest:
+            # The file was touched, but its contents are the same
+            self._connection.execute(
+                "UPDATE files SET size = ?, mtime_ns = ? WHERE id = ?",
+                (stat.st_size, stat.st_mtime_ns, row[0]),
+            )
+            return False
+
+        if row is not None:
+            self._delete_file(row[0])
+        unit = contextpool.get_pool().parse_file(filepath, data)
+        parsed = not unit.diagnostics
+        file_id = self._connection.execute(
+            "INSERT INTO files (path, size, mtime_ns, digest, parsed) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (filepath, stat.st_size, stat.st_mtime_ns, digest, int(parsed)),
+        ).lastrowid
+        if parsed:
+            texts, kinds = _collect(unit.root)
+            self._connection.executemany(
+                "INSERT INTO texts VALUES (?, ?, ?, ?, ?)",
+                [(text, file_id, *lines) for text, lines in texts.items()],
+            )
+            self._connection.executemany(
+                "INSERT INTO kinds VALUES (?, ?, ?, ?, ?)",
+                [(kind, file_id, *lines) for kind, lines in kinds.items()],
+            )
+        return True
+
+    def _delete_file(self, file_id: int):
+        """Removes everything that was recorded about a file."""
+        self._connection.execute("DELETE FROM texts WHERE file_id = ?", (file_id,))
+        self._connection.execute("DELETE FROM kinds WHERE file_id = ?", (file_id,))
+        self._connection.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    def _count(self, table: str, column: str, value: str) -> int:
+        """Counts the files in which a text or kind occurs."""
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM " + table + " WHERE " + column + " = ?", (value,)
+        ).fetchone()[0]
+
+    def _file_ids(self, table: str, column: str, value: str) -> Set[int]:
+        """Returns the ids of the files in which a text or kind occurs."""
+        return {
+            row[0]
+            for row in self._connection.execute(
+                "SELECT file_id FROM " + table + " WHERE " + column + " = ?", (value,)
+            )
+        }
+
+
+def _collect(root: lal.AdaNode) -> Tuple[_Occurrences, _Occurrences]:
+    """
+    Collects the lower case leaf texts and the node kinds of a parse tree,
+    with the first and last line they occur on and their number of occurrences.
+
+    :param root: The root of the parse tree
+    :return: A tuple with the occurrences of the leaf texts and of the node kinds
+    """
+    texts: _Occurrences = {}
+    kinds: _Occurrences = {}
+    index = sr.NodeIndex(root)
+    for node, text in zip(index.nodes, index.texts):
+        line = node.sloc_range.start.line
+        _record(kinds, node.kind_name, line)
+        if text:
+            _record(texts, text.lower(), line)
+    return texts, kinds
+
+
+def _record(occurrences: _Occurrences, key: str, line: int):
+    """Adds a single occurrence of key on line to occurrences."""
+    entry = occurrences.get(key)
+    if entry is None:
+        occurrences[key] = [line, line, 1]
+    else:
+        entry[0] = min(entry[0], line)
+        entry[1] = max(entry[1], line)
+        entry[2] += 1
+
+
+_INDEXES: Dict[Tuple[int, int, str], ProjectIndex] = {}
+
+
+def get_index(root: str, database: Optional[str] = None) -> ProjectIndex:
+    """
+    Returns the index of the project in directory root.
+    SQLite connections may not be shared between threads,
+    so the index is opened once per thread and process.
+
+    :param root: The root directory of the project
+    :param database: The filepath of the index database,
+                    defaults to .haystack/index.sqlite in the root directory
+    :return: The index of the project
+    """
+    key = (os.getpid(), threading.get_ident(), os.path.abspath(root))
+    index = _INDEXES.get(key)
+    if index is None or (database is not None and index.database != database):
+        if index is not None:
+            index.close()
+        index = ProjectIndex(root, database)
+        _INDEXES[key] = index
+    return index
+
+
+def user_database(root: str, directory: Optional[str] = None) -> str:
+    """
+    Returns a filepath for the index database of a project outside the project tree,
+    named after a hash of the root directory so every project has its own
+
+    :param root: The root directory of the project
+    :param directory: The directory of the database,
+                    defaults to .haystack/indexes in the home directory
+    :return: The filepath of the index database, whose directory exists
+    """
+    if directory is None:
+        directory = os.path.join(os.path.expanduser("~"), USER_INDEX_DIRECTORY)
+    os.makedirs(directory, exist_ok=True)
+    name = hashlib.sha1(os.path.abspath(root).encode("UTF-8")).hexdigest()
+    return os.path.join(directory, name + ".sqlite")
@@ -2,9 +2,28 @@
 This module is responsible for performing the replace operations.
 The two functions called from outside this class are replace_file and replace_string,
 depending on what type of input the replacecement is performed.
+Locations are turned into absolute character offsets through a table of the offsets
+at which the lines start, and the output is assembled from the untouched slices of the
+input and the replacements in a single pass, so replacing takes time linear in the
+size of the input plus the number of replacements.
+Files are never overwritten in place: the output is written to a temporary file in
+the same directory, which then atomically takes the place of the output file, so an
+error halfway leaves the original untouched. In streaming mode, the input is memory
+mapped and the untouched byte ranges are copied to the output directly,
+so memory use is bounded by the largest replacement rather than the file size.
 """
-from typing import List, Tuple
-from Haystack.location import Location
+import mmap
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from Haystack.location import EditDelta, Location, line_starts, to_offset
+
+# The number of bytes copied at once from the input to the output in streaming mode
+COPY_BLOCK_SIZE = 1024 * 1024
+# The number of unchanged lines shown around every change in a diff
+DEFAULT_CONTEXT = 3
 
 
 def replace_file(
@@ -13,22 +32,179 @@ def replace_file(
     replacement: str,
     indexes: List[int] = None,
     output: str = None,
-):
+    lines: List[str] = None,
+    streaming: bool = False,
+) -> List[EditDelta]:
     """
     Replaces the contents of a file.
     Only sections specified by the list of locations are overwritten
     and replaced by the replacement parameter.
+    The output file is replaced atomically, it is never left half written.
 
     :param filepath: Path of the file that contains the search result
     :param locations: List of locations of the search results
     :param replacement: String that the search match is to be replaced with
     :param indexes: Indexes corresponding to the slocs list elements that are to be replaced
     :param output: Name of the file to which the modified code will be outputted
+    :param lines: The contents of the file as a list of lines, if they were already loaded
+    :param streaming: Memory map the file and copy its untouched bytes to the output,
+            instead of loading it as text. Line terminators are kept as they are.
+    :return: The edit deltas of the replacements, in the order of the file
     """
-    lines = _load_file(filepath)
-    output_str = _replace(lines, locations, replacement, indexes)
     output = filepath if output is None else output
-    _write_file(output, output_str)
+    staged = stage_file(
+        filepath, locations, replacement, indexes, output, lines, streaming
+    )
+    commit_file(staged, output)
+    return edit_deltas(locations, replacement, indexes)
+
+
+def stage_file(
+    filepath: str,
+    locations: List[Location],
+    replacement: str,
+    indexes: Optional[List[int]] = None,
+    output: Optional[str] = None,
+    lines: Optional[List[str]] = None,
+    streaming: bool = False,
+) -> str:
+    """
+    Writes the result of replacing in a file to a temporary file
+    in the directory of the output, with the permissions of the input.
+    The temporary file takes the place of the output when it is committed.
+
+    :param filepath: Path of the file that contains the search result
+    :param locations: List of locations of the search results
+    :param replacement: String that the search match is to be replaced with
+    :param indexes: Indexes corresponding to the slocs list elements that are to be replaced
+    :param output: Name of the file to which the modified code will be outputted
+    :param lines: The contents of the file as a list of lines, if they were already loaded
+    :param streaming: Memory map the file instead of loading it as text
+    :return: The path of the temporary file
+    """
+    output = filepath if output is None else output
+    handle, staged = tempfile.mkstemp(
+        prefix="." + os.path.basename(output) + ".",
+        suffix=".tmp",
+        dir=os.path.dirname(os.path.abspath(output)),
+    )
+    try:
+        shutil.copymode(filepath, staged)
+        if streaming:
+            with os.fdopen(handle, "wb") as binary_file:
+                _splice_mapped(filepath, locations, replacement, indexes, binary_file)
+        else:
+            if lines is None:
+                lines = _load_file(filepath)
+            with os.fdopen(handle, "w", encoding="UTF-8") as text_file:
+                # The chunks are written as they are produced, the output is never held whole
+                text_file.writelines(
+                    _splice("".join(lines), locations, replacement, indexes)
+                )
+    except BaseException:
+        os.remove(staged)
+        raise
+    return staged
+
+
+def commit_file(staged: str, output: str):
+    """
+    Atomically moves a staged file over the output file
+
+    :param staged: The path of the temporary file written by stage_file
+    :param output: Name of the file to which the modified code will be outputted
+    """
+    os.replace(staged, output)
+
+
+def replace_files(
+    files: Dict[str, List[Location]],
+    replacement: str,
+    workers: Optional[int] = None,
+    streaming: bool = False,
+    validate: Optional[Callable[[str, str], None]] = None,
+) -> Dict[str, List[EditDelta]]:
+    """
+    Replaces the contents of many files, all or nothing.
+    The outputs of all files are first staged to temporary files on a pool of threads,
+    and then validated one by one in the calling thread, as validation may parse with
+    libadalang, whose analysis contexts are not known to be safe to use concurrently.
+    Only when every file was staged and validated, the staged files are moved over
+    the originals one by one. If anything fails, the staged files are removed and the
+    files that were already replaced are restored from a backup, so either all files
+    are replaced or none is.
+
+    :param files: The locations to replace, by the path of the file they are in
+    :param replacement: String that the search matches are to be replaced with
+    :param workers: The number of threads staging files, defaults to the executor default
+    :param streaming: Memory map the files instead of loading them as text
+    :param validate: Called with the path of a file and the path of its staged output,
+            raises an exception to reject the output and cancel the whole replacement
+    :return: The edit deltas of the replacements, by the path of the file
+    """
+    staged: Dict[str, str] = {}
+    error: Optional[BaseException] = None
+    with ThreadPoolExecutor(workers) as executor:
+        futures = {
+            filepath: executor.submit(
+                stage_file, filepath, locations, replacement, streaming=streaming
+            )
+            for filepath, locations in files.items()
+        }
+        for filepath, future in futures.items():
+            if error is not None:
+                future.cancel()
+            try:
+                staged[filepath] = future.result()
+            except BaseException as exception:  # pylint: disable=broad-except
+                # Keep collecting, every file that was staged has to be removed
+                error = error or exception
+    if error is None and validate is not None:
+        try:
+            for filepath, path in staged.items():
+                validate(filepath, path)
+        except BaseException as exception:  # pylint: disable=broad-except
+            error = exception
+    if error is not None:
+        for path in staged.values():
+            os.remove(path)
+        raise error
+
+    committed: List[Tuple[str, str]] = []
+    try:
+        for filepath, path in staged.items():
+            backup = path + ".orig"
+            _backup(filepath, backup)
+            committed.append((filepath, backup))
+            commit_file(path, filepath)
+    except BaseException:
+        # Put back the files that were replaced, and remove what was not committed
+        for filepath, backup in reversed(committed):
+            if os.path.exists(staged[filepath]):
+                os.remove(backup)
+            else:
+                os.replace(backup, filepath)
+        for path in staged.values():
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    for _, backup in committed:
+        os.remove(backup)
+    return {
+        filepath: edit_deltas(locations, replacement)
+        for filepath, locations in files.items()
+    }
+
+
+def _backup(filepath: str, backup: str):
+    """
+    Keeps the original of a file under another name,
+    as a hard link where possible so the file itself is never missing.
+    """
+    try:
+        os.link(filepath, backup)
+    except OSError:
+        shutil.copy2(filepath, backup)
 
 
 def replace_string(
@@ -47,105 +223,404 @@ def replace_string(
     :param replacement: The replacement that will be used to replace the matched locations.
     :param indexes: The indexes of the locations that are to be used for replacement.
     """
-    lines = to_replace.splitlines()
-    output_str = _replace(lines, locations, replacement, indexes)
-    return output_str
+    return _replace(to_replace, locations, replacement, indexes)
+
+
+def diff_file(
+    filepath: str,
+    locations: List[Location],
+    replacement: str,
+    indexes: Optional[List[int]] = None,
+    lines: Optional[List[str]] = None,
+    context: int = DEFAULT_CONTEXT,
+) -> "FilePatch":
+    """
+    Computes the patch that replace_file would apply to a file, without writing it.
+
+    :param filepath: Path of the file that contains the search result
+    :param locations: List of locations of the search results
+    :param replacement: String that the search match is to be replaced with
+    :param indexes: Indexes corresponding to the slocs list elements that are to be replaced
+    :param lines: The contents of the file as a list of lines, if they were already loaded
+    :param context: The number of unchanged lines shown around every change
+    :return: The patch of the file
+    """
+    if lines is None:
+        lines = _load_file(filepath)
+    return FilePatch(filepath, _hunks(lines, locations, replacement, indexes, context))
+
+
+def diff_string(
+    to_replace: str,
+    locations: List[Location],
+    replacement: str,
+    indexes: Optional[List[int]] = None,
+    name: str = "<string>",
+    context: int = DEFAULT_CONTEXT,
+) -> "FilePatch":
+    """
+    Computes the patch that replace_string would apply to a string.
+
+    :param to_replace: The string on which the replacement would be performed.
+    :param locations: The list of locations where the replacement needs to be performed.
+    :param replacement: The replacement that will be used to replace the matched locations.
+    :param indexes: The indexes of the locations that are to be used for replacement.
+    :param name: The name of the string in the headers of the patch
+    :param context: The number of unchanged lines shown around every change
+    :return: The patch of the string
+    """
+    lines = to_replace.splitlines(keepends=True)
+    return FilePatch(name, _hunks(lines, locations, replacement, indexes, context))
+
+
+class Hunk:
+    """
+    A group of nearby changes in a unified diff, with the unchanged lines around them.
+
+    :param old_start: The number of the first line of the hunk in the original
+    :param new_start: The number of the first line of the hunk in the result
+    """
+
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    # The lines of the hunk, each prefixed by " ", "-" or "+"
+    lines: List[str]
+
+    def __init__(self, old_start: int, new_start: int):
+        """Constructor method"""
+        self.old_start = old_start
+        self.old_count = 0
+        self.new_start = new_start
+        self.new_count = 0
+        self.lines = []
+
+    def add(self, prefix: str, lines: List[str]):
+        """
+        Adds lines to the hunk
+
+        :param prefix: " " for unchanged lines, "-" for removed lines, "+" for added lines
+        :param lines: The lines, with their line terminators
+        """
+        for line in lines:
+            if not line.endswith("\n"):
+                line += "\n\\ No newline at end of file\n"
+            self.lines.append(prefix + line)
+        if prefix != "+":
+            self.old_count += len(lines)
+        if prefix != "-":
+            self.new_count += len(lines)
+
+    def __str__(self) -> str:
+        return (
+            "@@ -"
+            + _diff_range(self.old_start, self.old_count)
+            + " +"
+            + _diff_range(self.new_start, self.new_count)
+            + " @@\n"
+            + "".join(self.lines)
+        )
+
+
+class FilePatch:
+    """
+    The changes a replacement makes to one file, printed as a unified diff.
+
+    :param filepath: Path of the file
+    :param hunks: The hunks of the diff, in the order of the file
+    """
+
+    filepath: str
+    hunks: List[Hunk]
+
+    def __init__(self, filepath: str, hunks: List[Hunk]):
+        """Constructor method"""
+        self.filepath = filepath
+        self.hunks = hunks
+
+    def __bool__(self) -> bool:
+        return bool(self.hunks)
+
+    def __str__(self) -> str:
+        if not self.hunks:
+            return ""
+        return (
+            "--- "
+            + self.filepath
+            + "\n+++ "
+            + self.filepath
+            + "\n"
+            + "".join(str(hunk) for hunk in self.hunks)
+        )
+
+
+def expand_replacement(location: Location, replacement: str) -> str:
+    """
+    Fills in the wildcards of a replacement with the text they matched at a location.
+
+    :param location: The location of the match
+    :param replacement: The replacement, possibly containing wildcards
+    :return: The text replacing the match
+    """
+    return _wildcard_replace([location], replacement, 0)
+
+
+def edit_deltas(
+    locations: List[Location], replacement: str, indexes: Optional[List[int]] = None
+) -> List[EditDelta]:
+    """
+    Computes how replacing the locations moves the rest of the text.
+    Every delta is expressed in positions of the text before any replacement,
+    so they are applied to other locations from the last to the first.
+
+    :param locations: The list of locations where the replacement is performed.
+    :param replacement: The replacement that is used to replace the matched locations.
+    :param indexes: The indexes of the locations that are to be used for replacement.
+    :return: The edit deltas of the replacements, in the order of the text
+    """
+    deltas: List[EditDelta] = []
+    for j in _ordered(locations, indexes):
+        location = locations[j]
+        text = _wildcard_replace(locations, replacement, j)
+        newlines = text.count("\n")
+        if newlines:
+            new_end = (location.start_line + newlines, len(text) - text.rfind("\n"))
+        else:
+            new_end = (location.start_line, location.start_char + len(text))
+        deltas.append(
+            EditDelta(
+                (location.start_line, location.start_char),
+                (location.end_line, location.end_char),
+                new_end,
+            )
+        )
+    return deltas
 
 
 def _replace(
-    lines: List[str],
+    text: str,
     locations: List[Location],
     replacement: str,
     indexes: List[int] = None,
 ) -> str:
     """
-    Takes lines, splits them into parts according to the replacement locations,
-    generates replacements (whenever wildcards are involved), and stitches the result back together.
+    Generates the replacements (whenever wildcards are involved)
+    and stitches them together with the unaltered parts of the text.
 
-    :param lines: The list of individual lines on which the replacement is performed.
+    :param text: The text on which the replacement is performed.
     :param locations: The list of locations where the replacement needs to be performed.
     :param replacement: The replacement that will be used to replace the matched locations.
     :param indexes: The indexes of the locations that are to be used for replacement.
     """
-    indexes_gen: List[int] = list(range(len(locations))) if indexes is None else indexes
-    if not indexes_gen:
-        return "\n".join(lines)
-
-    parts, new_replacement = _split_input(lines, locations, replacement, indexes_gen)
-
-    # After splitting the input into parts, we stitch it back together with the
-    # replacement in between the unaltered parts.
-    output_str = ""
-    for idx, part in enumerate(parts):
-        for line in part:
-            output_str += line
-        if idx == len(parts) - 1:
-            # If we just added the last part, break the loop
-            break
-        if new_replacement:
-            # If the replacement had a wildcard, add the replacement with whatever the wildard matched.
-            output_str += new_replacement[idx]
-        else:
-            # Else, add the original replacement.
-            output_str += replacement
-    return output_str
+    return "".join(_splice(text, locations, replacement, indexes))
 
 
-def _split_input(
-    lines: List[str], locations: List[Location], replacement: str, indexes: List[int]
-) -> Tuple[List[List[str]], List[str]]:
+def _splice(
+    text: str,
+    locations: List[Location],
+    replacement: str,
+    indexes: Optional[List[int]] = None,
+) -> Iterator[str]:
     """
-    Splits the lines into parts according to the locations and generates wildcard
-    replacements whenever needed.
-    The "parts" added to the list are exactly those parts that stay unedited,
-    the pieces of the string that need to be replaced are left out.
+    Yields the output of a replacement chunk by chunk: every untouched slice of the
+    text is followed by the replacement of the location that follows it.
 
-    :param lines: The list of individual lines on which the replacement is performed.
+    :param text: The text on which the replacement is performed.
     :param locations: The list of locations where the replacement needs to be performed.
     :param replacement: The replacement that will be used to replace the matched locations.
     :param indexes: The indexes of the locations that are to be used for replacement.
+    :return: An iterator over the chunks of the output
+    """
+    starts = line_starts(text)
+    position = 0
+    for j in _ordered(locations, indexes):
+        location = locations[j]
+        start = to_offset(starts, location.start_line, location.start_char)
+        yield text[position:start]
+        yield _wildcard_replace(locations, replacement, j)
+        position = to_offset(starts, location.end_line, location.end_char)
+    yield text[position:]
+
+
+def _hunks(
+    lines: List[str],
+    locations: List[Location],
+    replacement: str,
+    indexes: Optional[List[int]],
+    context: int,
+) -> List[Hunk]:
+    """
+    Builds the hunks of a unified diff straight from the locations to replace,
+    so only the changed lines and their context are looked at.
+
+    :param lines: The lines of the original, with their line terminators
+    :param locations: The list of locations where the replacement needs to be performed.
+    :param replacement: The replacement that will be used to replace the matched locations.
+    :param indexes: The indexes of the locations that are to be used for replacement.
+    :param context: The number of unchanged lines shown around every change
+    :return: The hunks, in the order of the lines
+    """
+    # Every change replaces some lines by others: (first line, old lines, new lines)
+    changes: List[Tuple[int, List[str], List[str]]] = []
+    for first, last, members in _line_blocks(locations, indexes):
+        old = lines[first - 1 : last]
+        moved = [
+            Location(
+                location.start_line - first + 1,
+                location.end_line - first + 1,
+                location.start_char,
+                location.end_char,
+                location.wildcards,
+            )
+            for location in (locations[j] for j in members)
+        ]
+        new = _replace("".join(old), moved, replacement).splitlines(keepends=True)
+        # Lines that did not change are context, not part of the change
+        while old and new and old[0] == new[0]:
+            old, new, first = old[1:], new[1:], first + 1
+        while old and new and old[-1] == new[-1]:
+            old, new = old[:-1], new[:-1]
+        if old or new:
+            changes.append((first, old, new))
+
+    hunks: List[Hunk] = []
+    shift = 0  # the number of lines added before the current change
+    end = 0  # the line following the previous change
+    for first, old, new in changes:
+        if not hunks or first - end > 2 * context:
+            if hunks:
+                hunks[-1].add(" ", lines[end - 1 : end - 1 + context])
+            start = max(1, first - context)
+            hunks.append(Hunk(start, start + shift))
+            hunks[-1].add(" ", lines[start - 1 : first - 1])
+        else:
+            hunks[-1].add(" ", lines[end - 1 : first - 1])
+        hunks[-1].add("-", old)
+        hunks[-1].add("+", new)
+        shift += len(new) - len(old)
+        end = first + len(old)
+    if hunks:
+        hunks[-1].add(" ", lines[end - 1 : end - 1 + context])
+    return hunks
+
+
+def _line_blocks(
+    locations: List[Location], indexes: Optional[List[int]]
+) -> List[Tuple[int, int, List[int]]]:
+    """
+    Groups the locations to replace into blocks of lines that no other location touches
+
+    :param locations: The list of locations where the replacement needs to be performed.
+    :param indexes: The indexes of the locations that are to be used for replacement.
+    :return: The first and last line of every block, with the indexes of its locations
     """
-    parts: List[List[str]] = []
-    new_replacement: List[str] = []
-    for i, j in enumerate(indexes):
-        new_replacement.append(_wildcard_replace(locations, replacement, j))
-        start_line = locations[j].start_line
-        end_line = locations[j].end_line
-        start_char = locations[j].start_char
-        end_char = locations[j].end_char
-        if i == 0:
-            # Add all characters until the first to-be-edited part.
-            parts.append(lines[: start_line - 1])
-            parts[-1].append(lines[start_line - 1][: start_char - 1])
+    blocks: List[Tuple[int, int, List[int]]] = []
+    for j in _ordered(locations, indexes):
+        location = locations[j]
+        if blocks and location.start_line <= blocks[-1][1]:
+            first, last, members = blocks[-1]
+            members.append(j)
+            blocks[-1] = (first, max(last, location.end_line), members)
         else:
-            previous_end_line = locations[indexes[i - 1]].end_line
-            previous_end_char = locations[indexes[i - 1]].end_char
-            if previous_end_line == start_line:
-                # If the current replacement happens on the same line as the last replacement,
-                # we need to add the unmodified string between the last character of the previous
-                # modification until the first character of the current modification.
-                parts.append(
-                    [
-                        lines[previous_end_line - 1][
-                            previous_end_char - 1 : start_char - 1
-                        ]
-                    ]
+            blocks.append((location.start_line, location.end_line, [j]))
+    return blocks
+
+
+def _diff_range(start: int, count: int) -> str:
+    """Formats the line range of a hunk header the way diff does."""
+    if count == 1:
+        return str(start)
+    if count == 0:
+        return str(start - 1) + ",0"
+    return str(start) + "," + str(count)
+
+
+def _splice_mapped(
+    filepath: str,
+    locations: List[Location],
+    replacement: str,
+    indexes: Optional[List[int]],
+    outfile: IO[bytes],
+):
+    """
+    Writes the output of a replacement in a memory mapped file: the untouched
+    byte ranges of the file are copied in blocks, the replacements in between.
+
+    :param filepath: Path of the file that contains the search result
+    :param locations: The list of locations where the replacement needs to be performed.
+    :param replacement: The replacement that will be used to replace the matched locations.
+    :param indexes: The indexes of the locations that are to be used for replacement.
+    :param outfile: The binary file to write the output to
+    """
+    with open(filepath, "rb") as infile:
+        if os.fstat(infile.fileno()).st_size == 0:
+            return  # an empty file cannot be mapped, and holds no matches
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            cursor = _ByteCursor(data)
+            position = 0
+            for j in _ordered(locations, indexes):
+                location = locations[j]
+                start = cursor.offset(location.start_line, location.start_char)
+                _copy(data, position, start, outfile)
+                outfile.write(
+                    _wildcard_replace(locations, replacement, j).encode("UTF-8")
                 )
-            else:
-                # Else, we simply add the rest of the previous line.
-                parts.append([lines[previous_end_line - 1][previous_end_char - 1 :]])
-            # Add the lines in between the last to-be-edited line and the current to-be-edited line.
-            parts[-1].extend(lines[previous_end_line : start_line - 1])
-            if previous_end_line != start_line:
-                # If we are not replacing on the same line as the previous replacement,
-                # we still need to add the characters of the current line before
-                # the specified replacement.
-                parts[-1].append(lines[start_line - 1][: start_char - 1])
-        if i == len(indexes) - 1:
-            # Finally, add all lines and characters after the last edit.
-            parts.append([lines[end_line - 1][end_char - 1 :]])
-            parts[-1].extend(lines[end_line:])
-    return parts, new_replacement
+                position = cursor.offset(location.end_line, location.end_char)
+            _copy(data, position, len(data), outfile)
+
+
+class _ByteCursor:
+    """
+    Turns positions of locations into byte offsets in a UTF-8 encoded buffer,
+    for positions visited in the order of the buffer. Only the line of a position
+    is decoded, so no table of all lines has to be kept.
+
+    :param data: The buffer
+    """
+
+    data: Union[bytes, mmap.mmap]
+    # The current line number, and the byte offset at which it starts
+    line: int
+    start: int
+
+    def __init__(self, data: Union[bytes, mmap.mmap]):
+        """Constructor method"""
+        self.data = data
+        self.line = 1
+        self.start = 0
+
+    def offset(self, line: int, char: int) -> int:
+        """
+        Returns the byte offset of a position, at or after the previous position
+
+        :param line: The line number, starting at 1
+        :param char: The character number in the line, starting at 1
+        :return: The byte offset of the position
+        """
+        while self.line < line:
+            self.start = self.data.find(b"\n", self.start) + 1
+            self.line += 1
+        end = self.data.find(b"\n", self.start)
+        end = len(self.data) if end < 0 else end
+        # A character takes at most 4 bytes, undecodable bytes count as one character
+        prefix = self.data[self.start : min(end, self.start + 4 * (char - 1))]
+        text = prefix.decode("UTF-8", errors="surrogateescape")[: char - 1]
+        return self.start + len(text.encode("UTF-8", errors="surrogateescape"))
+
+
+def _copy(data: Union[bytes, mmap.mmap], start: int, end: int, outfile: IO[bytes]):
+    """Copies a byte range of data to outfile, one block at a time."""
+    for block in range(start, end, COPY_BLOCK_SIZE):
+        outfile.write(data[block : min(end, block + COPY_BLOCK_SIZE)])
+
+
+def _ordered(locations: List[Location], indexes: Optional[List[int]]) -> List[int]:
+    """Returns the indexes of the locations to replace, in the order of the text."""
+    indexes = list(range(len(locations))) if indexes is None else indexes
+    return sorted(
+        indexes, key=lambda j: (locations[j].start_line, locations[j].start_char)
+    )
 
 
 def _wildcard_replace(locations: List[Location], replacement: str, index: int) -> str:
@@ -155,13 +630,12 @@ def _wildcard_replace(locations: List[Location], replacement: str, index: int) -
     result = replacement
     for key, value in locations[index].wildcards.items():
         if key in replacement:
-            try:
+            if value is None:
+                result = result.replace(key, "")
+            elif isinstance(value, list):
+                result = result.replace(key, " ".join([i.text for i in value]))
+            else:
                 result = result.replace(key, value.text)
-            except AttributeError:
-                if value is None:
-                    result = result.replace(key, "")
-                else:
-                    result = result.replace(key, " ".join([i.text for i in value]))
     return result
 
 
@@ -173,11 +647,3 @@ def _load_file(filepath: str) -> List[str]:
     with open(filepath, "r", encoding="UTF-8") as infile:
         lines = infile.readlines()
     return lines
-
-
-def _write_file(filepath: str, lines: str):
-    """
-    Writes the contents of a string to a file, overwriting its original contents
-    """
-    with open(filepath, "w", encoding="UTF-8") as outfile:
-        outfile.write(lines)
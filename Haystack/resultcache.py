@@ -0,0 +1,218 @@
+"""
+This module maintains a persistent cache of search results, so searching sources
+that did not change since an earlier search does not parse and match them again.
+The results are stored in an SQLite database in the .haystack directory of a project,
+keyed by the search query and a hash of the contents of the searched file.
+A query is identified by its compiled pattern tree, parse rule and case flag rather
+than its text, so queries that only differ in layout share their results.
+As the key holds the contents of a file rather than its path, files with identical
+contents, such as vendored copies, are matched only once.
+The locations are stored in the packed binary form of the serialization module.
+When the cache outgrows its budget, the least recently used results are evicted.
+"""
+import hashlib
+import os
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+import libadalang as lal  # type: ignore
+from Haystack import exceptions
+from Haystack import serialization
+from Haystack import searchresult as sr
+from Haystack.location import Location
+from Haystack.projectindex import INDEX_DIRECTORY
+
+CACHE_FILENAME = "results.sqlite"
+# Bumped whenever a change to Haystack changes the results of a search
+# or the way they are stored, which discards all cached results
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    query TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    data BLOB,
+    size INTEGER NOT NULL,
+    used INTEGER NOT NULL,
+    PRIMARY KEY (query, digest)
+);
+CREATE INDEX IF NOT EXISTS results_used ON results (used);
+"""
+
+
+def query_key(
+    pattern: sr.PatternNode, parse_rule: lal.GrammarRule, case_insensitive: bool
+) -> str:
+    """
+    Identifies a search query by what determines its matches:
+    the kinds and leaf texts of its compiled pattern tree, its parse rule and case flag
+
+    :param pattern: The compiled pattern tree of the query
+    :param parse_rule: The parse rule used to parse the query
+    :param case_insensitive: Whether the query is case insensitive
+    :return: A hash of the query
+    """
+    parts = [str(parse_rule), str(case_insensitive)]
+    stack: List[Optional[sr.PatternNode]] = [pattern]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            parts.append("-")
+        elif node.children:
+            parts.append(node.kind_name + "/" + str(len(node.children)))
+            stack.extend(reversed(node.children))
+        else:
+            parts.append(node.kind_name + ":" + node.text)
+    return hashlib.sha1("\0".join(parts).encode("UTF-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    The persistent cache of the search results in a project directory.
+    Results that are stored are written right away, the use of results that are
+    looked up is recorded when the next result is stored or the cache is flushed.
+
+    :param root: The root directory of the project
+    :param database: The filepath of the cache database,
+                    defaults to .haystack/results.sqlite in the root directory
+    :param max_bytes: The maximum total size of the cached results
+    """
+
+    root: str
+    database: str
+    max_bytes: int
+    hits: int
+    misses: int
+
+    def __init__(
+        self,
+        root: str,
+        database: Optional[str] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        """Constructor method"""
+        self.root = os.path.abspath(root)
+        if database is None:
+            directory = os.path.join(self.root, INDEX_DIRECTORY)
+            os.makedirs(directory, exist_ok=True)
+            database = os.path.join(directory, CACHE_FILENAME)
+        self.database = database
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._connection = sqlite3.connect(database)
+        # Every stored result is committed, which should not wait for the disk
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != CACHE_VERSION:
+            # Results of another version of Haystack may differ, so they are dropped
+            self._connection.executescript("DROP TABLE IF EXISTS results;")
+            self._connection.execute("PRAGMA user_version = " + str(CACHE_VERSION))
+        self._connection.executescript(_SCHEMA)
+        self._bytes, self._clock = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0), COALESCE(MAX(used), 0) FROM results"
+        ).fetchone()
+        # The results looked up since the last write, with the time they were used
+        self._used: Dict[Tuple[str, str], int] = {}
+
+    def get(self, query: str, digest: str) -> Optional[List[Location]]:
+        """
+        Looks up the results of a query in a file
+
+        :param query: The key of the query, as returned by query_key
+        :param digest: The hash of the contents of the file
+        :return: The locations where the file matches the query, or None if the
+                results are not cached. If the file was cached as unparsable,
+                an OperandParseException is raised.
+        """
+        row = self._connection.execute(
+            "SELECT data FROM results WHERE query = ? AND digest = ?", (query, digest)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._clock += 1
+        self._used[(query, digest)] = self._clock
+        if row[0] is None:
+            raise exceptions.OperandParseException
+        return serialization.from_binary(row[0])[0].locations
+
+    def put(self, query: str, digest: str, locations: Optional[List[Location]]):
+        """
+        Stores the results of a query in a file, evicting old results if needed
+
+        :param query: The key of the query, as returned by query_key
+        :param digest: The hash of the contents of the file
+        :param locations: The locations where the file matches the query,
+                or None if the file could not be parsed
+        """
+        data = None
+        if locations is not None:
+            data = serialization.to_binary(
+                [serialization.FileResults("", locations, digest)]
+            )
+        size = len(query) + len(digest) + (0 if data is None else len(data))
+        self._clock += 1
+        with self._connection:
+            self._write_used()
+            row = self._connection.execute(
+                "SELECT size FROM results WHERE query = ? AND digest = ?",
+                (query, digest),
+            ).fetchone()
+            if row is not None:
+                self._bytes -= row[0]
+            self._connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (query, digest, data, size, self._clock),
+            )
+            self._bytes += size
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def flush(self):
+        """Records the use of the results that were looked up."""
+        with self._connection:
+            self._write_used()
+
+    def clear(self):
+        """Removes all cached results."""
+        with self._connection:
+            self._connection.execute("DELETE FROM results")
+        self._used.clear()
+        self._bytes = 0
+
+    def close(self):
+        """Flushes and closes the cache database."""
+        self.flush()
+        self._connection.close()
+
+    @property
+    def size(self) -> int:
+        """The total size of the cached results in bytes."""
+        return self._bytes
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def _write_used(self):
+        """Writes the times the results looked up were used."""
+        self._connection.executemany(
+            "UPDATE results SET used = ? WHERE query = ? AND digest = ?",
+            [(used, query, digest) for (query, digest), used in self._used.items()],
+        )
+        self._used.clear()
+
+    def _evict(self):
+        """Removes the least recently used results until the cache fits its budget."""
+        cutoff = None
+        for used, size in self._connection.execute(
+            "SELECT used, size FROM results ORDER BY used"
+        ):
+            if self._bytes <= self.max_bytes:
+                break
+            cutoff = used
+            self._bytes -= size
+        if cutoff is not None:
+            self._connection.execute("DELETE FROM results WHERE used <= ?", (cutoff,))
@@ -0,0 +1,357 @@
+"""
+This module applies a catalogue of rewrite rules to source code in a single job.
+Every rule is a search query with the parse rule of the query and a replacement.
+The rules are searched for together through a pattern set, so every file is parsed
+and searched once per pass however many rules there are. Overlapping matches are
+resolved deterministically: the earliest match wins, then the longest, then the
+match of the rule listed first. As a rewrite can create new matches, the rewritten
+text is reparsed and searched again until no rule matches anymore (a fixpoint).
+Only the nodes overlapping the text changed by the previous pass are searched again,
+as the matches of every other node are known not to have changed.
+
+A rule file is a JSON list of objects, for example::
+
+    [
+        {"name": "double negation", "pattern": "not (not $S_Cond)",
+         "parse_rule": "expr_rule", "replacement": "$S_Cond"}
+    ]
+
+The keys name, parse_rule (which defaults to the default grammar rule)
+and case_insensitive are optional.
+"""
+import argparse
+import json
+from typing import Iterable, Iterator, List, Optional, Tuple
+import libadalang as lal  # type: ignore
+from Haystack import api
+from Haystack import contextpool
+from Haystack import exceptions
+from Haystack import replacer as rep
+from Haystack import searchresult as sr
+from Haystack import unitcache
+from Haystack.location import Location, line_starts, to_offset, to_position
+
+DEFAULT_MAX_PASSES = 10
+
+# An edit replaces the text between two offsets: (start, end, replacement, rule)
+Edit = Tuple[int, int, str, int]
+
+
+class Rule:
+    """
+    A rewrite rule: every match of the pattern is replaced by the replacement.
+
+    :param pattern: The compiled search query
+    :param replacement: The replacement, which may use the wildcards of the pattern
+    :param name: The name of the rule, used in reports
+    """
+
+    pattern: api.Pattern
+    replacement: str
+    name: str
+
+    def __init__(self, pattern: api.Pattern, replacement: str, name: str = ""):
+        """Constructor method"""
+        self.pattern = pattern
+        self.replacement = replacement
+        self.name = name if name else pattern.search_query
+
+    def __repr__(self) -> str:
+        return "Rule(" + repr(self.name) + ")"
+
+
+def load_rules(filepath: str) -> List[Rule]:
+    """
+    Loads and compiles the rules of a rule file
+
+    :param filepath: The filepath of the rule file
+    :return: The rules, in the order of the file
+    """
+    try:
+        with open(filepath, "r", encoding="UTF-8") as infile:
+            entries = json.load(infile)
+    except ValueError as error:
+        raise exceptions.RuleFileException(filepath) from error
+    if not isinstance(entries, list):
+        raise exceptions.RuleFileException(filepath + ": expected a list of rules")
+    rules: List[Rule] = []
+    for number, entry in enumerate(entries):
+        try:
+            pattern = entry["pattern"]
+            replacement = entry["replacement"]
+            parse_rule = entry.get("parse_rule", lal.default_grammar_rule)
+            case_insensitive = bool(entry.get("case_insensitive", False))
+            name = entry.get("name", "")
+        except (KeyError, TypeError, AttributeError) as error:
+            raise exceptions.RuleFileException(
+                filepath + ": rule " + str(number) + " lacks a pattern or replacement"
+            ) from error
+        if not hasattr(lal.GrammarRule, parse_rule):
+            raise exceptions.RuleFileException(
+                filepath
+                + ": rule "
+                + str(number)
+                + " has unknown parse rule "
+                + parse_rule
+            )
+        rules.append(
+            Rule(api.compile(pattern, parse_rule, case_insensitive), replacement, name)
+        )
+    return rules
+
+
+class RewriteResult:
+    """
+    The outcome of rewriting a file or string.
+
+    :param text: The rewritten text
+    :param applied: For every rule, the number of times it was applied
+    :param passes: The number of passes that were made
+    :param converged: Whether a fixpoint was reached, as opposed to running out of passes
+            or producing text that no longer parses
+    """
+
+    text: str
+    applied: List[int]
+    passes: int
+    converged: bool
+
+    def __init__(self, text: str, applied: List[int], passes: int, converged: bool):
+        """Constructor method"""
+        self.text = text
+        self.applied = applied
+        self.passes = passes
+        self.converged = converged
+
+    @property
+    def changes(self) -> int:
+        """The total number of edits that were made."""
+        return sum(self.applied)
+
+
+class Rewriter:
+    """
+    Applies a catalogue of rules to files and strings until none of them matches.
+
+    :param rules: The rules, earlier rules win when matches of two rules cover the same text
+    :param max_passes: The maximum number of passes over a text
+    """
+
+    rules: List[Rule]
+    patterns: api.PatternSet
+    max_passes: int
+
+    def __init__(self, rules: Iterable[Rule], max_passes: int = DEFAULT_MAX_PASSES):
+        """Constructor method"""
+        self.rules = list(rules)
+        self.patterns = api.PatternSet([rule.pattern for rule in self.rules])
+        self.max_passes = max_passes
+
+    def rewrite_string(
+        self, text: str, parse_rule: lal.GrammarRule = lal.default_grammar_rule
+    ) -> RewriteResult:
+        """
+        Rewrites a string
+
+        :param text: The string to rewrite
+        :param parse_rule: The parse rule used to parse the string
+        :return: The result of the rewrite
+        """
+        unit = _parse(text, parse_rule)
+        if unit is None:
+            raise exceptions.OperandParseException
+        return self._rewrite(text, parse_rule, unit.root, sr.NodeIndex(unit.root))
+
+    def rewrite_file(
+        self, filepath: str, output: Optional[str] = None
+    ) -> RewriteResult:
+        """
+        Rewrites a file. The first pass uses the unit cache, so a file that was searched
+        before is not parsed again. The output is only written when something changed,
+        atomically and with the permissions of the file.
+
+        :param filepath: The filepath of the file to rewrite
+        :param output: The filepath to write the result to, defaults to filepath
+        :return: The result of the rewrite
+        """
+        entry = unitcache.get_cache().get(filepath)
+        if entry.unit.diagnostics:
+            raise exceptions.OperandParseException(filepath)
+        text = "".join(entry.lines())
+        result = self._rewrite(
+            text, lal.default_grammar_rule, entry.unit.root, entry.node_index()
+        )
+        output = filepath if output is None else output
+        if result.changes or output != filepath:
+            # Staged next to the output and moved over it, so an interrupted write
+            # never leaves a truncated file behind
+            staged = rep.stage_file(
+                filepath, [], "", output=output, lines=[result.text]
+            )
+            rep.commit_file(staged, output)
+            unitcache.invalidate(output)
+        return result
+
+    def rewrite_files(
+        self, filepaths: Iterable[str], skip_unparsable: bool = False
+    ) -> Iterator[Tuple[str, RewriteResult]]:
+        """
+        Rewrites many files in place
+
+        :param filepaths: The filepaths of the files to rewrite
+        :param skip_unparsable: Skip files that could not be parsed instead of raising
+                an OperandParseException
+        :return: An iterator over tuples of a filepath and the result of its rewrite
+        """
+        for filepath in filepaths:
+            try:
+                result = self.rewrite_file(filepath)
+            except exceptions.OperandParseException:
+                if not skip_unparsable:
+                    raise
+                continue
+            yield filepath, result
+
+    def _rewrite(
+        self,
+        text: str,
+        parse_rule: lal.GrammarRule,
+        root: lal.AdaNode,
+        index: sr.NodeIndex,
+    ) -> RewriteResult:
+        """
+        Rewrites a parsed text until a fixpoint is reached
+
+        :param text: The text to rewrite
+        :param parse_rule: The parse rule used to parse the text
+        :param root: The root of the parse tree of text
+        :param index: The node index of the parse tree
+        :return: The result of the rewrite
+        """
+        applied = [0] * len(self.rules)
+        nodes: Optional[List[int]] = None
+        for passes in range(1, self.max_passes + 1):
+            starts = line_starts(text)
+            matches = self.patterns.net.iter_search(root, index, nodes=nodes)
+            edits = self._select_edits(text, starts, matches)
+            if not edits:
+                return RewriteResult(text, applied, passes, True)
+            text, spans = _apply_edits(text, edits)
+            for edit in edits:
+                applied[edit[3]] += 1
+            unit = _parse(text, parse_rule)
+            if unit is None:
+                # A replacement produced invalid code, stop rewriting
+                return RewriteResult(text, applied, passes, False)
+            root = unit.root
+            index = sr.NodeIndex(root)
+            nodes = _overlapping_nodes(index, line_starts(text), spans)
+        return RewriteResult(text, applied, self.max_passes, False)
+
+    def _select_edits(
+        self,
+        text: str,
+        starts: List[int],
+        matches: Iterable[Tuple[int, Location]],
+    ) -> List[Edit]:
+        """
+        Turns matches into non-overlapping edits
+
+        :param text: The text the matches were found in
+        :param starts: The offsets of the starts of the lines of text
+        :param matches: The matches, tagged with the number of their rule
+        :return: The edits to make, ordered by their offsets
+        """
+        candidates: List[Edit] = []
+        for number, location in matches:
+            start = to_offset(starts, location.start_line, location.start_char)
+            end = to_offset(starts, location.end_line, location.end_char)
+            replacement = rep.expand_replacement(
+                location, self.rules[number].replacement
+            )
+            if replacement != text[start:end]:
+                candidates.append((start, end, replacement, number))
+        # The earliest match wins, then the longest, then the one of the first rule
+        candidates.sort(key=lambda edit: (edit[0], edit[0] - edit[1], edit[3]))
+        edits: List[Edit] = []
+        for edit in candidates:
+            if not edits or edit[0] >= edits[-1][1]:
+                edits.append(edit)
+        return edits
+
+
+def _parse(text: str, parse_rule: lal.GrammarRule) -> Optional[lal.AnalysisUnit]:
+    """
+    Parses a text, libadalang can only reparse whole units
+
+    :param text: The text to parse
+    :param parse_rule: The parse rule used to parse the text
+    :return: The analysis unit, or None if the text contains syntax errors
+    """
+    unit = contextpool.get_pool().parse_buffer(
+        text, getattr(lal.GrammarRule, parse_rule)
+    )
+    return None if unit.diagnostics else unit
+
+
+def _apply_edits(text: str, edits: List[Edit]) -> Tuple[str, List[Tuple[int, int]]]:
+    """
+    Applies non-overlapping edits to a text
+
+    :param text: The text to edit
+    :param edits: The edits, ordered by their offsets
+    :return: A tuple with the edited text and the spans of the replacements in it
+    """
+    parts: List[str] = []
+    spans: List[Tuple[int, int]] = []
+    position = 0
+    length = 0
+    for start, end, replacement, _ in edits:
+        parts.append(text[position:start])
+        length += start - position
+        parts.append(replacement)
+        spans.append((length, length + len(replacement)))
+        length += len(replacement)
+        position = end
+    parts.append(text[position:])
+    return "".join(parts), spans
+
+
+def _overlapping_nodes(
+    index: sr.NodeIndex, starts: List[int], spans: List[Tuple[int, int]]
+) -> List[int]:
+    """
+    Finds the nodes whose text overlaps or touches a changed span.
+    The subtrees of the other nodes are unchanged, so their matches are unchanged too.
+
+    :param index: The node index of the edited tree
+    :param starts: The offsets of the starts of the lines of the edited text
+    :param spans: The changed spans of the edited text, ordered by their offsets
+    :return: The numbers of the overlapping nodes, in pre-order
+    """
+    return index.overlapping(
+        [(to_position(starts, start), to_position(starts, end)) for start, end in spans]
+    )
+
+
+def main():
+    """Rewrites files with the rules of a rule file and reports what was applied."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("rules", help="the rule file")
+    parser.add_argument("files", nargs="+", help="the Ada files to rewrite")
+    parser.add_argument("--max-passes", type=int, default=DEFAULT_MAX_PASSES)
+    args = parser.parse_args()
+
+    rewriter = Rewriter(load_rules(args.rules), args.max_passes)
+    totals = [0] * len(rewriter.rules)
+    for filepath, result in rewriter.rewrite_files(args.files, skip_unparsable=True):
+        print(filepath, result.changes, "changes in", result.passes, "passes")
+        if not result.converged:
+            print(filepath, "did not converge")
+        totals = [total + count for total, count in zip(totals, result.applied)]
+    for rule, total in zip(rewriter.rules, totals):
+        print(rule.name, total)
+
+
+if __name__ == "__main__":
+    main()
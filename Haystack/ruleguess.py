@@ -0,0 +1,237 @@
+"""
+This module guesses which parse rules parse a search query, so a search that tries
+parse rules does not have to parse the query with every rule there is.
+A query is reduced to its shape: its leading keyword, whether it ends with a
+semicolon, how many statements it holds and which of the delimiters :=, : and =>
+it contains. Every shape has a short list of likely rules, most likely first.
+A rule history, persisted as JSON, counts for every shape which rules matched before,
+and those rules are ranked before the fixed list.
+"""
+import json
+import os
+import re
+import tempfile
+from typing import Dict, List, Optional
+from Haystack.projectindex import INDEX_DIRECTORY
+
+HISTORY_FILENAME = "rule_history.json"
+
+# String and character literals and comments, which are left out of the shape
+_LITERALS = re.compile(r'"(?:[^"]|"")*"|(?<![\w)])\'.\'|--[^\n]*')
+_WORD = re.compile(r"[A-Za-z_$][A-Za-z0-9_]*")
+
+# The likely rules of queries that end with a semicolon, by their leading keyword
+_STATEMENT_KEYWORDS: Dict[str, List[str]] = {
+    "procedure": [
+        "subp_body_rule",
+        "subp_decl_rule",
+        "basic_decl_rule",
+        "abstract_subp_decl_rule",
+        "null_subp_decl_rule",
+        "subp_renaming_decl_rule",
+        "generic_instantiation_rule",
+    ],
+    "function": [
+        "subp_body_rule",
+        "subp_decl_rule",
+        "basic_decl_rule",
+        "abstract_subp_decl_rule",
+        "expr_fn_rule",
+        "subp_renaming_decl_rule",
+        "generic_instantiation_rule",
+    ],
+    "overriding": ["subp_body_rule", "subp_decl_rule", "basic_decl_rule"],
+    "not": ["subp_body_rule", "subp_decl_rule", "basic_decl_rule"],
+    "package": [
+        "package_decl_rule",
+        "package_body_rule",
+        "basic_decl_rule",
+        "package_renaming_decl_rule",
+        "generic_instantiation_rule",
+    ],
+    "generic": ["generic_decl_rule", "basic_decl_rule"],
+    "type": ["type_decl_rule", "basic_decl_rule"],
+    "subtype": ["subtype_decl_rule", "basic_decl_rule"],
+    "task": ["task_type_decl_rule", "single_task_decl_rule", "task_body_rule"],
+    "protected": ["protected_type_decl_rule", "protected_body_rule"],
+    "entry": ["entry_decl_rule", "entry_body_rule"],
+    "separate": ["subunit_rule"],
+    "with": ["with_clause_rule", "context_item_rule"],
+    "limited": ["with_clause_rule", "context_item_rule"],
+    "private": ["with_clause_rule", "context_item_rule"],
+    "use": ["use_clause_rule", "context_item_rule"],
+    "pragma": ["pragma_rule"],
+    "if": ["if_stmt_rule", "stmt_rule"],
+    "case": ["case_stmt_rule", "stmt_rule"],
+    "for": ["loop_stmt_rule", "stmt_rule", "aspect_clause_rule"],
+    "while": ["loop_stmt_rule", "stmt_rule"],
+    "loop": ["loop_stmt_rule", "stmt_rule"],
+    "declare": ["block_stmt_rule", "stmt_rule"],
+    "begin": ["block_stmt_rule", "stmt_rule"],
+    "return": ["return_stmt_rule", "ext_return_stmt_rule", "stmt_rule"],
+    "raise": ["raise_stmt_rule", "stmt_rule"],
+    "accept": ["accept_stmt_rule", "stmt_rule"],
+    "select": ["select_stmt_rule", "stmt_rule"],
+    "delay": ["delay_stmt_rule", "stmt_rule"],
+    "exit": ["exit_stmt_rule", "stmt_rule"],
+    "goto": ["goto_stmt_rule", "stmt_rule"],
+    "null": ["null_stmt_rule", "stmt_rule"],
+    "requeue": ["requeue_stmt_rule", "stmt_rule"],
+    "abort": ["abort_stmt_rule", "stmt_rule"],
+}
+
+# The likely rules of queries without a semicolon, by their leading keyword
+_EXPRESSION_KEYWORDS: Dict[str, List[str]] = {
+    "procedure": ["subp_spec_rule"],
+    "function": ["subp_spec_rule"],
+    "if": ["if_expr_rule", "expr_rule"],
+    "case": ["case_expr_rule", "expr_rule"],
+    "for": ["quantified_expr_rule", "for_loop_param_spec_rule", "expr_rule"],
+    "new": ["allocator_rule", "expr_rule"],
+    "when": ["case_alt_rule", "exception_handler_rule", "case_expr_alt_rule"],
+    "elsif": ["elsif_part_rule"],
+    "not": ["expr_rule", "type_expr_rule"],
+    "access": ["type_expr_rule", "access_def_rule"],
+    "range": ["range_spec_rule", "range_constraint_rule"],
+}
+
+# The likely rules of the other shapes
+_SHAPES: Dict[str, List[str]] = {
+    "statements": ["stmts_rule", "basic_decls_rule", "compilation_rule"],
+    "declaration;": [
+        "object_decl_rule",
+        "basic_decl_rule",
+        "component_decl_rule",
+        "number_decl_rule",
+        "exception_decl_rule",
+    ],
+    "assignment;": ["assignment_stmt_rule", "stmt_rule"],
+    "statement;": ["call_stmt_rule", "stmt_rule", "stmts_rule"],
+    "declaration": ["param_spec_rule", "component_decl_rule"],
+    "association": [
+        "param_assoc_rule",
+        "aggregate_assoc_rule",
+        "aspect_assoc_rule",
+        "expr_rule",
+    ],
+    "expression": [
+        "expr_rule",
+        "name_rule",
+        "identifier_rule",
+        "subtype_indication_rule",
+        "choice_rule",
+    ],
+}
+
+
+def query_shape(search_query: str) -> str:
+    """
+    Reduces a search query to the features that tell which rules parse it
+
+    :param search_query: The search query
+    :return: The shape of the search query, such as "procedure;" or "assignment;"
+    """
+    text = _LITERALS.sub("''", search_query).strip()
+    words = _WORD.findall(text)
+    keyword = words[0].lower() if words else ""
+    statement = text.endswith(";")
+    if statement and keyword in _STATEMENT_KEYWORDS:
+        return keyword + ";"
+    if not statement and keyword in _EXPRESSION_KEYWORDS:
+        return keyword
+    if text.count(";") > 1:
+        return "statements"
+    if re.search(r":(?!=)", text):
+        shape = "declaration"
+    elif ":=" in text:
+        shape = "assignment"
+    elif "=>" in text:
+        shape = "association"
+    else:
+        shape = "statement" if statement else "expression"
+    return shape + (";" if statement else "")
+
+
+def likely_rules(shape: str) -> List[str]:
+    """
+    Returns the rules that most likely parse search queries of a shape
+
+    :param shape: The shape of a search query, as returned by query_shape
+    :return: The names of the rules, most likely first
+    """
+    if shape.endswith(";") and shape[:-1] in _STATEMENT_KEYWORDS:
+        return list(_STATEMENT_KEYWORDS[shape[:-1]])
+    if shape in _EXPRESSION_KEYWORDS:
+        return list(_EXPRESSION_KEYWORDS[shape])
+    if shape == "assignment":
+        return ["expr_rule"]  # an assignment without semicolon does not parse
+    return list(_SHAPES.get(shape, _SHAPES["expression"]))
+
+
+class RuleHistory:
+    """
+    Counts for every query shape which parse rules matched, persisted as JSON.
+    A history that can not be read starts out empty. Rules are recorded in memory,
+    the history is only written by save, so a search of many files writes it once.
+
+    :param filepath: The filepath of the history,
+            defaults to .haystack/rule_history.json in the home directory
+    """
+
+    filepath: str
+    counts: Dict[str, Dict[str, int]]
+    modified: bool
+
+    def __init__(self, filepath: Optional[str] = None):
+        """Constructor method"""
+        if filepath is None:
+            filepath = os.path.join(
+                os.path.expanduser("~"), INDEX_DIRECTORY, HISTORY_FILENAME
+            )
+        self.filepath = filepath
+        self.counts = {}
+        self.modified = False
+        try:
+            with open(filepath, "r", encoding="UTF-8") as infile:
+                counts = json.load(infile)
+            if isinstance(counts, dict):
+                self.counts = counts
+        except (OSError, ValueError):
+            pass
+
+    def ranked(self, shape: str) -> List[str]:
+        """
+        Returns the rules that matched search queries of a shape
+
+        :param shape: The shape of a search query, as returned by query_shape
+        :return: The names of the rules, the rule that matched most often first
+        """
+        counts = self.counts.get(shape, {})
+        return sorted(counts, key=lambda rule: -counts[rule])
+
+    def record(self, shape: str, rule: str):
+        """
+        Records that a rule matched for a search query of a shape
+
+        :param shape: The shape of the search query, as returned by query_shape
+        :param rule: The name of the rule that matched
+        """
+        counts = self.counts.setdefault(shape, {})
+        counts[rule] = counts.get(rule, 0) + 1
+        self.modified = True
+
+    def save(self):
+        """Writes the history if it was modified, replacing the file atomically."""
+        if not self.modified:
+            return
+        directory = os.path.dirname(os.path.abspath(self.filepath))
+        os.makedirs(directory, exist_ok=True)
+        descriptor, staged = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "w", encoding="UTF-8") as outfile:
+                json.dump(self.counts, outfile, indent=1, sort_keys=True)
+            os.replace(staged, self.filepath)
+            self.modified = False
+        except BaseException:
+            os.remove(staged)
+            raise
@@ -1,286 +1,955 @@
 """
 This module contains the methods used to search for pattern matches.
-The only function used from outside this module is execute_search, which searches for one
-Ada parse tree in another.
+The functions used from outside this module are execute_search and iter_search,
+which search for one Ada parse tree in another.
 """
-from typing import List, Dict, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 import libadalang as lal  # type: ignore
-from Haystack.location import Location
+from Haystack.location import Capture, Location, Wildcard, line_starts, to_offset
 import re
 
 
 def execute_search(
-    pattern: lal.AdaNode, operand: lal.AdaNode, case_insensitive: bool
+    pattern: Union[lal.AdaNode, "PatternNode"],
+    operand: lal.AdaNode,
+    case_insensitive: bool,
+    index: Optional["NodeIndex"] = None,
 ) -> List[Location]:
     """
     Executes a search operation
 
-    :param pattern: The parse tree to search for
+    :param pattern: The parse tree to search for, or its compiled pattern
     :param operand: The parse tree to search in
     :param case_insensitive: Whether to enable case insensitive searching
+    :param index: The node index of operand, built on the fly if not supplied
     """
-    search = SearchResult(case_insensitive)
-    search.is_subtree(operand, pattern)
-    return search.locations
+    return list(iter_search(pattern, operand, case_insensitive, index))
 
 
-class SearchResult:
-    """Class used for searching a text in a file and storing its location.
+def iter_search(
+    pattern: Union[lal.AdaNode, "PatternNode"],
+    operand: lal.AdaNode,
+    case_insensitive: bool,
+    index: Optional["NodeIndex"] = None,
+    nodes: Optional[Iterable[int]] = None,
+) -> Iterator[Location]:
+    """
+    Executes a search operation lazily, yielding every match as soon as it is found
 
-    :param case_insensitive: Flag conveying whether the search should be case insensitive
-    :type case_insensitive: bool, optional
+    :param pattern: The parse tree to search for, or its compiled pattern
+    :param operand: The parse tree to search in
+    :param case_insensitive: Whether to enable case insensitive searching
+    :param index: The node index of operand, built on the fly if not supplied
+    :param nodes: The numbers of the operand nodes to search at, in pre-order,
+            defaults to all nodes
     """
+    return SearchResult(case_insensitive).iter_subtree(operand, pattern, index, nodes)
 
-    locations: List[Location]
-    last_location: str
+
+class NodeIndex:
+    """
+    Index of all nodes of an operand tree, built once per operand unit.
+    Nodes are numbered in pre-order, so the descendants of node i are exactly
+    the nodes i + 1 up to (but not including) ends[i].
+    The nodes are also grouped by their kind, so a search only has to visit
+    the nodes that could possibly be the root of a match.
+    The children and the texts of the leaves are looked up once while building
+    the index, so matching never has to ask libadalang for them again.
+    On demand, every node also gets a structural hash computed bottom-up from
+    the texts of the leaves and the layout of the children, so two subtrees
+    with different hashes are known to differ without comparing them.
+
+    :param root: The root of the tree to index
+    """
+
+    nodes: List[lal.AdaNode]
+    ends: List[int]
+    kinds: Dict[str, List[int]]
+    # The numbers of the children of every node, None where libadalang has no child
+    children: List[List[Optional[int]]]
+    # The number of children of every node that are not None
+    child_counts: List[int]
+    # The text of every leaf, None for nodes that have children
+    texts: List[Optional[str]]
+
+    def __init__(self, root: lal.AdaNode):
+        """Constructor method"""
+        self.nodes = []
+        self.ends = []
+        self.kinds = {}
+        self.children = []
+        self.child_counts = []
+        self.texts = []
+        self._lower_texts: Optional[List[Optional[str]]] = None
+        self._hashes: Dict[bool, List[int]] = {}
+        self._line_starts: Optional[List[int]] = None
+        # Entries on the stack are nodes to enter, with the parent and position
+        # of the child they are, so the parent can learn their number
+        stack: List[Tuple[lal.AdaNode, int, int]] = []
+        if root is not None:
+            stack.append((root, -1, 0))
+        while stack:
+            node, parent, position = stack.pop()
+            number = len(self.nodes)
+            self.nodes.append(node)
+            if parent >= 0:
+                self.children[parent][position] = number
+            self.kinds.setdefault(node.kind_name, []).append(number)
+            children = node.children
+            self.children.append([None] * len(children))
+            self.child_counts.append(0)
+            self.texts.append(None if children else node.text)
+            for position in reversed(range(len(children))):
+                if children[position] is not None:
+                    self.child_counts[number] += 1
+                    stack.append((children[position], number, position))
+        # The subtree of a node ends where the subtree of its last child ends
+        self.ends = [0] * len(self.nodes)
+        for number in reversed(range(len(self.nodes))):
+            self.ends[number] = number + 1
+            for child in reversed(self.children[number]):
+                if child is not None:
+                    self.ends[number] = self.ends[child]
+                    break
+
+    def candidates(self, kind_name: Optional[str]) -> Sequence[int]:
+        """
+        Returns the pre-order numbers of the nodes of a given kind, in pre-order
+
+        :param kind_name: The kind of the nodes, or None for all nodes
+        :return: The pre-order numbers of the matching nodes
+        """
+        if kind_name is None:
+            return range(len(self.nodes))
+        return self.kinds.get(kind_name, [])
+
+    def overlapping(
+        self, spans: Sequence[Tuple[Tuple[int, int], Tuple[int, int]]]
+    ) -> List[int]:
+        """
+        Returns the nodes whose text overlaps or touches one of the spans.
+        The other nodes lie wholly before or after every span, so the subtrees
+        of nodes that do not overlap a span are not visited at all.
+
+        :param spans: The spans, as (line, character) tuples of their start and end
+        :return: The pre-order numbers of the overlapping nodes, in pre-order
+        """
+        found: List[int] = []
+        stack = [0] if self.nodes else []
+        while stack:
+            number = stack.pop()
+            sloc = self.nodes[number].sloc_range
+            start = (sloc.start.line, sloc.start.column)
+            end = (sloc.end.line, sloc.end.column)
+            if any(low <= end and start <= high for low, high in spans):
+                found.append(number)
+                stack.extend(
+                    child
+                    for child in reversed(self.children[number])
+                    if child is not None
+                )
+        return found
+
+    def location(self, number: int, wildcards: Dict[str, Wildcard]) -> Location:
+        """
+        Builds the location of a node, with the absolute offsets of its text
+
+        :param number: The pre-order number of the node
+        :param wildcards: The wildcards bound by the match at the node
+        :return: The location of the node
+        """
+        sloc = self.nodes[number].sloc_range
+        starts = self._starts()
+        return Location(
+            sloc.start.line,
+            sloc.end.line,
+            sloc.start.column,
+            sloc.end.column,
+            wildcards,
+            to_offset(starts, sloc.start.line, sloc.start.column),
+            to_offset(starts, sloc.end.line, sloc.end.column),
+            self.nodes[number].kind_name,
+        )
+
+    def capture(self, number: int) -> Capture:
+        """
+        Detaches the text of a node from the tree
+
+        :param number: The pre-order number of the node
+        :return: The text of the node, with its absolute offsets
+        """
+        node = self.nodes[number]
+        sloc = node.sloc_range
+        starts = self._starts()
+        return Capture(
+            node.text,
+            to_offset(starts, sloc.start.line, sloc.start.column),
+            to_offset(starts, sloc.end.line, sloc.end.column),
+            node.kind_name,
+        )
+
+    def _starts(self) -> List[int]:
+        """Returns the line-start offset table of the text of the unit, built on first use."""
+        if self._line_starts is None:
+            self._line_starts = line_starts(self.nodes[0].unit.text)
+        return self._line_starts
+
+    def lower_texts(self) -> List[Optional[str]]:
+        """
+        Returns the texts of the leaves in lower case, for case insensitive searches.
+        They are computed on first use and shared by all later searches.
+        """
+        if self._lower_texts is None:
+            self._lower_texts = [
+                None if text is None else text.lower() for text in self.texts
+            ]
+        return self._lower_texts
+
+    def hashes(self, case_insensitive: bool = False) -> List[int]:
+        """
+        Returns the structural hashes of all nodes. Identical subtrees have
+        identical hashes, so subtrees with different hashes cannot be identical.
+        They are computed on first use and shared by all later searches.
+
+        :param case_insensitive: Whether to hash the texts of the leaves in lower case
+        :return: The structural hash of every node
+        """
+        hashes = self._hashes.get(case_insensitive)
+        if hashes is None:
+            texts = self.lower_texts() if case_insensitive else self.texts
+            hashes = [0] * len(self.nodes)
+            # children are numbered after their parent, so they are hashed first
+            for number in reversed(range(len(self.nodes))):
+                children = self.children[number]
+                if children:
+                    hashes[number] = hash(
+                        tuple(None if i is None else hashes[i] for i in children)
+                    )
+                else:
+                    hashes[number] = hash(texts[number])
+            self._hashes[case_insensitive] = hashes
+        return hashes
+
+
+class PatternNode:
+    """
+    A node of a pattern tree, annotated once before matching starts.
+    Matching visits the pattern nodes over and over again, once for every
+    candidate in the operand, so everything the matcher needs to know about
+    a pattern node (its text, wildcard class and children) is looked up here
+    only once instead of on every visit.
+
+    :param node: The libadalang node this pattern node stands for
+    """
+
+    node: lal.AdaNode
+    kind_name: str
+    text: str
+    children: List[Optional["PatternNode"]]
+    # Whether the node is a list, whose children are a sequence of elements
+    is_list: bool
+    # The wildcard class of the node, and the name of the wildcard without semicolon
+    singular: bool
+    plural: bool
+    name: str
+    # Information about the children, filled in by compile_pattern
+    child_count: int
+    plural_count: int
+
+    def __init__(self, node: lal.AdaNode):
+        """Constructor method"""
+        self.node = node
+        self.kind_name = node.kind_name
+        self.text = node.text
+        self.children = []
+        self.is_list = bool(node.is_list_type)
+        self.singular = (
+            not node.children and bool(self.text) and _is_singular_wildcard(self.text)
+        )
+        self.plural = bool(self.text) and _is_plural_wildcard(self.text)
+        self.name = self.text.rstrip(";")
+        self.child_count = 0
+        self.plural_count = 0
+
+    def _annotate_children(self):
+        """Records the child counts, once the children are known."""
+        for child in self.children:
+            if child is not None:
+                self.child_count += 1
+                self.plural_count += child.plural
+
+
+def compile_pattern(root: lal.AdaNode) -> PatternNode:
+    """
+    Annotates every node of a pattern tree, so matching does not have to
+    inspect the libadalang nodes of the pattern anymore
+
+    :param root: The root of the pattern tree
+    :return: The root of the annotated pattern tree
+    """
+    top = PatternNode(root)
+    stack = [top]
+    while stack:
+        pattern_node = stack.pop()
+        for child in pattern_node.node.children:
+            pattern_child = None if child is None else PatternNode(child)
+            pattern_node.children.append(pattern_child)
+            if pattern_child is not None:
+                stack.append(pattern_child)
+        # The children classified themselves when they were created
+        pattern_node._annotate_children()  # pylint: disable=protected-access
+    return top
+
+
+# A step of a matcher program compares one operand node (given by its number in the
+# node index, or None) to one pattern node. Steps that have to compare children push
+# pairs of child numbers and child steps onto the stack they are given.
+Step = Callable[[Optional[int], List[Tuple[Optional[int], Any]]], bool]
+# The value of a wildcard while matching: a node number, None or a list of those
+Binding = Union[int, None, List[Optional[int]]]
+
+
+class Matcher:
+    """
+    A pattern compiled into a program of steps, one closure per pattern node,
+    that is executed against the nodes of one operand.
+    Everything about the pattern is decided once while compiling, and the operand
+    is only looked at through its node index, so matching a candidate does not
+    cost any calls into libadalang.
+    The program is executed with an explicit stack of (node, step) pairs, depth
+    first and left to right, which is also the order in which wildcards are bound.
+    Parts of the pattern without wildcards, and wildcards that occur more than
+    once, are first compared through the structural hashes of the node index,
+    and only compared node by node when the hashes are equal.
+    The children of a list with plural wildcards are aligned to the elements of
+    the operand list by a memoised search, in which every plural wildcard matches
+    a run of elements, see _match_sequence. Elsewhere a plural wildcard stands
+    for the single child (or missing child) at its position.
+
+    :param pattern: The root of the compiled pattern tree
+    :param index: The node index of the operand
+    :param case_insensitive: Whether the leaves are compared case insensitively
+    """
+
+    pattern: PatternNode
+    index: NodeIndex
     case_insensitive: bool
-    wildcards: Dict[str, Union[lal.AdaNode, None, List[lal.AdaNode]]]
+    bindings: Dict[str, Tuple[str, Binding]]
 
-    def __init__(self, case_insensitive: bool):
+    def __init__(self, pattern: PatternNode, index: NodeIndex, case_insensitive: bool):
         """Constructor method"""
-        self.locations = []
-        self.last_location = ""
+        self.pattern = pattern
+        self.index = index
         self.case_insensitive = case_insensitive
-        self.wildcards = {}
+        # The wildcards bound so far, by name, with the text they were bound under
+        self.bindings = {}
+        self._texts = index.lower_texts() if case_insensitive else index.texts
+        self._steps: Dict[int, Step] = {}
+        # The structural hashes of the pattern subtrees that contain no wildcards
+        self._hashes: Dict[int, Optional[int]] = {}
+        # The names of the wildcards in every pattern subtree
+        self._names: Dict[int, FrozenSet[str]] = {}
+        self._compile(pattern)
 
-    def _are_identical(self, root1: lal.AdaNode, root2: lal.AdaNode) -> bool:
+    def match(self, number: int) -> bool:
         """
-        Checks whether leaves of two tree roots are identical
+        Checks whether the pattern matches the operand node with the given number,
+        starting with no wildcards bound
 
-        :param root1: Root of the first tree to be compared
-        :param root2: Root of the second  tree to be compared
-        :return: True if the children are identical
-        :rtype: bool
+        :param number: The pre-order number of the operand node
+        :return: True if the pattern matches the node
         """
-        if root1 is None and root2 is None:
-            return True
-        if root1 is None or root2 is None:
-            return False
-        if (
-            not root2.children
-            and root2.text
-            and _is_singular_wildcard(root2.text)
-            and self._wild_comparison(root1, root2)
-        ):
-            return True  # the leaf is a singular wildcard and it passes the comparison
-        if (
-            root2.text
-            and _is_plural_wildcard(root2.text)
-            and self._wild_comparison(root1, root2)
-        ):
-            return True  # the leaf is a plural wildcard and it passes the comparison
-        if (
-            not root1.children
-            and not root2.children
-            and not _text_comparison(root1.text, root2.text, self.case_insensitive)
-        ):
-            return (
-                False  # the leaf is a regular text node it doesn't pass the comparison
+        self.bindings.clear()
+        return self._run(number, self._steps[id(self.pattern)])
+
+    def wildcards(self) -> Dict[str, Wildcard]:
+        """
+        Returns the wildcards bound by the last match, by the text of the wildcard
+        in the pattern, with the text of the operand nodes they were bound to.
+        """
+        wildcards: Dict[str, Wildcard] = {}
+        for key, value in self.bindings.values():
+            if isinstance(value, list):
+                wildcards[key] = [self.index.capture(i) for i in value if i is not None]
+            else:
+                wildcards[key] = None if value is None else self.index.capture(value)
+        return wildcards
+
+    def _run(self, number: Optional[int], step: Step) -> bool:
+        """
+        Executes a step and all the steps it pushes
+
+        :param number: The number of the operand node to start with
+        :param step: The step to start with
+        :return: True if none of the steps failed
+        """
+        stack: List[Tuple[Optional[int], Any]] = [(number, step)]
+        while stack:
+            number, step = stack.pop()
+            if not step(number, stack):
+                return False
+        return True
+
+    def _compile(self, pattern: PatternNode):
+        """
+        Compiles the steps of all nodes of a pattern tree, children before parents
+
+        :param pattern: The root of the pattern tree
+        """
+        order = []
+        stack = [pattern]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(child for child in node.children if child is not None)
+        for node in reversed(order):
+            names = {node.name} if node.singular or node.plural else set()
+            for child in node.children:
+                if child is not None:
+                    names |= self._names[id(child)]
+            self._names[id(node)] = frozenset(names)
+            self._hashes[id(node)] = self._pattern_hash(node)
+            self._steps[id(node)] = self._compile_node(node)
+
+    def _pattern_hash(self, pattern: PatternNode) -> Optional[int]:
+        """
+        Computes the structural hash of a pattern subtree the same way
+        NodeIndex.hashes does for the operand, from the hashes of its children.
+
+        :param pattern: The root of the pattern subtree
+        :return: The hash, or None if the subtree contains a wildcard
+        """
+        if pattern.singular or pattern.plural:
+            return None
+        if not pattern.children:
+            return hash(pattern.text.lower() if self.case_insensitive else pattern.text)
+        hashes = []
+        for child in pattern.children:
+            child_hash = None if child is None else self._hashes[id(child)]
+            if child is not None and child_hash is None:
+                return None
+            hashes.append(child_hash)
+        return hash(tuple(hashes))
+
+    def _step_of(self, node: Optional[PatternNode]) -> Step:
+        """Returns the compiled step of a pattern node, or of a missing child."""
+        if node is None:
+            return _match_none
+        return self._steps[id(node)]
+
+    def _compile_node(self, pattern: PatternNode) -> Step:
+        """
+        Compiles the step of a single pattern node, whose children were compiled before
+
+        :param pattern: The pattern node
+        :return: The step comparing an operand node to pattern
+        """
+        children = self.index.children
+        child_counts = self.index.child_counts
+        texts = self._texts
+
+        if not pattern.children:
+            text = pattern.text.lower() if self.case_insensitive else pattern.text
+
+            def step(number, stack):  # pylint: disable=unused-argument
+                # a leaf of the pattern only matches a leaf of the operand
+                return (
+                    number is not None
+                    and not children[number]
+                    and texts[number] == text
+                )
+
+        elif pattern.is_list and pattern.plural_count:
+            sequence = _ChildSequence(
+                pattern,
+                [self._step_of(child) for child in pattern.children],
+                self._names,
             )
 
-        # beforehand, we count the number of plural wildcards in the current subtree
-        filter_children1 = [i for i in root1.children if i is not None]
-        filter_children2 = [i for i in root2.children if i is not None]
-        plural_wildcards_no = sum(
-            _is_plural_wildcard(child.text) for child in filter_children2
-        )
+            def step(number, stack):  # pylint: disable=unused-argument
+                # the plural wildcards of a list match runs of its elements
+                return number is not None and self._match_sequence(
+                    children[number], sequence
+                )
 
-        if len(filter_children1) == len(filter_children2):
-            # "standard" case, where the number of children is equal and we can iterate in parallel
-            for i in range(len(root1.children)):
-                if not self._are_identical(root1.children[i], root2.children[i]):
-                    return False
-            self.last_location = root1.sloc_range
-            return True
-        elif plural_wildcards_no:
-            # if the no of children is different, we can only match if there are plural wildcards
-            return self.wildcard_list_matching(root1, root2, plural_wildcards_no)
-        return False
+        else:
+            size = len(pattern.children)
+            child_count = pattern.child_count
+            reversed_steps = [self._step_of(child) for child in pattern.children][::-1]
+            # a plural wildcard may stand for a missing child, so the number of
+            # children only has to be equal without plural wildcards
+            counted = not pattern.plural_count
 
-    def wildcard_list_matching(
-        self, root1: lal.AdaNode, root2: lal.AdaNode, plural_wildcards_no: int
-    ):
-        regular_children = len(root2.children) - plural_wildcards_no
-        to_compare = [i for i in root1.children if i is not None]
-
-        # if there is the same number of children disregarding the wildcards,
-        # we can still compare by iterating in parallel, provided we strip the wildcards first
-        if len(to_compare) == regular_children:
-            new_children = _strip_from_wildcards(root2)
-            # this loop is analogous to the standard case
-            for i in range(len(root1.children)):
-                if not self._are_identical(root1.children[i], new_children[i]):
-                    return False
-            # loop below must be added so that we set our wildcards to None
-            # (or check in the dictionary, if they already exist)
-            for child in list(set(root2.children) - set(new_children)):
-                if not self._wild_comparison(None, child):
+            def step(number, stack):
+                if number is None:
                     return False
-            self.last_location = root1.sloc_range
-            return True
-        # a more complex case arises if the numbers don't match
-        # we preliminarily check the lower bound of the number of children in root1
-        elif len(to_compare) > regular_children:
-            # we keep track of which children of root2 are wildcards
-            wildcard_indexes = [
-                i
-                for i in range(len(root2.children))
-                if _is_plural_wildcard(root2.children[i].text)
-            ]
-            # if we are sure that elements of root2 have to belong to the current wildcard
-            # in order for it to match, we store their values in the below list
-            multi_wildcard_value: List[List[lal.AdaNode]] = []
-            i = 0  # root1 iterator
-            j = 0  # root2 iterator
-            # we now try to check if it's possible to match both lists
-            while i < len(root1.children) and j < len(root2.children):
-                if (
-                    j in wildcard_indexes
-                ):  # if the current element of root2 is a wildcard
-                    # here, our best assumption is that the wildcard matches to 0 nodes
-                    # but, if either there already are elements on the multi_wildcard_value list
-                    # or we've reached the end of root1, then the current root1 element
-                    # has to belong to the current wildcard
-                    if multi_wildcard_value or i == len(root1.children) - 1:
-                        multi_wildcard_value.append(root1.children[i])
-                        i += 1
-                    j += 1
-                else:  # if the current element of root2 is not a wildcard
-                    # if current elements of root1 and root2 are not the same it means that
-                    # current root1 element has to still belong to the last wildcard that appeared on root1
-                    # so we add it to the list
-                    if root2.children and not self._are_identical(
-                        root1.children[i], root2.children[j]
-                    ):
-                        multi_wildcard_value.append(root1.children[i])
-                    # but if they are identical, then we have to check if the current multi_wildcard_value list
-                    # indeed matches the last wildcard that appeared on root2
-                    else:
-                        if wildcard_indexes and [
-                            index for index in wildcard_indexes if index < j
-                        ]:
-                            last_wildcard = max(
-                                [index for index in wildcard_indexes if index < j]
-                            )
-                            # if this the last wildcard on on root2, then we add a modifier
-                            # which informs _wild_comparison_multi function that it should not add a new key yet
-                            ignore_nonexistant = (
-                                True if last_wildcard == wildcard_indexes[-1] else False
-                            )
-                            if not self._wild_comparison_multi(
-                                multi_wildcard_value,
-                                root2.children[last_wildcard],
-                                ignore_nonexistant=ignore_nonexistant,
-                            ):
-                                # if we didn't reach the end of root1 yet, we move on and gather remaining elements
-                                if i < len(root1.children) - 1:
-                                    i += 1
-                                    continue
-                                return False
-                        multi_wildcard_value = []
-                        j += 1
-                    i += 1
-            if wildcard_indexes:
-                # after going through all of root1 we can add/check the last wildcard
-                last_wildcard = max([j for j in wildcard_indexes if j <= i])
-                if not self._wild_comparison_multi(
-                    multi_wildcard_value, root2.children[last_wildcard]
-                ):
+                operand_children = children[number]
+                if counted and child_counts[number] != child_count:
                     return False
-            self.last_location = root1.sloc_range
-            return True
-        return False
+                if len(operand_children) != size:
+                    return False  # the children are laid out differently
+                # the children are compared in parallel,
+                # pushed in reverse, so the first pair is compared first
+                stack.extend(zip(reversed(operand_children), reversed_steps))
+                return True
 
-    def is_subtree(self, tree: lal.AdaNode, subtree: lal.AdaNode) -> bool:
+        if pattern.singular or pattern.plural:
+            return self._wildcard_step(pattern, step)
+        pattern_hash = self._hashes[id(pattern)]
+        if pattern.children and pattern_hash is not None:
+            return self._hashed_step(pattern_hash, step)
+        return step
+
+    def _hashed_step(self, pattern_hash: int, verify: Step) -> Step:
         """
-        Checks whether one tree is a subtree of another tree
+        Wraps the step of a pattern subtree without wildcards, rejecting operand
+        nodes with a different structural hash right away. When the hashes are
+        equal the subtrees are still compared node by node, in case the hashes collide.
 
-        :param tree: The tree to be searched
-        :param subtree: The tree to be searched for
-        :return: True if subtree exists in the tree
-        :rtype: bool
+        :param pattern_hash: The structural hash of the pattern subtree
+        :param verify: The step comparing the subtrees node by node
+        :return: The step of the pattern subtree
         """
-        if subtree is None:
-            return True
-        if tree is None or not subtree.children:
-            return False
-        if self._are_identical(tree, subtree):
-            self.locations.append(_parse_sloc(self.last_location, self.wildcards))
+        hashes = self.index.hashes(self.case_insensitive)
+
+        def step(number, stack):
+            return (
+                number is not None
+                and hashes[number] == pattern_hash
+                and verify(number, stack)
+            )
+
+        return step
+
+    def _wildcard_step(self, pattern: PatternNode, fallback: Step) -> Step:
+        """
+        Wraps the step of a wildcard, binding it to the operand node or comparing
+        the node to its earlier binding. When that fails, the wildcard is
+        compared like any other node, using the fallback step.
+        A plural wildcard can also stand for a missing child, and is then bound to None.
+
+        :param pattern: The wildcard pattern node
+        :param fallback: The step comparing the wildcard as a regular node
+        :return: The step of the wildcard
+        """
+        name = pattern.name
+        key = pattern.text
+        plural = pattern.plural
+
+        def step(number, stack):
+            if number is None:
+                return plural and self._bind(name, key, None)
+            if self._bind(name, key, number):
+                return True
+            return fallback(number, stack)
+
+        return step
+
+    def _bind(self, name: str, key: str, number: Optional[int]) -> bool:
+        """
+        Binds a wildcard to a single operand node, or compares the node
+        to the earlier binding of the wildcard
+
+        :param name: The name of the wildcard
+        :param key: The text of the wildcard in the pattern
+        :param number: The number of the operand node, or None
+        :return: True if the wildcard was bound, or its binding is identical
+        """
+        bound = self.bindings.get(name)
+        if bound is None:
+            self.bindings[name] = (key, number)
             return True
-        for child in tree.children:
-            self.is_subtree(child, subtree)
-        self.wildcards = {}
-        return False
+        value = bound[1]
+        if isinstance(value, list):
+            # a list of nodes only equals a missing node if it is empty
+            return number is None and not value
+        return self._same_tree(value, number)
 
-    def _wild_comparison(
-        self, root1: Union[lal.AdaNode, None], root2: lal.AdaNode
+    def _bind_list(
+        self,
+        name: str,
+        key: str,
+        numbers: List[Optional[int]],
+        ignore_nonexistant: bool = False,
     ) -> bool:
-        for key in self.wildcards.keys():
-            if _ignore_semicolon_comparison(key, root2.text):
-                if self._are_identical(self.wildcards[key], root1):
-                    return True
+        """
+        Binds a plural wildcard to a list of operand nodes, or compares the list
+        to the earlier binding of the wildcard
+
+        :param name: The name of the wildcard
+        :param key: The text of the wildcard in the pattern
+        :param numbers: The numbers of the operand nodes
+        :param ignore_nonexistant: Do not bind the wildcard if it is not bound yet
+        :return: True if the wildcard was (or would be) bound, or its binding is identical
+        """
+        bound = self.bindings.get(name)
+        if bound is not None:
+            value = [] if bound[1] is None else bound[1]
+            return (
+                isinstance(value, list)
+                and len(value) == len(numbers)
+                and all(map(self._same_tree, value, numbers))
+            )
+        if not ignore_nonexistant:
+            self.bindings[name] = (key, numbers)
+        return True
+
+    def _same_tree(self, number1: Optional[int], number2: Optional[int]) -> bool:
+        """
+        Checks whether two operand subtrees are identical,
+        which is how a wildcard that occurs more than once is compared to its binding.
+
+        :param number1: The number of the root of the first subtree, or None
+        :param number2: The number of the root of the second subtree, or None
+        :return: True if the subtrees are identical
+        """
+        if number1 is None or number2 is None:
+            return number1 == number2
+        hashes = self.index.hashes(self.case_insensitive)
+        if hashes[number1] != hashes[number2]:
+            return False
+        # the hashes are equal, check that they did not collide
+        children = self.index.children
+        texts = self._texts
+        stack: List[Tuple[Optional[int], Optional[int]]] = [(number1, number2)]
+        while stack:
+            node1, node2 = stack.pop()
+            if node1 == node2:
+                continue  # the same node (or both None)
+            if node1 is None or node2 is None:
+                return False
+            children1 = children[node1]
+            children2 = children[node2]
+            if not children1 and not children2:
+                if texts[node1] != texts[node2]:
+                    return False
+            elif len(children1) != len(children2):
                 return False
-        self.wildcards[root2.text] = root1
+            else:
+                stack.extend(zip(children1, children2))
         return True
 
-    def _wild_comparison_multi(
-        self, multi: List, root2: lal.AdaNode, ignore_nonexistant=False
+    def _match_sequence(
+        self, elements: List[Optional[int]], sequence: "_ChildSequence"
     ) -> bool:
-        for key, value in self.wildcards.items():
-            if _ignore_semicolon_comparison(key, root2.text):
-                if isinstance(value, List) and len(value) == len(multi):
-                    if all(
-                        self._are_identical(value[i], multi[i])
-                        for i in range(len(multi))
-                    ):
-                        return True
+        """
+        Aligns the elements of an operand list to the children of a list pattern
+        with plural wildcards, every plural wildcard matching a run of elements.
+        Alignments are tried depth first, giving every plural wildcard as few
+        elements as possible, and the first alignment that matches is kept.
+        A position in the pattern and the list that failed is remembered together
+        with the bindings of the wildcards that occur in the rest of the pattern,
+        so it is never tried twice. A plural wildcard that does not occur in the
+        rest of the pattern also remembers from which element on its runs fail,
+        so each of its runs is only tried once, however the wildcards before it matched.
+
+        :param elements: The numbers of the children of the operand node
+        :param sequence: The children of the pattern node
+        :return: True if the elements match, with the wildcards bound accordingly
+        """
+        bindings = self.bindings
+        size = len(elements)
+        count = len(sequence.steps)
+        failed: Set[Tuple[int, int, Tuple[Any, ...]]] = set()
+        failed_from: Dict[Tuple[int, Tuple[Any, ...]], int] = {}
+        # the results of children without wildcards, which do not depend on the bindings
+        constant_results: Dict[Tuple[int, int], bool] = {}
+
+        def align(position: int, start: int) -> bool:
+            """Matches the children from position on to the elements from start on."""
+            if position == count:
+                return start == size
+            if size - start < sequence.needed[position]:
+                return False
+            state = self._binding_state(sequence.later[position])
+            if (position, start, state) in failed:
+                return False
+            saved = dict(bindings)
+            if not sequence.plural[position]:
+                number = elements[start]
+                step = sequence.steps[position]
+                if sequence.constant[position]:
+                    matched = constant_results.get((position, start))
+                    if matched is None:
+                        matched = self._run(number, step)
+                        constant_results[(position, start)] = matched
+                else:
+                    matched = self._run(number, step)
+                if matched and align(position + 1, start + 1):
+                    return True
+                self._restore(saved)
+                failed.add((position, start, state))
                 return False
-        if not ignore_nonexistant:
-            self.wildcards[root2.text] = multi
-        return True
 
+            name = sequence.names[position]
+            key = sequence.keys[position]
+            bound = bindings.get(name)
+            unique = bound is None and name not in sequence.later[position + 1]
+            last = size - sequence.needed[position + 1]
+            if unique:
+                # runs ending at or after an element from which the runs failed before fail too
+                last = min(last, failed_from.get((position, state), size + 1) - 1)
+            run: List[Optional[int]] = []
+            for end in range(start, last + 1):
+                if end > start and elements[end - 1] is not None:
+                    run.append(elements[end - 1])
+                if bound is not None:
+                    if not isinstance(bound[1], list) and bound[1] is not None:
+                        break  # a single node never equals a list of nodes
+                    length = len(bound[1] or [])
+                    if len(run) > length:
+                        break
+                    if len(run) < length or not self._bind_list(name, key, run):
+                        continue
+                else:
+                    # the run of a wildcard that occurs again has to be kept as it is
+                    bindings[name] = (key, run if unique else list(run))
+                if align(position + 1, end):
+                    return True
+                self._restore(saved)
+            if unique:
+                failed_from[(position, state)] = min(
+                    start, failed_from.get((position, state), start)
+                )
+            failed.add((position, start, state))
+            return False
 
-def _parse_sloc(sloc: str, wildcards: Dict[str, lal.AdaNode]) -> Location:
-    """Transforms sloc into Location type element
+        return align(0, 0)
 
-    :return: Location representing the input sloc
-    """
-    range_ = str(sloc).split("-")
-    [line1, pos1], [line2, pos2] = range_[0].split(":"), range_[1].split(":")
-    return Location(int(line1), int(line2), int(pos1), int(pos2), wildcards)
+    def _binding_state(self, names: Tuple[str, ...]) -> Tuple[Any, ...]:
+        """
+        Returns the bindings of some wildcards in a form that can be remembered
 
+        :param names: The names of the wildcards
+        :return: A tuple with the binding of every wildcard, None if it is not bound
+        """
+        state: List[Any] = []
+        for name in names:
+            bound = self.bindings.get(name)
+            if bound is not None and isinstance(bound[1], list):
+                state.append((bound[0], tuple(bound[1])))
+            else:
+                state.append(bound)
+        return tuple(state)
 
-def _text_comparison(text1: str, text2: str, case_insensitive: bool) -> bool:
+    def _restore(self, saved: Dict[str, Tuple[str, Binding]]):
+        """
+        Undoes the bindings made since saved was copied from the bindings.
+        Wildcards are only ever added to the bindings, so comparing the number
+        of bindings suffices to tell whether anything changed.
+
+        :param saved: The earlier copy of the bindings
+        """
+        if len(self.bindings) != len(saved):
+            self.bindings.clear()
+            self.bindings.update(saved)
+
+
+class _ChildSequence:
     """
-    Compares two strings.
-    Case sensitive if case_insensitive is false, case insensitive otherwise.
+    The children of a list pattern with plural wildcards among them,
+    as they are needed for aligning them to the elements of operand lists.
+
+    :param pattern: The list pattern node
+    :param steps: The compiled steps of the children of pattern
+    :param names: The names of the wildcards in every compiled pattern subtree, by id
+    """
+
+    steps: List[Step]
+    plural: List[bool]
+    # The name and the text of every plural wildcard, empty for other children
+    names: List[str]
+    keys: List[str]
+    # Whether a child contains no wildcards, so matching it never binds anything
+    constant: List[bool]
+    # The number of elements the children from a position on need at least
+    needed: List[int]
+    # The names of the wildcards in the children from a position on
+    later: List[Tuple[str, ...]]
+
+    def __init__(
+        self,
+        pattern: PatternNode,
+        steps: List[Step],
+        names: Dict[int, FrozenSet[str]],
+    ):
+        """Constructor method"""
+        self.steps = steps
+        self.plural = []
+        self.names = []
+        self.keys = []
+        self.constant = []
+        for child in pattern.children:
+            plural = child is not None and child.plural
+            self.plural.append(plural)
+            self.names.append(child.name if child is not None and plural else "")
+            self.keys.append(child.text if child is not None and plural else "")
+            self.constant.append(child is None or not names[id(child)])
+        size = len(pattern.children)
+        self.needed = [0] * (size + 1)
+        self.later = [()] * (size + 1)
+        later: Set[str] = set()
+        for position in reversed(range(size)):
+            child = pattern.children[position]
+            self.needed[position] = self.needed[position + 1] + (
+                not self.plural[position]
+            )
+            if child is not None:
+                later |= names[id(child)]
+            self.later[position] = tuple(sorted(later))
+
+
+def _match_none(
+    number: Optional[int], stack  # pylint: disable=unused-argument
+) -> bool:
+    """The step of a missing pattern child, which only matches a missing operand child."""
+    return number is None
+
+
+class SearchResult:
+    """Class used for searching a text in a file and storing its location.
+
+    :param case_insensitive: Flag conveying whether the search should be case insensitive
+    :type case_insensitive: bool, optional
     """
-    return text1 == text2 if not case_insensitive else text1.lower() == text2.lower()
 
+    locations: List[Location]
+    case_insensitive: bool
+    # The wildcards bound by the last match
+    wildcards: Dict[str, Wildcard]
+
+    def __init__(self, case_insensitive: bool):
+        """Constructor method"""
+        self.locations = []
+        self.case_insensitive = case_insensitive
+        self.wildcards = {}
+
+    def is_subtree(self, tree: lal.AdaNode, subtree: lal.AdaNode) -> bool:
+        """
+        Checks whether one tree is a subtree of another tree,
+        storing the locations of all matches in self.locations
+
+        :param tree: The tree to be searched
+        :param subtree: The tree to be searched for
+        :return: True if subtree exists in the tree
+        :rtype: bool
+        """
+        if subtree is None:
+            return True
+        found = False
+        for location in self.iter_subtree(tree, subtree):
+            self.locations.append(location)
+            found = True
+        return found
+
+    def iter_subtree(
+        self,
+        tree: lal.AdaNode,
+        subtree: Union[lal.AdaNode, PatternNode],
+        index: Optional[NodeIndex] = None,
+        nodes: Optional[Iterable[int]] = None,
+    ) -> Iterator[Location]:
+        """
+        Yields the location of every node in the tree that matches subtree, in pre-order.
+        The descendants of a matching node are not searched any further.
+        Only nodes of the same kind as the root of subtree are compared,
+        unless that root is a wildcard, which can match a node of any kind.
+        Every candidate node starts with a clean set of wildcards,
+        so each location gets its own wildcard dictionary.
+
+        :param tree: The tree to be searched
+        :param subtree: The tree to be searched for, or its compiled pattern
+        :param index: The node index of tree, built on the fly if not supplied
+        :param nodes: The numbers of the nodes of tree to search at, in pre-order,
+                defaults to all nodes
+        :return: An iterator over the locations where subtree exists in the tree
+        """
+        if subtree is None or tree is None or not subtree.children:
+            return
+        pattern = (
+            subtree if isinstance(subtree, PatternNode) else compile_pattern(subtree)
+        )
+        if index is None:
+            index = NodeIndex(tree)
+        matcher = Matcher(pattern, index, self.case_insensitive)
+        root_kind: Optional[str] = pattern.kind_name
+        if is_wildcard(pattern.text):
+            root_kind = None
+        candidates: Iterable[int] = index.candidates(root_kind)
+        if nodes is not None:
+            candidates = [
+                number
+                for number in nodes
+                if root_kind is None or index.nodes[number].kind_name == root_kind
+            ]
+        skip_until = 0
+        for candidate in candidates:
+            if candidate < skip_until:
+                continue  # the candidate lies inside an earlier match
+            if matcher.match(candidate):
+                location = index.location(candidate, matcher.wildcards())
+                self.wildcards = dict(location.wildcards)
+                yield location
+                skip_until = index.ends[candidate]
 
-def _ignore_semicolon_comparison(text1: str, text2: str) -> bool:
+
+def is_wildcard(text: str) -> bool:
     """
-    Compares two strings, ignoring the trailing semicolon
+    Checks whether a string is a singular or a plural wildcard
     """
-    return text1.rstrip(";") == text2.rstrip(";")
+    return _is_singular_wildcard(text) or _is_plural_wildcard(text)
+
+
+_SINGULAR_WILDCARD = re.compile(r"^\$S_[A-Za-z_]+[0-9]*(;)?$")
+_PLURAL_WILDCARD = re.compile(r"^\$M_[A-Za-z_]+[0-9]*(;)?$")
 
 
 def _is_singular_wildcard(text: str) -> bool:
     """
     Checks whether a string is a singular wildcard
     """
-    return bool(re.search("^\$S_[A-Za-z_]+[0-9]*(;)?$", text))
+    return bool(_SINGULAR_WILDCARD.search(text))
 
 
 def _is_plural_wildcard(text: str) -> bool:
     """
     Checks whether a string is a plural wildcard
     """
-    return bool(re.search("^\$M_[A-Za-z_]+[0-9]*(;)?$", text))
+    return bool(_PLURAL_WILDCARD.search(text))
 
 
-def _strip_from_wildcards(root: lal.AdaNode) -> lal.AdaNode:
-    new_children = [
-        i for i in root.children if not i.text or not _is_plural_wildcard(i.text)
-    ]
-    return new_children
+def find_wildcards(root: lal.AdaNode) -> Tuple[List[str], List[str]]:
+    """
+    Collects the names of the wildcards used in a pattern, in order of appearance
+
+    :param root: The root of the pattern tree
+    :return: A tuple with the names of the singular and of the plural wildcards
+    """
+    singular: List[str] = []
+    plural: List[str] = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            continue
+        if node.text:
+            name = node.text.rstrip(";")
+            if _is_singular_wildcard(node.text) and name not in singular:
+                singular.append(name)
+            elif _is_plural_wildcard(node.text) and name not in plural:
+                plural.append(name)
+        stack.extend(reversed(node.children))
+    return singular, plural
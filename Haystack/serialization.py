@@ -0,0 +1,401 @@
+"""
+This module serialises search results, so they can be stored on disk or sent to
+another process. Results are grouped per file in FileResults, which hold the
+locations found in a file together with the identity of the file: its path and
+a hash of its contents, so a reader can tell whether the results still apply.
+Two versioned formats are supported:
+
+* JSON Lines, for interoperability: a header line naming the format and version,
+  followed by one line per file.
+* A packed binary form, for size and speed: integers are written as variable-length
+  numbers, and every distinct string (paths, kind names, wildcard names and texts)
+  is written once and referred to by number afterwards.
+"""
+
+import hashlib
+import json
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from Haystack import exceptions
+from Haystack.location import Capture, Location, Wildcard
+
+FORMAT_VERSION = 1
+JSONL_FORMAT = "haystack-results"
+BINARY_MAGIC = b"HAYSTACK"
+
+
+class FileResults:
+    """
+    The locations found in a single file, with the identity of the file.
+
+    :param filepath: The filepath of the file that was searched
+    :param locations: The locations found in the file
+    :param digest: The SHA-1 hash of the contents of the file when it was searched,
+            None if unknown
+    """
+
+    filepath: str
+    locations: List[Location]
+    digest: Optional[str]
+
+    def __init__(
+        self, filepath: str, locations: List[Location], digest: Optional[str] = None
+    ):
+        """Constructor method"""
+        self.filepath = filepath
+        self.locations = locations
+        self.digest = digest
+
+    def __repr__(self) -> str:
+        return "FileResults(" + repr(self.filepath) + ", " + repr(self.locations) + ")"
+
+    def is_current(self) -> bool:
+        """
+        Checks whether the file still has the contents it was searched with
+
+        :return: False if the file changed, is gone, or the digest is unknown
+        """
+        try:
+            return self.digest is not None and file_digest(self.filepath) == self.digest
+        except OSError:
+            return False
+
+
+def file_digest(filepath: str) -> str:
+    """
+    Hashes the contents of a file, with the hash the unit cache compares
+
+    :param filepath: The filepath of the file
+    :return: The hexadecimal SHA-1 hash of the contents
+    """
+    with open(filepath, "rb") as infile:
+        return content_digest(infile.read())
+
+
+def content_digest(data: bytes) -> str:
+    """
+    Hashes the contents of a file
+
+    :param data: The contents of the file
+    :return: The hexadecimal SHA-1 hash of the contents
+    """
+    return hashlib.sha1(data).hexdigest()
+
+
+def write_jsonl(results: Iterable[FileResults], outfile: IO[str]):
+    """
+    Writes results as JSON Lines
+
+    :param results: The results to write, one file at a time
+    :param outfile: The text file to write to
+    """
+    header = {"format": JSONL_FORMAT, "version": FORMAT_VERSION}
+    outfile.write(json.dumps(header) + "\n")
+    for result in results:
+        record = {
+            "path": result.filepath,
+            "digest": result.digest,
+            "locations": [_location_to_json(location) for location in result.locations],
+        }
+        outfile.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def read_jsonl(infile: IO[str]) -> Iterator[FileResults]:
+    """
+    Reads results written by write_jsonl
+
+    :param infile: The text file to read from
+    :return: An iterator over the results, one file at a time
+    """
+    try:
+        header = json.loads(infile.readline())
+        if header.get("format") != JSONL_FORMAT:
+            raise exceptions.ResultFormatException("not a result file")
+        if header.get("version") != FORMAT_VERSION:
+            raise exceptions.ResultFormatException(
+                "unsupported version " + str(header.get("version"))
+            )
+        for line in infile:
+            if line.strip():
+                record = json.loads(line)
+                yield FileResults(
+                    record["path"],
+                    [_location_from_json(entry) for entry in record["locations"]],
+                    record["digest"],
+                )
+    except (ValueError, KeyError, TypeError, AttributeError) as error:
+        raise exceptions.ResultFormatException(str(error)) from error
+
+
+def _location_to_json(location: Location) -> Dict[str, Any]:
+    """Turns a location into a JSON object."""
+    return {
+        "range": [
+            location.start_line,
+            location.start_char,
+            location.end_line,
+            location.end_char,
+        ],
+        "offsets": _offsets_to_json(location.start, location.end),
+        "kind": location.kind,
+        "wildcards": {
+            key: _wildcard_to_json(value) for key, value in location.wildcards.items()
+        },
+    }
+
+
+def _location_from_json(entry: Dict[str, Any]) -> Location:
+    """Turns a JSON object written by _location_to_json back into a location."""
+    start_line, start_char, end_line, end_char = entry["range"]
+    start, end = entry["offsets"] or (None, None)
+    wildcards = {
+        key: _wildcard_from_json(value) for key, value in entry["wildcards"].items()
+    }
+    return Location(
+        start_line, end_line, start_char, end_char, wildcards, start, end, entry["kind"]
+    )
+
+
+def _wildcard_to_json(value: Wildcard) -> Any:
+    """Turns what a wildcard matched into JSON: an object, a list of objects, or null."""
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return [_wildcard_to_json(capture) for capture in value]
+    return {
+        "text": value.text,
+        "offsets": _offsets_to_json(value.start, value.end),
+        "kind": value.kind,
+    }
+
+
+def _wildcard_from_json(value: Any) -> Wildcard:
+    """Turns JSON written by _wildcard_to_json back into what a wildcard matched."""
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return [Capture(*_capture_fields(capture)) for capture in value]
+    return Capture(*_capture_fields(value))
+
+
+def _capture_fields(
+    value: Dict[str, Any],
+) -> Tuple[str, Optional[int], Optional[int], Optional[str]]:
+    """Returns the constructor arguments of a capture from its JSON object."""
+    start, end = value["offsets"] or (None, None)
+    return value["text"], start, end, value["kind"]
+
+
+def _offsets_to_json(start: Optional[int], end: Optional[int]) -> Optional[List[int]]:
+    """Returns the offsets as a pair, or None if they are unknown."""
+    if start is None or end is None:
+        return None
+    return [start, end]
+
+
+def to_binary(results: Iterable[FileResults]) -> bytes:
+    """
+    Packs results into the binary form
+
+    :param results: The results to pack
+    :return: The packed results
+    """
+    writer = _Writer()
+    writer.data += BINARY_MAGIC
+    writer.number(FORMAT_VERSION)
+    for result in results:
+        writer.string(result.filepath)
+        writer.string(result.digest)
+        writer.number(len(result.locations))
+        for location in result.locations:
+            writer.location(location)
+    return bytes(writer.data)
+
+
+def from_binary(data: bytes) -> List[FileResults]:
+    """
+    Unpacks results packed by to_binary
+
+    :param data: The packed results
+    :return: The results
+    """
+    if not data.startswith(BINARY_MAGIC):
+        raise exceptions.ResultFormatException("not a result file")
+    reader = _Reader(data, len(BINARY_MAGIC))
+    results: List[FileResults] = []
+    try:
+        version = reader.number()
+        if version != FORMAT_VERSION:
+            raise exceptions.ResultFormatException(
+                "unsupported version " + str(version)
+            )
+        while reader.position < len(data):
+            filepath = reader.text()
+            digest = reader.string()
+            locations = [reader.location() for _ in range(reader.number())]
+            results.append(FileResults(filepath, locations, digest))
+    except (IndexError, UnicodeDecodeError, TypeError) as error:
+        raise exceptions.ResultFormatException("truncated or corrupt data") from error
+    return results
+
+
+class _Writer:
+    """
+    Writes the binary form. Numbers are written seven bits per byte, least significant
+    first, with the high bit set on all but the last byte. A string is written as
+    0 for None, 1 followed by its length and UTF-8 bytes the first time it occurs,
+    and 2 plus its number in the order of first occurrence afterwards.
+    """
+
+    data: bytearray
+    strings: Dict[str, int]
+
+    def __init__(self):
+        """Constructor method"""
+        self.data = bytearray()
+        self.strings = {}
+
+    def number(self, value: int):
+        """Writes a non-negative integer."""
+        while value >= 0x80:
+            self.data.append((value & 0x7F) | 0x80)
+            value >>= 7
+        self.data.append(value)
+
+    def string(self, value: Optional[str]):
+        """Writes a string that may be None."""
+        if value is None:
+            self.number(0)
+            return
+        number = self.strings.get(value)
+        if number is not None:
+            self.number(number + 2)
+            return
+        self.strings[value] = len(self.strings)
+        encoded = value.encode("UTF-8", errors="surrogatepass")
+        self.number(1)
+        self.number(len(encoded))
+        self.data += encoded
+
+    def offsets(self, start: Optional[int], end: Optional[int]):
+        """Writes a pair of offsets that may be unknown, the end relative to the start."""
+        if start is None or end is None:
+            self.number(0)
+        else:
+            self.number(start + 1)
+            self.number(end - start)
+
+    def location(self, location: Location):
+        """Writes a location, the end line relative to the start line."""
+        self.number(location.start_line)
+        self.number(location.start_char)
+        self.number(location.end_line - location.start_line)
+        self.number(location.end_char)
+        self.offsets(location.start, location.end)
+        self.string(location.kind)
+        self.number(len(location.wildcards))
+        for key, value in location.wildcards.items():
+            self.string(key)
+            # 0 for no match, 1 for a capture, 2 plus the number of captures for a list
+            if value is None:
+                self.number(0)
+            elif isinstance(value, list):
+                self.number(len(value) + 2)
+                for capture in value:
+                    self.capture(capture)
+            else:
+                self.number(1)
+                self.capture(value)
+
+    def capture(self, capture: Capture):
+        """Writes what a wildcard captured."""
+        self.string(capture.text)
+        self.offsets(capture.start, capture.end)
+        self.string(capture.kind)
+
+
+class _Reader:
+    """Reads the binary form written by _Writer."""
+
+    data: bytes
+    position: int
+    strings: List[str]
+
+    def __init__(self, data: bytes, position: int):
+        """Constructor method"""
+        self.data = data
+        self.position = position
+        self.strings = []
+
+    def number(self) -> int:
+        """Reads a non-negative integer."""
+        byte = self.data[self.position]
+        self.position += 1
+        if byte < 0x80:
+            return byte  # most numbers fit in a single byte
+        value = byte & 0x7F
+        shift = 7
+        while True:
+            byte = self.data[self.position]
+            self.position += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def string(self) -> Optional[str]:
+        """Reads a string that may be None."""
+        number = self.number()
+        if number == 0:
+            return None
+        if number >= 2:
+            return self.strings[number - 2]
+        length = self.number()
+        end = self.position + length
+        if end > len(self.data):
+            raise IndexError("string runs past the end of the data")
+        value = self.data[self.position : end].decode("UTF-8", errors="surrogatepass")
+        self.position = end
+        self.strings.append(value)
+        return value
+
+    def text(self) -> str:
+        """Reads a string that may not be None."""
+        value = self.string()
+        if value is None:
+            raise TypeError("missing string")
+        return value
+
+    def offsets(self) -> Tuple[Optional[int], Optional[int]]:
+        """Reads a pair of offsets that may be unknown."""
+        start = self.number()
+        if start == 0:
+            return None, None
+        return start - 1, start - 1 + self.number()
+
+    def location(self) -> Location:
+        """Reads a location."""
+        start_line = self.number()
+        start_char = self.number()
+        end_line = start_line + self.number()
+        end_char = self.number()
+        start, end = self.offsets()
+        kind = self.string()
+        wildcards: Dict[str, Wildcard] = {}
+        for _ in range(self.number()):
+            key = self.text()
+            tag = self.number()
+            if tag == 0:
+                wildcards[key] = None
+            elif tag == 1:
+                wildcards[key] = self.capture()
+            else:
+                wildcards[key] = [self.capture() for _ in range(tag - 2)]
+        return Location(
+            start_line, end_line, start_char, end_char, wildcards, start, end, kind
+        )
+
+    def capture(self) -> Capture:
+        """Reads what a wildcard captured."""
+        text = self.text()
+        start, end = self.offsets()
+        return Capture(text, start, end, self.string())
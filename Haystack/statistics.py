@@ -0,0 +1,65 @@
+"""
+This module defines the SearchStatistics data structure,
+which keeps track of how much work a search operation did.
+"""
+
+
+class SearchStatistics:
+    """
+    This class counts the files a search operation looked at,
+    and how many of them could be skipped without parsing them,
+    either because the prefilter rejected them or their results were cached.
+    """
+
+    files_searched: int
+    files_rejected: int
+    files_cached: int
+    files_unparsable: int
+    matches: int
+
+    def __init__(self):
+        self.files_searched = 0
+        self.files_rejected = 0
+        self.files_cached = 0
+        self.files_unparsable = 0
+        self.matches = 0
+
+    @property
+    def files_parsed(self) -> int:
+        """The number of files that had to be parsed."""
+        return self.files_searched - self.files_rejected - self.files_cached
+
+    @property
+    def rejection_rate(self) -> float:
+        """The fraction of the searched files that were skipped without parsing them."""
+        if not self.files_searched:
+            return 0.0
+        return self.files_rejected / self.files_searched
+
+    def merge(self, other: "SearchStatistics"):
+        """
+        Adds the counts of another search operation to these statistics
+
+        :param other: The statistics to add
+        """
+        self.files_searched += other.files_searched
+        self.files_rejected += other.files_rejected
+        self.files_cached += other.files_cached
+        self.files_unparsable += other.files_unparsable
+        self.matches += other.matches
+
+    def __repr__(self) -> str:
+        return (
+            str(self.files_searched)
+            + " files searched, "
+            + str(self.files_rejected)
+            + " rejected without parsing ("
+            + format(self.rejection_rate, ".1%")
+            + "), "
+            + str(self.files_cached)
+            + " cached, "
+            + str(self.files_unparsable)
+            + " unparsable, "
+            + str(self.matches)
+            + " matches"
+        )
@@ -0,0 +1,236 @@
+"""
+This module caches the analysis units of parsed operand files.
+Interactive sessions search the same files over and over again,
+so instead of reparsing a file for every query, its analysis unit is kept
+in a least recently used cache until the file changes on disk.
+Every cached unit is parsed in an analysis context of its own, rather than in a
+pooled context that holds many other units, so evicting a file frees its parse tree.
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import libadalang as lal  # type: ignore
+from Haystack import searchresult as sr
+
+DEFAULT_MAX_ENTRIES = 64
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class CachedUnit:
+    """
+    A parsed file, together with the data needed to check whether it is still up to date.
+
+    :param key: The size, modification time and (optional) content hash of the file
+    :param data: The contents of the file at the time it was parsed
+    :param unit: The analysis unit containing the parse tree of data
+    """
+
+    key: Tuple[int, int, Optional[str]]
+    data: bytes
+    unit: lal.AnalysisUnit
+    index: Optional[sr.NodeIndex]
+
+    def __init__(
+        self, key: Tuple[int, int, Optional[str]], data: bytes, unit: lal.AnalysisUnit
+    ):
+        """Constructor method"""
+        self.key = key
+        self.data = data
+        self.unit = unit
+        self.index = None
+
+    def node_index(self) -> sr.NodeIndex:
+        """
+        Returns the node index of the parse tree, building it on first use,
+        so that every search in this file shares the same index.
+        """
+        if self.index is None:
+            self.index = sr.NodeIndex(self.unit.root)
+        return self.index
+
+    def lines(self) -> List[str]:
+        """
+        Returns the contents of the file as a list of lines,
+        exactly like reading the file in text mode would.
+        """
+        return io.StringIO(self.data.decode("UTF-8"), newline=None).readlines()
+
+
+class UnitCache:
+    """
+    A least recently used cache of parsed files, keyed by filepath.
+    An entry is only reused while the size and modification time of the file
+    (and, if content_hash is set, a hash of its contents) are unchanged.
+    An entry is the only owner of its analysis context, so the memory of the parse
+    trees in the cache is bounded by the budget, in proportion to the file sizes.
+
+    :param max_entries: The maximum number of files kept in the cache
+    :param max_bytes: The maximum total size of the files kept in the cache
+    :param content_hash: Whether to also compare a hash of the file contents,
+                        which requires reading the file on every lookup
+    """
+
+    max_entries: int
+    max_bytes: int
+    content_hash: bool
+    hits: int
+    misses: int
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        content_hash: bool = False,
+    ):
+        """Constructor method"""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.content_hash = content_hash
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, CachedUnit]" = OrderedDict()
+        self._bytes = 0
+
+    def contents(self, filepath: str) -> bytes:
+        """
+        Returns the contents of the file at location filepath, taken from the cache
+        while the cached file is unchanged, so a file that is checked before it is
+        parsed is not read from disk twice.
+
+        :param filepath: The filepath of the file to read
+        :return: The contents of the file
+        """
+        filepath = os.path.abspath(filepath)
+        entry = self._entries.get(filepath)
+        if entry is not None and not self.content_hash:
+            stat = os.stat(filepath)
+            if entry.key == (stat.st_size, stat.st_mtime_ns, None):
+                return entry.data
+        return _read(filepath)
+
+    def get(self, filepath: str, data: Optional[bytes] = None) -> CachedUnit:
+        """
+        Returns the parsed file at location filepath,
+        parsing it only when it is not cached or has changed since it was cached.
+
+        :param filepath: The filepath of the file to parse
+        :param data: The contents of the file, when they were already read,
+                    as returned by contents
+        :return: The cache entry of the file
+        """
+        filepath = os.path.abspath(filepath)
+        stat = os.stat(filepath)
+        digest = None
+        if self.content_hash:
+            if data is None:
+                data = _read(filepath)
+            digest = hashlib.sha1(data).hexdigest()
+        key = (stat.st_size, stat.st_mtime_ns, digest)
+
+        entry = self._entries.get(filepath)
+        if entry is not None and entry.key == key:
+            self._entries.move_to_end(filepath)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        self.invalidate(filepath)
+        if data is None:
+            data = _read(filepath)
+        unit = lal.AnalysisContext().get_from_buffer(filepath, data)
+        entry = CachedUnit(key, data, unit)
+        self._entries[filepath] = entry
+        self._bytes += len(data)
+        self._evict()
+        return entry
+
+    def invalidate(self, filepath: str):
+        """
+        Removes a file from the cache
+
+        :param filepath: The filepath of the file to remove
+        """
+        entry = self._entries.pop(os.path.abspath(filepath), None)
+        if entry is not None:
+            self._bytes -= len(entry.data)
+
+    def clear(self):
+        """Removes all files from the cache."""
+        self._entries.clear()
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self):
+        """Evicts the least recently used files until the cache is within its budget."""
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= len(entry.data)
+
+
+def _read(filepath: str) -> bytes:
+    """Reads the contents of a file."""
+    with open(filepath, "rb") as infile:
+        return infile.read()
+
+
+_LOCAL = threading.local()
+_SETTINGS = {
+    "max_entries": DEFAULT_MAX_ENTRIES,
+    "max_bytes": DEFAULT_MAX_BYTES,
+    "content_hash": False,
+}
+
+
+def get_cache() -> UnitCache:
+    """
+    Returns the unit cache of the current thread.
+    Analysis units may not be shared between threads, so every thread
+    (and every forked process) gets a cache of its own.
+    """
+    cache = getattr(_LOCAL, "cache", None)
+    if cache is None or _LOCAL.pid != os.getpid():
+        cache = UnitCache(
+            int(_SETTINGS["max_entries"]),
+            int(_SETTINGS["max_bytes"]),
+            bool(_SETTINGS["content_hash"]),
+        )
+        _LOCAL.cache = cache
+        _LOCAL.pid = os.getpid()
+    return cache
+
+
+def configure(
+    max_entries: int = DEFAULT_MAX_ENTRIES,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+    content_hash: bool = False,
+):
+    """
+    Changes the budget of the unit caches.
+    The cache of the current thread is emptied, other threads keep
+    their current cache until they are restarted.
+
+    :param max_entries: The maximum number of files kept in a cache
+    :param max_bytes: The maximum total size of the files kept in a cache
+    :param content_hash: Whether to also compare a hash of the file contents
+    """
+    _SETTINGS["max_entries"] = max_entries
+    _SETTINGS["max_bytes"] = max_bytes
+    _SETTINGS["content_hash"] = content_hash
+    _LOCAL.cache = None
+
+
+def invalidate(filepath: str):
+    """
+    Removes a file from the unit cache of the current thread,
+    typically because it was just written to.
+
+    :param filepath: The filepath of the file to remove
+    """
+    get_cache().invalidate(filepath)
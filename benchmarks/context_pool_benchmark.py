@@ -0,0 +1,83 @@
+"""
+Benchmark for the analysis context pool.
+The test programs are copied a number of times into a temporary directory and searched
+file by file, once with a fresh context for every parse (the old behaviour, a pool of
+size 1) and once with the shared context pool.
+The per-file overhead of both runs is printed.
+
+Usage: python -m benchmarks.context_pool_benchmark [--copies N] [--pool-size N]
+"""
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+import time
+from typing import List
+import libadalang as lal  # type: ignore
+from Haystack import api
+from Haystack import contextpool
+
+TEST_PROGRAMS = os.path.join(os.path.dirname(__file__), "..", "tests", "test_programs")
+
+
+def scale_corpus(directory: str, copies: int) -> List[str]:
+    """
+    Copies every test program `copies` times into directory
+
+    :param directory: The directory to copy the test programs to
+    :param copies: The number of copies to make of every test program
+    :return: The filepaths of all copies
+    """
+    filepaths = []
+    for source in sorted(glob.glob(os.path.join(TEST_PROGRAMS, "*.adb"))):
+        name = os.path.splitext(os.path.basename(source))[0]
+        for copy in range(copies):
+            filepath = os.path.join(directory, name + "_" + str(copy) + ".adb")
+            shutil.copyfile(source, filepath)
+            filepaths.append(filepath)
+    return filepaths
+
+
+def time_search(filepaths: List[str], pool_size: int) -> float:
+    """
+    Searches every file once and returns the average time spent per file
+
+    :param filepaths: The files to search
+    :param pool_size: The size of the context pool used for the search
+    :return: The average number of seconds spent per file
+    """
+    contextpool.set_pool_size(pool_size)
+    start = time.perf_counter()
+    for filepath in filepaths:
+        try:
+            api.findall_file("Put ($S_expr)", filepath, lal.GrammarRule.expr_rule)
+        except Exception:  # pylint: disable=broad-except
+            # Files that fail to parse still count towards the parse overhead
+            pass
+    return (time.perf_counter() - start) / len(filepaths)
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--copies", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=contextpool.DEFAULT_POOL_SIZE)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        filepaths = scale_corpus(directory, args.copies)
+        before = time_search(filepaths, 1)
+        after = time_search(filepaths, args.pool_size)
+    finally:
+        shutil.rmtree(directory)
+        contextpool.set_pool_size(contextpool.DEFAULT_POOL_SIZE)
+
+    print("files searched:            ", len(filepaths))
+    print("fresh context per parse:    %.3f ms/file" % (before * 1000))
+    print("pooled contexts (size %d): %.3f ms/file" % (args.pool_size, after * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark for comparing deep trees.
+Assignments of a deeply nested call are searched with a pattern that is just
+as deeply nested, once with the original recursive comparison and once with
+the explicit stack comparison of SearchResult. The recursive comparison fails
+with a RecursionError once the nesting gets deeper than the Python recursion
+limit allows.
+
+Usage: python -m benchmarks.deep_tree_benchmark [--depths N ...] [--repeat N]
+"""
+import argparse
+import sys
+import time
+from typing import Iterable, Iterator, Optional
+import libadalang as lal  # type: ignore
+from Haystack import searchresult as sr
+from Haystack import contextpool
+
+
+class RecursiveSearchResult(sr.SearchResult):
+    """
+    SearchResult comparing trees recursively, the way it used to, for reference.
+    Only singular wildcards are supported, which is all this benchmark uses.
+    """
+
+    def iter_subtree(
+        self,
+        tree: lal.AdaNode,
+        subtree: lal.AdaNode,
+        index: Optional[sr.NodeIndex] = None,
+        nodes: Optional[Iterable[int]] = None,
+    ) -> Iterator[lal.AdaNode]:
+        pattern = sr.compile_pattern(subtree)
+        index = sr.NodeIndex(tree) if index is None else index
+        for candidate in index.candidates(pattern.kind_name):
+            self.wildcards = {}
+            if self._are_identical(index.nodes[candidate], pattern):
+                yield index.nodes[candidate]
+
+    def _are_identical(
+        self, root1: Optional[lal.AdaNode], root2: Optional[sr.PatternNode]
+    ) -> bool:
+        if root1 is None or root2 is None:
+            return root1 is None and root2 is None
+        if root2.singular:
+            self.wildcards[root2.text] = root1
+            return True
+        if not root2.children:
+            return not root1.children and root1.text == root2.text
+        return len(root1.children) == len(root2.children) and all(
+            self._are_identical(child1, child2)
+            for child1, child2 in zip(root1.children, root2.children)
+        )
+
+
+def nested_assignment(depth: int, argument: str, value: str) -> str:
+    """
+    Generates an assignment to a call nested depth times
+
+    :param depth: The nesting depth of the call
+    :param argument: The argument of the innermost call
+    :param value: The value that is assigned
+    :return: The text of the assignment
+    """
+    return "X (" * depth + argument + ")" * depth + " := " + value + ";"
+
+
+def time_search(
+    search_result: sr.SearchResult,
+    pattern: lal.AdaNode,
+    operand: lal.AdaNode,
+    repeat: int,
+) -> Optional[float]:
+    """
+    Searches operand for pattern repeat times
+
+    :param search_result: The search engine to use
+    :param pattern: The parse tree to search for
+    :param operand: The parse tree to search in
+    :param repeat: The number of times to repeat the search
+    :return: The average number of seconds per search, or None on a RecursionError
+    """
+    start = time.perf_counter()
+    try:
+        for _ in range(repeat):
+            matches = list(search_result.iter_subtree(operand, pattern))
+            assert len(matches) == 1
+    except RecursionError:
+        return None
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--depths", type=int, nargs="+", default=[10, 100, 250, 1000, 5000]
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    pool = contextpool.get_pool()
+    print("recursion limit:", sys.getrecursionlimit())
+    print("%8s %16s %16s" % ("depth", "recursive", "explicit stack"))
+    for depth in args.depths:
+        pattern = pool.parse_buffer(
+            nested_assignment(depth, "$S_Argument", "$S_Value"),
+            lal.GrammarRule.stmt_rule,
+        ).root
+        unit = pool.parse_buffer(
+            nested_assignment(depth, "0", "1"), lal.GrammarRule.stmt_rule
+        )
+        timings = [
+            time_search(engine, pattern, unit.root, args.repeat)
+            for engine in (RecursiveSearchResult(False), sr.SearchResult(False))
+        ]
+        print(
+            "%8d %16s %16s"
+            % tuple(
+                [depth]
+                + [
+                    "RecursionError" if timing is None else "%.3f ms" % (timing * 1000)
+                    for timing in timings
+                ]
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark for dry-run substitutions.
+The test programs are copied a number of times into a temporary directory, parsed
+once to fill the unit cache, and then searched for a pattern, once returning only
+the matches and once returning the patch a substitution would apply. The patches are
+built from the matches and the cached contents of the files, so generating them
+should cost little more than the search itself.
+
+Usage: python -m benchmarks.diff_benchmark [--copies N]
+"""
+import argparse
+import shutil
+import tempfile
+import time
+import libadalang as lal  # type: ignore
+from Haystack import api
+from Haystack import unitcache
+from benchmarks.context_pool_benchmark import scale_corpus
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--copies", type=int, default=200)
+    args = parser.parse_args()
+
+    pattern = api.compile("Put ($S_expr)", lal.GrammarRule.expr_rule)
+    directory = tempfile.mkdtemp()
+    try:
+        filepaths = scale_corpus(directory, args.copies)
+        unitcache.configure(max_entries=len(filepaths), max_bytes=2**31)
+        filepaths = [path for path in filepaths if _parses(pattern, path)]
+        start = time.perf_counter()
+        matches = sum(len(pattern.findall_file(path)) for path in filepaths)
+        search = time.perf_counter() - start
+        start = time.perf_counter()
+        patches = [pattern.diff_file(path, "Put_Line ($S_expr)") for path in filepaths]
+        diff = time.perf_counter() - start
+    finally:
+        shutil.rmtree(directory)
+        unitcache.configure()
+
+    print("files:       ", len(filepaths))
+    print("matches:     ", matches)
+    print("patch lines: ", sum(len(str(patch).splitlines()) for patch in patches))
+    print("search:       %.3f ms/file" % (search * 1000 / len(filepaths)))
+    print("dry run:      %.3f ms/file" % (diff * 1000 / len(filepaths)))
+
+
+def _parses(pattern: api.Pattern, filepath: str) -> bool:
+    """Parses a file into the unit cache, and tells whether it parsed."""
+    try:
+        pattern.findall_file(filepath)
+    except Exception:  # pylint: disable=broad-except
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    main()
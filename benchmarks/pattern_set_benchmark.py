@@ -0,0 +1,81 @@
+"""
+Benchmark for searching many patterns at once.
+A catalogue of N rewrite rules is searched for in the test programs, once by
+searching for every rule separately, which walks every tree N times, and once
+with a pattern set, which walks every tree once through its discrimination net.
+The trees are parsed and indexed beforehand, so only the searching is timed.
+
+Usage: python -m benchmarks.pattern_set_benchmark [--rules N ...] [--repeat N]
+"""
+import argparse
+import glob
+import time
+from typing import List
+import libadalang as lal  # type: ignore
+from Haystack import api
+from Haystack import searchresult as sr
+
+TEMPLATES = [
+    "not (not $S_Cond)",
+    "not ($S_Left = {})",
+    "not ($S_Left /= {})",
+    "$S_X + {}",
+    "Put ({})",
+    "Put_Line ({})",
+    "$S_Var = {} or else $S_Var = $S_Val",
+]
+
+
+def make_rules(count: int) -> List[str]:
+    """
+    Generates a catalogue of rules from the templates
+
+    :param count: The number of rules
+    :return: The search queries of the rules
+    """
+    return [
+        TEMPLATES[number % len(TEMPLATES)].format(number) for number in range(count)
+    ]
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rules", type=int, nargs="+", default=[1, 10, 50, 100, 200])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    units = [api._analyze_file(path) for path in glob.glob("tests/test_programs/*.adb")]
+    indexes = [sr.NodeIndex(unit.root) for unit in units]
+    print("%8s %16s %16s %8s" % ("rules", "separately", "pattern set", "matches"))
+    for count in args.rules:
+        patterns = api.compile_set(make_rules(count), lal.GrammarRule.expr_rule)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            separate = 0
+            for unit, index in zip(units, indexes):
+                for pattern in patterns.patterns:
+                    separate += len(
+                        sr.execute_search(pattern.tree, unit.root, False, index)
+                    )
+        separately = (time.perf_counter() - start) / args.repeat
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            together = 0
+            for unit, index in zip(units, indexes):
+                together += len(list(patterns.net.iter_search(unit.root, index)))
+        at_once = (time.perf_counter() - start) / args.repeat
+        assert separate == together
+        print(
+            "%8d %16s %16s %8d"
+            % (
+                count,
+                "%.3f ms" % (separately * 1000),
+                "%.3f ms" % (at_once * 1000),
+                together,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark for matching plural wildcards in long statement lists.
+Adversarial patterns such as "$M_A; X; $M_B; X; $M_C; Y;" are matched against
+lists of n statements that almost match, once by plain backtracking over all
+runs of the plural wildcards and once by the memoised alignment of the Matcher.
+Plain backtracking tries every combination of runs, which takes time polynomial
+in n with the number of plural wildcards as the exponent, while the memoised
+alignment tries every position in the pattern and the list only once.
+
+Usage: python -m benchmarks.plural_wildcard_benchmark [--lengths N ...] [--repeat N]
+"""
+import argparse
+import time
+from typing import List, Optional
+import libadalang as lal  # type: ignore
+from Haystack import searchresult as sr
+from Haystack import contextpool
+
+# Patterns and the statements of the lists they are matched against:
+# the statement repeated n times, followed by the last statement
+CASES = [
+    ("$M_A; X; $M_B; X; $M_C; Y;", "X;", "Z;"),
+    ("$M_A; X; $M_B; Y; $M_C; X; $M_D; Y;", "X; Y;", "Z;"),
+    ("$M_A; X; $M_A; Y;", "X;", "Z;"),
+]
+
+
+class BacktrackingMatcher(sr.Matcher):
+    """
+    Matcher aligning lists by trying every combination of runs, for reference.
+    """
+
+    def _match_sequence(
+        self, elements: List[Optional[int]], sequence: "sr._ChildSequence"
+    ) -> bool:
+        def align(position: int, start: int) -> bool:
+            if position == len(sequence.steps):
+                return start == len(elements)
+            saved = dict(self.bindings)
+            if not sequence.plural[position]:
+                if start < len(elements) and self._run(
+                    elements[start], sequence.steps[position]
+                ):
+                    if align(position + 1, start + 1):
+                        return True
+                self._restore(saved)
+                return False
+            name = sequence.names[position]
+            key = sequence.keys[position]
+            for end in range(start, len(elements) + 1):
+                run: List[Optional[int]] = [
+                    i for i in elements[start:end] if i is not None
+                ]
+                if self._bind_list(name, key, run) and align(position + 1, end):
+                    return True
+                self._restore(saved)
+            return False
+
+        return align(0, 0)
+
+
+def time_match(
+    matcher_class: type, pattern: sr.PatternNode, operand: lal.AdaNode, repeat: int
+) -> float:
+    """
+    Matches pattern against all statement lists in operand repeat times
+
+    :param matcher_class: The matcher to use
+    :param pattern: The compiled pattern
+    :param operand: The parse tree to match against
+    :param repeat: The number of times to repeat the matching
+    :return: The average number of seconds per repetition
+    """
+    index = sr.NodeIndex(operand)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        matcher = matcher_class(pattern, index, False)
+        for candidate in index.candidates(pattern.kind_name):
+            matcher.match(candidate)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 20, 40, 80])
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    pool = contextpool.get_pool()
+    for pattern_text, statement, last in CASES:
+        pattern = sr.compile_pattern(
+            pool.parse_buffer(pattern_text, lal.GrammarRule.stmts_rule).root
+        )
+        print(pattern_text)
+        print("%8s %16s %16s" % ("length", "backtracking", "memoised"))
+        for length in args.lengths:
+            operand = pool.parse_buffer(
+                " ".join([statement] * length + [last]), lal.GrammarRule.stmts_rule
+            ).root
+            timings = [
+                time_match(matcher_class, pattern, operand, args.repeat)
+                for matcher_class in (BacktrackingMatcher, sr.Matcher)
+            ]
+            print(
+                "%8d %16s %16s"
+                % tuple([length] + ["%.3f ms" % (timing * 1000) for timing in timings])
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark for the replacer on large files with many replacements.
+A file of n lines is generated in which every other line holds a match, and all
+matches are replaced: in a string, in a file loaded as text, and in a file streamed
+through a memory map. The locations are made up rather than searched for,
+so only the replacing is measured. As the replacer works on absolute offsets and
+joins its output once, the time per line should stay flat when the file grows.
+Besides the time, the peak memory allocated is printed. The streaming replacement
+never holds the file itself, what it allocates grows with the number of
+replacements only (for the edit deltas it returns).
+
+Usage: python -m benchmarks.replacer_benchmark [--lines N ...] [--repeat N]
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+from Haystack import replacer as rep
+from Haystack.location import Capture, Location, Wildcard
+
+
+def make_input(lines: int) -> Tuple[str, List[Location]]:
+    """
+    Generates a text with a match on every other line
+
+    :param lines: The number of lines of the text
+    :return: A tuple with the text and the locations of the matches
+    """
+    parts: List[str] = []
+    locations: List[Location] = []
+    for line in range(1, lines + 1):
+        if line % 2:
+            parts.append("   X := Y + " + str(line) + ";\n")
+            end = 12 + len(str(line))
+            wildcards: Dict[str, Wildcard] = {"$S_Value": Capture(str(line))}
+            locations.append(Location(line, line, 9, end, wildcards))
+        else:
+            parts.append("   Put_Line (X);\n")
+    return "".join(parts), locations
+
+
+def measure(function: Callable[[], object], repeat: int) -> Tuple[float, int]:
+    """
+    Times a function, and measures the peak memory it allocates in a separate run
+
+    :param function: The function to measure
+    :param repeat: The number of times to repeat the timing
+    :return: A tuple with the average number of seconds per call and the peak bytes
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    seconds = (time.perf_counter() - start) / repeat
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, nargs="+", default=[25000, 50000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    replacement = "Y - $S_Value"
+    print(
+        "%8s %14s %22s %22s %22s"
+        % ("lines", "replacements", "string", "file", "streaming file")
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, "generated.adb")
+        output = filepath + ".out"
+        for lines in args.lines:
+            text, locations = make_input(lines)
+            with open(filepath, "w", encoding="UTF-8") as outfile:
+                outfile.write(text)
+            results = [
+                measure(function, args.repeat)
+                for function in (
+                    lambda: rep.replace_string(text, locations, replacement),
+                    lambda: rep.replace_file(
+                        filepath, locations, replacement, output=output
+                    ),
+                    lambda: rep.replace_file(
+                        filepath, locations, replacement, output=output, streaming=True
+                    ),
+                )
+            ]
+            print(
+                "%8d %14d %22s %22s %22s"
+                % tuple(
+                    [lines, len(locations)]
+                    + [
+                        "%.1f ms %6.1f MiB" % (seconds * 1000, peak / 2**20)
+                        for seconds, peak in results
+                    ]
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
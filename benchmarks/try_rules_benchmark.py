@@ -0,0 +1,63 @@
+"""
+Benchmark for guessing the parse rules of search queries.
+Every query is compiled once with every parse rule of libadalang, which is what
+trying all the rules costs, and once with only the rules guessed from its shape.
+A guess is a hit when one of the guessed rules parses the query, in which case
+trying rules never has to fall back to the other rules.
+
+Usage: python -m benchmarks.try_rules_benchmark [--repeat N]
+"""
+import argparse
+import time
+import libadalang as lal  # type: ignore
+from Haystack import api
+
+QUERIES = [
+    'Put ("Hello World!")',
+    "Put ($S_expr);",
+    "x : Integer := 10",
+    "y := abs x;",
+    "I : aliased Integer := 0;",
+    "type Person_Access is access Person;",
+    "function Area (Self : Shape) return Float is abstract;",
+    'procedure Hello is begin Put_Line ("Hello"); end Hello;',
+    "while $S_Cond loop $M_Body; end loop;",
+    "if $S_Cond then $M_Then; end if;",
+    "requeue Request_Queue;",
+    "Obj1.all := Obj2.all;",
+]
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rules = lal.GrammarRule._c_to_py  # pylint: disable=protected-access
+    every = guessed = 0.0
+    hits = 0
+    for _ in range(args.repeat):
+        for query in QUERIES:
+            start = time.perf_counter()
+            api._compile_rules(  # pylint: disable=protected-access
+                query, rules, False, set()
+            )
+            every += time.perf_counter() - start
+            start = time.perf_counter()
+            found = api._compile_rules(  # pylint: disable=protected-access
+                query, api.guess_parse_rules(query), False, set()
+            )[0]
+            guessed += time.perf_counter() - start
+            hits += bool(found)
+
+    count = args.repeat * len(QUERIES)
+    print("queries:      ", len(QUERIES))
+    print("rules:        ", len(rules))
+    print("hits:          %d/%d" % (hits, count))
+    print("every rule:    %.3f ms/query" % (every * 1000 / count))
+    print("guessed rules: %.3f ms/query" % (guessed * 1000 / count))
+
+
+if __name__ == "__main__":
+    main()
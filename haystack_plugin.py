@@ -4,7 +4,7 @@ This package will add an option to the Find menu allowing users to
 search and replace in files in the currently opened project.
 """
 from enum import Enum
-from typing import Tuple, List
+from typing import Tuple, List, Optional
 from gi.repository import Gtk, GLib, Gdk, GObject  # type: ignore # pylint: disable=import-error,unused-import
 import libadalang as lal  # type: ignore
 import gs_utils  # type: ignore # pylint: disable=import-error
@@ -12,6 +12,8 @@ import GPS
 from Haystack import api
 from Haystack.location import Location
 from Haystack import exceptions
+from Haystack import projectindex
+from Haystack import ruleguess
 
 
 @gs_utils.interactive(menu="/Find/Find AST")  # type: ignore
@@ -37,6 +39,22 @@ def on_file_changed(hook, file):  # pylint: disable=unused-argument
 
 GPS.Hook("file_changed_on_disk").add(on_file_changed)
 
+# Where the project indexes are kept, by default outside the project tree
+INDEX_DIRECTORY_PREFERENCE = GPS.Preference("Plugins/haystack/index_directory")
+INDEX_DIRECTORY_PREFERENCE.create(
+    "Find AST index directory",
+    "string",
+    "The directory of the project indexes of Find AST. "
+    "Leave empty for .haystack/indexes in the home directory.",
+    "",
+)
+
+
+def index_database(root: str) -> str:
+    """Returns the filepath of the index database of the project in directory root."""
+    directory = INDEX_DIRECTORY_PREFERENCE.get()
+    return projectindex.user_database(root, directory or None)
+
 
 class SearchContext(Enum):
     """Enum containing all contexts in which you can search for ASTs."""
@@ -53,6 +71,10 @@ class MainView(Gtk.Grid):
         super().__init__()
         self.locations: List[Tuple[str, Location]] = []
         self.selected_location: int = -1
+        # The pattern the locations were found with, to update them after a replacement
+        self.pattern: Optional[api.Pattern] = None
+        # Which parse rules matched before, to guess the rule when trying other rules
+        self.rule_history = ruleguess.RuleHistory()
 
         # Create vertical box to contain the dropdown menu and query boxes
         find_replace_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
@@ -201,6 +223,7 @@ class MainView(Gtk.Grid):
         then calls the search method appropriate for the selected context.
         """
         self.locations = []
+        self.pattern = None
         self.set_button_sensitivity(False)
         # Read search buffer
         buffer = self.find_textview.get_buffer()
@@ -230,6 +253,14 @@ class MainView(Gtk.Grid):
             # selected search context and execute that function
             func = switcher.get(selected_context)
             func(editor_buffer, parse_rule, search_query)
+            # The rules that matched in the search are saved once, not once per file
+            self.rule_history.save()
+            try:
+                self.pattern = api.compile(
+                    search_query, parse_rule, self.case_insensitive_button.get_active()
+                )
+            except exceptions.PatternParseException:
+                pass  # another parse rule was used, Replace & Find searches again
 
             if len(self.locations) > 0:
                 self.set_button_sensitivity(True)
@@ -260,15 +291,49 @@ class MainView(Gtk.Grid):
         parse_rule: lal.GrammarRule,
         search_query: str,
     ):
-        """Searches the entire project for the provided search query."""
+        """
+        Searches the entire project for the provided search query.
+        The project index is consulted first, so only files that may match are searched.
+        Files with unsaved changes are always searched.
+        """
         current_project = editor_buffer.file().project()
 
+        filepaths: List[str] = []
         source_dirs: List[str] = current_project.source_dirs()
         for directory in source_dirs:
             directory = directory + "*.adb"
-            filepaths: str = GPS.dir(directory)
-            for filepath in filepaths:
-                self.execute_search(filepath, search_query, parse_rule)
+            filepaths.extend(GPS.dir(directory))
+
+        try:
+            pattern = api.compile(
+                search_query, parse_rule, self.case_insensitive_button.get_active()
+            )
+        except exceptions.PatternParseException:
+            pattern = None  # execute_search offers to try other parse rules
+        if pattern is not None:
+            # The index reads the files from disk, so files with unsaved changes
+            # are left out of it and searched whatever it says
+            unsaved = {
+                buffer.file().path
+                for buffer in GPS.EditorBuffer.list()
+                if buffer.is_modified()
+            }
+            root = current_project.file().directory()
+            index = projectindex.get_index(root, index_database(root))
+            candidates = set(
+                index.candidates(
+                    pattern.unit.root,
+                    [filepath for filepath in filepaths if filepath not in unsaved],
+                )
+            )
+            filepaths = [
+                filepath
+                for filepath in filepaths
+                if filepath in unsaved or filepath in candidates
+            ]
+
+        for filepath in filepaths:
+            self.execute_search(filepath, search_query, parse_rule)
 
     def execute_search(
         self, filepath: str, search_query: str, parse_rule: lal.GrammarRule
@@ -277,6 +342,8 @@ class MainView(Gtk.Grid):
         Searches in the specified file for the specified search query.
         If the selected parse rule doesn't work,
         the user is asked whether they want to try other rules.
+        When no rule parses the search query, the user is told so, and when a rule
+        parses it but nothing matches in the file, that is written to the console.
         """
         editor_buffer = GPS.EditorBuffer.get(file=GPS.File(filepath))
         editor_buffer.save(interactive=True)
@@ -295,14 +362,24 @@ class MainView(Gtk.Grid):
                 + " did not parse your search query, should we try other parse rules?",
                 ["Yes", "No"],
             )
-            if choice == "Yes":
+            if choice != "Yes":
+                return
+            try:
                 locations = api.findall_file_try_rules(
                     search_query,
                     filepath,
                     lal.GrammarRule._c_to_py,  # pylint: disable=protected-access
                     self.case_insensitive_button.get_active(),
+                    self.rule_history,
+                )
+            except ValueError:
+                GPS.MDI.dialog("None of the parse rules parsed your search query.")
+                return
+            if not locations:
+                # Some rule parsed the search query, it just does not match in this file
+                GPS.Console().write(
+                    "No matches of " + repr(search_query) + " in " + filepath + "\n"
                 )
-            else:
                 return
         except exceptions.OperandParseException:
             GPS.MDI.dialog(
@@ -330,21 +407,52 @@ class MainView(Gtk.Grid):
 
     def on_replace_find_clicked(self, widget):
         """When a search query has been executed, replaces the currently selected location
-        and then selects the next matched location in the current file."""
+        and then selects the next matched location in the current file.
+        Only the edited file is searched again, and only around the replaced text,
+        the other matches in the file are moved along with the text."""
         # Read replace buffer
         buffer = self.replace_textview.get_buffer()
         text_start, text_end = buffer.get_bounds()
         replacement = buffer.get_text(text_start, text_end, True)
 
-        # Replace currently selected text, save, search again
-        api.replace_file(
-            self.locations[self.selected_location][0],
-            [self.locations[self.selected_location][1]],
-            replacement,
+        # Replace currently selected text
+        filepath, location = self.locations[self.selected_location]
+        deltas = api.replace_file(filepath, [location], replacement)
+        if self.pattern is None:
+            self.selected_location -= 1
+            self.on_find_clicked(widget)
+            return
+
+        # Update the matches of the edited file
+        first = next(
+            i for i, (path, _) in enumerate(self.locations) if path == filepath
         )
+        in_file = [loc for path, loc in self.locations if path == filepath]
+        try:
+            updated = self.pattern.refind_file(filepath, in_file, deltas)
+        except exceptions.OperandParseException:
+            GPS.MDI.dialog(
+                "The file could not be parsed. Please check for any errors and fix them."
+            )
+            updated = []
+        self.locations[first : first + len(in_file)] = [
+            (filepath, loc) for loc in updated
+        ]
 
+        # Select the first match after the replaced text
+        start = (location.start_line, location.start_char)
+        following = [
+            i
+            for i, loc in enumerate(updated)
+            if (loc.start_line, loc.start_char) >= start
+        ]
+        self.selected_location = first + (following[0] if following else len(updated))
         self.selected_location -= 1
-        self.on_find_clicked(widget)
+        if len(self.locations) > 0:
+            self.on_next_clicked(widget)
+        else:
+            self.selected_location = -1
+            self.set_button_sensitivity(False)
 
     def on_replace_all_clicked(self, widget):  # pylint: disable=unused-argument
         """Replaces all found matches with the text entered into the replace textbox."""
@@ -360,8 +468,19 @@ class MainView(Gtk.Grid):
             else:
                 file_replacements[filepath].append(replace_location)
 
-        for filepath, replace_locations in file_replacements.items():
-            api.replace_file(filepath, replace_locations, replacement)
+        # Either every file is replaced, or none is
+        try:
+            api.replace_files(file_replacements, replacement)
+        except exceptions.OperandParseException as error:
+            GPS.MDI.dialog(
+                "Nothing was replaced, the replacement makes "
+                + str(error)
+                + " impossible to parse."
+            )
+            return
+        except OSError as error:
+            GPS.MDI.dialog("Nothing was replaced: " + str(error))
+            return
 
         # Remove found matches
         self.locations = []
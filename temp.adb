@@ -0,0 +1,5 @@
+with Text_IO; use Text_IO;
+procedure hello is
+begin
+    Put ("Hello world!");
+end hello;
\ No newline at end of file
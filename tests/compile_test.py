@@ -0,0 +1,104 @@
+"""
+Tests for compiled patterns, which parse the search query once
+and can then be matched against any number of files and strings.
+"""
+import difflib
+import shutil
+import pytest
+import libadalang as lal  # type: ignore
+from Haystack import api
+from Haystack import exceptions
+
+# pylint: disable=missing-function-docstring
+
+
+def test_compile_wildcards():
+    pattern = api.compile(
+        "$S_Var = $S_Val1 or else $S_Var = $M_Val2", lal.GrammarRule.expr_rule
+    )
+    assert pattern.singular_wildcards == ["$S_Var", "$S_Val1"]
+    assert pattern.plural_wildcards == ["$M_Val2"]
+
+
+def test_compile_pattern_tree():
+    pattern = api.compile("$S_Left := $S_Right;", lal.GrammarRule.stmt_rule)
+    assert pattern.tree.kind_name == "AssignStmt"
+    assert [child.name for child in pattern.tree.children] == ["$S_Left", "$S_Right"]
+    assert all(child.singular for child in pattern.tree.children)
+    assert pattern.tree.child_count == 2 and pattern.tree.plural_count == 0
+
+
+def test_compile_invalid_pattern():
+    with pytest.raises(exceptions.PatternParseException):
+        api.compile("if then else", lal.GrammarRule.expr_rule)
+
+
+def test_pattern_findall_file():
+    pattern = api.compile('Put("[")', lal.GrammarRule.expr_rule)
+    first = pattern.findall_file("tests/test_programs/dosort.adb")
+    second = pattern.findall_file("tests/test_programs/dosort.adb")
+    assert repr(first) == repr(second) == "[31:7-31:15]"
+
+
+def test_pattern_subn_string():
+    pattern = api.compile("Put ($S_expr)", lal.GrammarRule.expr_rule)
+    assert pattern.subn_string(
+        'Put ("Hello"); Put ("World");',
+        "Put_Line ($S_expr)",
+        lal.GrammarRule.stmts_rule,
+    ) == ('Put_Line ("Hello"); Put_Line ("World");', 2)
+
+
+def test_finditer_file():
+    matches = api.finditer_file(
+        "Put ($S_expr)",
+        "tests/test_programs/dosort.adb",
+        lal.GrammarRule.expr_rule,
+    )
+    first = next(matches)
+    assert repr(first) == "31:7-31:15"
+    assert first.wildcards["$S_expr"].text == '"["'
+    assert len(list(matches)) + 1 == len(
+        api.findall_file(
+            "Put ($S_expr)",
+            "tests/test_programs/dosort.adb",
+            lal.GrammarRule.expr_rule,
+        )
+    )
+
+
+def test_location_offsets():
+    filepath = "tests/test_programs/dosort.adb"
+    pattern = api.compile("Put ($S_expr)", lal.GrammarRule.expr_rule)
+    location = pattern.findall_file(filepath)[0]
+    assert not hasattr(location, "__dict__")
+    with open(filepath, "r", encoding="UTF-8") as infile:
+        text = infile.read()
+    capture = location.wildcards["$S_expr"]
+    assert text[location.start : location.end] == 'Put("[")'
+    assert text[capture.start : capture.end] == capture.text == '"["'
+    unit = lal.AnalysisContext().get_from_file(filepath)
+    assert location.node(unit).kind_name == location.kind == "CallExpr"
+    assert capture.node(unit).kind_name == capture.kind == "StrLiteral"
+
+
+def test_pattern_diff_file(tmp_path):
+    filepath = str(tmp_path / "hello.adb")
+    shutil.copyfile("tests/test_programs/hello.adb", filepath)
+    with open(filepath, "r", encoding="UTF-8") as infile:
+        before = infile.read()
+    pattern = api.compile("Put_Line ($S_X)", lal.GrammarRule.expr_rule)
+    patch = pattern.diff_file(filepath, "Ada.Text_IO.Put_Line ($S_X)")
+    assert len(patch.hunks) == 1
+    pattern.sub_file(filepath, "Ada.Text_IO.Put_Line ($S_X)")
+    with open(filepath, "r", encoding="UTF-8") as infile:
+        after = infile.read()
+    assert str(patch) == "".join(
+        difflib.unified_diff(
+            before.splitlines(keepends=True),
+            after.splitlines(keepends=True),
+            filepath,
+            filepath,
+        )
+    )
+    assert not pattern.diff_file(filepath, "Put_Line ($S_X)")
@@ -0,0 +1,52 @@
+"""
+Tests for searching many files at once with api.findall_files.
+"""
+import glob
+import libadalang as lal  # type: ignore
+from Haystack import api
+
+# pylint: disable=missing-function-docstring
+
+FILEPATHS = sorted(glob.glob("tests/test_programs/*.adb"))
+
+
+def test_findall_files_matches_findall_file():
+    expected = {
+        filepath: repr(
+            api.findall_file("Put ($S_expr)", filepath, lal.GrammarRule.expr_rule)
+        )
+        for filepath in FILEPATHS
+    }
+    found = {
+        filepath: repr(locations)
+        for filepath, locations in api.findall_files(
+            "Put ($S_expr)",
+            FILEPATHS,
+            lal.GrammarRule.expr_rule,
+            workers=2,
+            skip_unparsable=True,
+        )
+    }
+    assert found == {key: value for key, value in expected.items() if key in found}
+    assert "tests/test_programs/dosort.adb" in found
+
+
+def test_findall_files_wildcard_text():
+    results = dict(
+        api.findall_files(
+            'Put("[")',
+            ["tests/test_programs/dosort.adb"],
+            lal.GrammarRule.expr_rule,
+            workers=2,
+        )
+    )
+    assert repr(results["tests/test_programs/dosort.adb"]) == "[31:7-31:15]"
+    locations = dict(
+        api.findall_files(
+            "Put ($S_expr)",
+            ["tests/test_programs/dosort.adb"],
+            lal.GrammarRule.expr_rule,
+            workers=2,
+        )
+    )["tests/test_programs/dosort.adb"]
+    assert locations[0].wildcards["$S_expr"].text == '"["'
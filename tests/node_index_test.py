@@ -0,0 +1,68 @@
+"""
+Tests for the node index, which numbers the nodes of an operand in pre-order
+and groups them by kind.
+"""
+import libadalang as lal  # type: ignore
+from Haystack import api
+from Haystack import searchresult as sr
+
+# pylint: disable=missing-function-docstring
+# pylint: disable=protected-access
+
+
+def test_index_structure():
+    unit = api._analyze_file("tests/test_programs/dosort.adb")
+    index = sr.NodeIndex(unit.root)
+    assert index.nodes[0] == unit.root
+    assert index.ends[0] == len(index.nodes)
+    assert sum(len(nodes) for nodes in index.kinds.values()) == len(index.nodes)
+    for number, node in enumerate(index.nodes):
+        descendants = index.nodes[number + 1 : index.ends[number]]
+        assert all(descendant.parent is not None for descendant in descendants)
+        for child in node.children:
+            if child is not None:
+                assert child in descendants
+
+
+def test_index_children_and_texts():
+    unit = api._analyze_file("tests/test_programs/dosort.adb")
+    index = sr.NodeIndex(unit.root)
+    for number, node in enumerate(index.nodes):
+        children = [
+            None if i is None else index.nodes[i] for i in index.children[number]
+        ]
+        assert children == list(node.children)
+        assert index.child_counts[number] == len([i for i in children if i is not None])
+        assert index.texts[number] == (None if node.children else node.text)
+
+
+def test_index_hashes():
+    unit = api._analyze_string("X := Y; X := Y; X := y;", lal.GrammarRule.stmts_rule)
+    index = sr.NodeIndex(unit.root)
+    assignments = index.candidates("AssignStmt")
+    hashes = index.hashes()
+    assert hashes[assignments[0]] == hashes[assignments[1]]
+    assert hashes[assignments[0]] != hashes[assignments[2]]
+    lower_hashes = index.hashes(True)
+    assert lower_hashes[assignments[0]] == lower_hashes[assignments[2]]
+
+
+def test_index_candidates():
+    unit = api._analyze_file("tests/test_programs/dosort.adb")
+    index = sr.NodeIndex(unit.root)
+    calls = index.candidates("CallExpr")
+    assert calls
+    assert all(index.nodes[number].kind_name == "CallExpr" for number in calls)
+    assert list(index.candidates(None)) == list(range(len(index.nodes)))
+
+
+def test_search_with_shared_index():
+    unit = api._analyze_file("tests/test_programs/dosort.adb")
+    index = sr.NodeIndex(unit.root)
+    pattern = api.compile("Put ($S_expr)", lal.GrammarRule.expr_rule)
+    with_index = sr.execute_search(pattern.unit.root, unit.root, False, index)
+    without_index = sr.execute_search(pattern.unit.root, unit.root, False)
+    assert repr(with_index) == repr(without_index)
+    assert len(with_index) > 1
+    compiled = sr.execute_search(pattern.tree, unit.root, False, index)
+    assert repr(compiled) == repr(with_index)
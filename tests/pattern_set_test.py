@@ -0,0 +1,53 @@
+"""
+Tests for pattern sets, which search for many patterns in a single traversal.
+"""
+import libadalang as lal  # type: ignore
+from Haystack import api
+from Haystack import patternset
+
+# pylint: disable=missing-function-docstring
+
+RULES = [
+    "not (not $S_Cond)",
+    "not ($S_Left = $S_Right)",
+    "not ($S_Left /= $S_Right)",
+    "$S_X + $S_X",
+    "Put ($S_expr)",
+    'Put("[")',
+]
+
+
+def test_pattern_set_string():
+    to_search = (
+        "X := not (not A); Y := not (B = C); Z := 5 + 5; W := not (not (D /= E));"
+    )
+    patterns = api.compile_set(RULES, lal.GrammarRule.expr_rule)
+    expected = sorted(
+        (number, repr(location))
+        for number, pattern in enumerate(patterns.patterns)
+        for location in pattern.findall_string(to_search, lal.GrammarRule.stmts_rule)
+    )
+    found = patterns.findall_string(to_search, lal.GrammarRule.stmts_rule)
+    assert sorted((number, repr(location)) for number, location in found) == expected
+    assert {number for number, _ in found} == {0, 1, 2, 3}
+
+
+def test_pattern_set_file():
+    filepath = "tests/test_programs/dosort.adb"
+    patterns = api.compile_set(RULES, lal.GrammarRule.expr_rule)
+    found = patterns.findall_file(filepath)
+    for number, pattern in enumerate(patterns.patterns):
+        assert [
+            repr(location) for found_number, location in found if found_number == number
+        ] == [repr(location) for location in pattern.findall_file(filepath)]
+    assert repr([loc for number, loc in found if number == 5]) == "[31:7-31:15]"
+
+
+def test_pattern_set_shares_prefixes():
+    rules = ["Put ($S_X)", "Put (1)", "Put (2)", "Get ($S_X)"]
+    patterns = api.compile_set(rules, lal.GrammarRule.expr_rule)
+    separate = sum(
+        patternset.DiscriminationNet([pattern.tree], [False]).size()
+        for pattern in patterns.patterns
+    )
+    assert patterns.net.size() < separate - len(rules)
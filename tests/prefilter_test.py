@@ -0,0 +1,47 @@
+"""
+Tests for the literal token prefilter and the search statistics.
+"""
+import glob
+import libadalang as lal  # type: ignore
+from Haystack import api
+from Haystack.statistics import SearchStatistics
+
+# pylint: disable=missing-function-docstring
+
+FILEPATHS = sorted(glob.glob("tests/test_programs/*.adb"))
+
+
+def test_prefilter_tokens():
+    pattern = api.compile("Put ($S_expr)", lal.GrammarRule.expr_rule)
+    assert pattern.prefilter.tokens == [b"Put"]
+    assert pattern.prefilter.accepts(b"Put (X);")
+    assert not pattern.prefilter.accepts(b"Get (X);")
+
+
+def test_prefilter_case_insensitive():
+    pattern = api.compile("PUT ($S_expr)", lal.GrammarRule.expr_rule, True)
+    assert pattern.prefilter.accepts(b"put (X);")
+    pattern = api.compile("PUT ($S_expr)", lal.GrammarRule.expr_rule)
+    assert not pattern.prefilter.accepts(b"put (X);")
+
+
+def test_prefilter_only_wildcards():
+    pattern = api.compile("$S_left := $S_right;", lal.GrammarRule.stmt_rule)
+    assert pattern.prefilter.accepts(b"")
+
+
+def test_prefilter_statistics():
+    statistics = SearchStatistics()
+    results = dict(
+        api.findall_files(
+            "Does_Not_Occur_Anywhere ($S_expr)",
+            FILEPATHS,
+            lal.GrammarRule.expr_rule,
+            workers=1,
+            statistics=statistics,
+        )
+    )
+    assert all(not locations for locations in results.values())
+    assert statistics.files_searched == len(FILEPATHS)
+    assert statistics.files_rejected == len(FILEPATHS)
+    assert statistics.rejection_rate == 1.0
@@ -0,0 +1,76 @@
+"""
+Tests for the persistent project index.
+"""
+import os
+import shutil
+import libadalang as lal  # type: ignore
+from Haystack import api
+from Haystack import projectindex
+from Haystack.projectindex import ProjectIndex
+
+# pylint: disable=missing-function-docstring
+
+
+def _project(tmp_path):
+    for name in ("hello.adb", "dosort.adb"):
+        shutil.copyfile(os.path.join("tests/test_programs", name), str(tmp_path / name))
+    return [str(tmp_path / "hello.adb"), str(tmp_path / "dosort.adb")]
+
+
+def test_index_is_incremental(tmp_path):
+    filepaths = _project(tmp_path)
+    index = ProjectIndex(str(tmp_path))
+    assert index.update(filepaths) == 2
+    assert index.update(filepaths) == 0
+    assert os.path.exists(str(tmp_path / ".haystack" / "index.sqlite"))
+    with open(filepaths[0], "a", encoding="utf-8") as file:
+        file.write("\n-- changed\n")
+    assert index.update(filepaths) == 1
+    index.close()
+
+
+def test_index_outside_project(tmp_path):
+    project = tmp_path / "project"
+    project.mkdir()
+    filepaths = _project(project)
+    directory = str(tmp_path / "indexes")
+    database = projectindex.user_database(str(project), directory)
+    assert database == projectindex.user_database(str(project), directory)
+    assert database != projectindex.user_database(str(tmp_path), directory)
+    index = projectindex.get_index(str(project), database)
+    assert index.update(filepaths) == 2
+    assert os.path.exists(database)
+    assert sorted(os.listdir(str(project))) == ["dosort.adb", "hello.adb"]
+
+
+def test_index_candidates(tmp_path):
+    filepaths = _project(tmp_path)
+    index = ProjectIndex(str(tmp_path))
+    pattern = api.compile("The_Month := $S_expr;", lal.GrammarRule.stmt_rule)
+    assert index.candidates(pattern.unit.root, filepaths) == [filepaths[0]]
+    pattern = api.compile("Put ($S_expr)", lal.GrammarRule.expr_rule)
+    assert index.candidates(pattern.unit.root, filepaths) == filepaths
+    assert [path for path, _, _ in index.occurrences("THE_MONTH")] == [filepaths[0]]
+    index.close()
+
+
+def test_findall_files_with_index(tmp_path):
+    filepaths = _project(tmp_path)
+    index = ProjectIndex(str(tmp_path))
+    results = dict(
+        api.findall_files(
+            "The_Month := $S_expr;",
+            filepaths,
+            lal.GrammarRule.stmt_rule,
+            workers=1,
+            index=index,
+        )
+    )
+    assert repr(results) == repr(
+        {
+            filepaths[0]: api.findall_file(
+                "The_Month := $S_expr;", filepaths[0], lal.GrammarRule.stmt_rule
+            )
+        }
+    )
+    index.close()
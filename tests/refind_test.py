@@ -0,0 +1,53 @@
+"""
+Tests for updating the matches of a file after a replacement,
+by moving the matches along with the text instead of searching the whole file again.
+"""
+import shutil
+import libadalang as lal  # type: ignore
+from Haystack import api
+from Haystack.location import Capture, EditDelta, Location
+
+# pylint: disable=missing-function-docstring
+
+
+def test_edit_delta_shift():
+    # "A := B;" on line 3 columns 4-11 replaced by two lines ending at 4:6
+    delta = EditDelta((3, 4), (3, 11), (4, 6))
+    assert delta.shift((2, 7)) == (2, 7)
+    assert delta.shift((3, 4)) == (3, 4)
+    assert delta.shift((3, 8)) == (4, 6)
+    assert delta.shift((3, 11)) == (4, 6)
+    assert delta.shift((3, 15)) == (4, 10)
+    assert delta.shift((5, 2)) == (6, 2)
+    assert repr(delta.shift_location(Location(5, 5, 1, 9, {}))) == "6:1-6:9"
+    assert repr(delta.shift_location(Location(1, 3, 1, 4, {}))) == "1:1-3:4"
+    assert delta.shift_location(Location(3, 3, 6, 8, {})) is None
+    wildcards = {
+        "$S_X": Capture("X", 60, 61, "Identifier"),
+        "$M_Y": [Capture("Y", 63, 64)],
+    }
+    moved = delta.shift_location(Location(5, 5, 1, 9, wildcards, 58, 66, "CallStmt"))
+    assert (moved.start, moved.end, moved.kind) == (None, None, "CallStmt")
+    assert (moved.wildcards["$S_X"].text, moved.wildcards["$S_X"].kind) == (
+        "X",
+        "Identifier",
+    )
+    assert moved.wildcards["$S_X"].start is None
+    assert [capture.end for capture in moved.wildcards["$M_Y"]] == [None]
+    assert wildcards["$S_X"].start == 60
+
+
+def test_refind_file(tmp_path):
+    filepath = str(tmp_path / "hello.adb")
+    shutil.copyfile("tests/test_programs/hello.adb", filepath)
+    pattern = api.compile("Put ($S_X)", lal.GrammarRule.expr_rule)
+    locations = pattern.findall_file(filepath)
+    assert len(locations) == 3
+    deltas = api.replace_file(filepath, [locations[0]], "Put ($S_X);\n   Put ($S_X)")
+    assert [repr(delta) for delta in deltas] == ["EditDelta(6:4-6:18 => 7:19)"]
+    updated = pattern.refind_file(filepath, locations, deltas)
+    assert [repr(location) for location in updated] == [
+        repr(location) for location in pattern.findall_file(filepath)
+    ]
+    assert len(updated) == 4
+    assert repr(updated[-1]) == "10:7-10:20"
@@ -0,0 +1,104 @@
+"""
+Tests for replacing in many files at once, where either every file is replaced or none is.
+"""
+import os
+import shutil
+import threading
+import pytest
+import libadalang as lal  # type: ignore
+from Haystack import api
+from Haystack import exceptions
+from Haystack import replacer as rep
+from Haystack.location import Location
+
+# pylint: disable=missing-function-docstring
+
+
+def _files(tmp_path, count):
+    files = {}
+    for number in range(count):
+        filepath = str(tmp_path / ("file" + str(number) + ".adb"))
+        with open(filepath, "w", encoding="UTF-8") as outfile:
+            outfile.write("X := " + str(number) + ";\n")
+        files[filepath] = [Location(1, 1, 6, 6 + len(str(number)), {})]
+    return files
+
+
+def _contents(files):
+    contents = []
+    for filepath in sorted(files):
+        with open(filepath, "r", encoding="UTF-8") as infile:
+            contents.append(infile.read())
+    return contents
+
+
+def test_replace_files(tmp_path):
+    files = _files(tmp_path, 20)
+    deltas = rep.replace_files(files, "Y", workers=4)
+    assert _contents(files) == ["X := Y;\n"] * 20
+    assert sorted(deltas) == sorted(files)
+    assert sorted(os.listdir(str(tmp_path))) == sorted(
+        os.path.basename(filepath) for filepath in files
+    )
+
+
+def test_replace_files_validation_fails(tmp_path):
+    files = _files(tmp_path, 20)
+    before = _contents(files)
+    rejected = sorted(files)[7]
+
+    def validate(filepath, _):
+        if filepath == rejected:
+            raise ValueError(filepath)
+
+    with pytest.raises(ValueError):
+        rep.replace_files(files, "Y", workers=4, validate=validate)
+    assert _contents(files) == before
+    assert len(os.listdir(str(tmp_path))) == 20
+
+
+def test_replace_files_validates_in_calling_thread(tmp_path):
+    files = _files(tmp_path, 8)
+    threads = set()
+
+    def validate(_, staged):
+        threads.add(threading.get_ident())
+        assert os.path.exists(staged)
+
+    rep.replace_files(files, "Y", workers=4, validate=validate)
+    assert threads == {threading.get_ident()}
+    assert _contents(files) == ["X := Y;\n"] * 8
+
+
+def test_replace_files_commit_fails(tmp_path, monkeypatch):
+    files = _files(tmp_path, 5)
+    before = _contents(files)
+    replace = os.replace
+    calls = []
+
+    def failing_replace(source, destination):
+        calls.append(destination)
+        if len(calls) == 3:
+            raise OSError("disk full")
+        replace(source, destination)
+
+    monkeypatch.setattr(rep.os, "replace", failing_replace)
+    with pytest.raises(OSError):
+        rep.replace_files(files, "Y")
+    monkeypatch.undo()
+    assert _contents(files) == before
+    assert len(os.listdir(str(tmp_path))) == 5
+
+
+def test_api_replace_files_validates(tmp_path):
+    filepath = str(tmp_path / "hello.adb")
+    shutil.copyfile("tests/test_programs/hello.adb", filepath)
+    before = _contents([filepath])
+    pattern = api.compile("Put_Line ($S_X)", lal.GrammarRule.expr_rule)
+    locations = pattern.findall_file(filepath)
+    with pytest.raises(exceptions.OperandParseException):
+        api.replace_files({filepath: locations}, "Put_Line ($S_X")
+    assert _contents([filepath]) == before
+    api.replace_files({filepath: locations}, "Ada.Text_IO.Put_Line ($S_X)")
+    assert not pattern.findall_file(filepath)
+    assert len(os.listdir(str(tmp_path))) == 1
@@ -11,9 +11,13 @@ which would increase the execution time)
 # pylint: disable=C0103
 # pylint: disable=missing-function-docstring
 # pylint: disable=protected-access
+import difflib
+import os
+import pytest
 import libadalang as lal  # type: ignore
 from Haystack import api
 from Haystack import replacer as rep
+from Haystack.location import Location, line_starts, to_offset, to_position
 
 # Define the file to test:
 hello_file = """
@@ -321,3 +325,64 @@ def test_simple_body():
         search_fragment, "./tests/test_programs/dosort.adb", grammar, False
     )
     assert replacement in rep.replace_string(dosort_file, location, replacement, None)
+
+
+def test_replace_offsets():
+    text = "A;\nB := 1;\nC;\nD;\n"
+    locations = [Location(2, 2, 6, 7, {}), Location(3, 4, 1, 3, {})]
+    assert rep.replace_string(text, locations, "2") == "A;\nB := 2;\n2\n"
+    assert rep.replace_string(text, locations, "X", [1]) == "A;\nB := 1;\nX\n"
+    assert rep.replace_string(text, locations, "X", []) == text
+    starts = line_starts(text)
+    assert starts == [0, 3, 11, 14, 17]
+    assert to_offset(starts, 2, 6) == 8
+    assert to_position(starts, 8) == (2, 6)
+
+
+def test_replace_file_streaming(tmp_path):
+    filepath = str(tmp_path / "input.adb")
+    with open(filepath, "w", encoding="UTF-8") as outfile:
+        outfile.write('Put ("é");\nX := 1;\nPut ("ü"); X := 2;\n')
+    locations = [Location(2, 2, 6, 7, {}), Location(3, 3, 17, 18, {})]
+    expected = 'Put ("é");\nX := 3;\nPut ("ü"); X := 3;\n'
+    for streaming in (False, True):
+        output = str(tmp_path / ("output_" + str(streaming) + ".adb"))
+        rep.replace_file(filepath, locations, "3", output=output, streaming=streaming)
+        with open(output, "r", encoding="UTF-8") as infile:
+            assert infile.read() == expected
+    assert sorted(os.listdir(str(tmp_path))) == [
+        "input.adb",
+        "output_False.adb",
+        "output_True.adb",
+    ]
+
+
+def test_replace_file_atomic(tmp_path):
+    filepath = str(tmp_path / "input.adb")
+    with open(filepath, "w", encoding="UTF-8") as outfile:
+        outfile.write("X := 1;\n")
+    with pytest.raises(IndexError):
+        rep.replace_file(filepath, [Location(7, 7, 1, 2, {})], "Y")
+    with open(filepath, "r", encoding="UTF-8") as infile:
+        assert infile.read() == "X := 1;\n"
+    assert os.listdir(str(tmp_path)) == ["input.adb"]
+
+
+def test_diff_string():
+    text = "".join("Line_" + str(number) + ";\n" for number in range(1, 21))
+    locations = [
+        Location(2, 2, 6, 7, {}),
+        Location(4, 5, 1, 7, {}),
+        Location(18, 18, 1, 5, {}),
+    ]
+    patch = rep.diff_string(text, locations, "X", name="lines.adb")
+    assert len(patch.hunks) == 2
+    assert str(patch) == "".join(
+        difflib.unified_diff(
+            text.splitlines(keepends=True),
+            rep.replace_string(text, locations, "X").splitlines(keepends=True),
+            "lines.adb",
+            "lines.adb",
+        )
+    )
+    assert not rep.diff_string(text, locations, "Line", [2])
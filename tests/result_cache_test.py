@@ -0,0 +1,108 @@
+"""
+Tests for the persistent result cache, keyed by search query and file contents.
+"""
+import shutil
+import sqlite3
+import pytest
+import libadalang as lal  # type: ignore
+from Haystack import api
+from Haystack import exceptions
+from Haystack import resultcache
+from Haystack.location import Capture, Location
+from Haystack.statistics import SearchStatistics
+
+# pylint: disable=missing-function-docstring
+
+QUERY = "Put ($S_expr);"
+
+
+def _locations(count):
+    return [
+        Location(line, line, 4, 12, {"$S_X": Capture("X", 10, 11)}, 3, 11, "CallStmt")
+        for line in range(1, count + 1)
+    ]
+
+
+def test_cache_get_put(tmp_path):
+    cache = resultcache.ResultCache(str(tmp_path))
+    assert cache.get("query", "digest") is None
+    cache.put("query", "digest", _locations(2))
+    cache.put("query", "broken", None)
+    cache.close()
+
+    cache = resultcache.ResultCache(str(tmp_path))
+    assert repr(cache.get("query", "digest")) == "[1:4-1:12, 2:4-2:12]"
+    with pytest.raises(exceptions.OperandParseException):
+        cache.get("query", "broken")
+    assert (cache.hits, cache.misses, len(cache)) == (2, 0, 2)
+    cache.close()
+
+
+def test_cache_eviction(tmp_path):
+    cache = resultcache.ResultCache(str(tmp_path))
+    cache.put("query", "first", _locations(10))
+    cache.max_bytes = 2 * cache.size + 10
+    cache.put("query", "second", _locations(10))
+    cache.get("query", "first")
+    cache.put("query", "third", _locations(10))
+    assert cache.size <= cache.max_bytes
+    assert cache.get("query", "second") is None
+    assert cache.get("query", "first") is not None
+    assert cache.get("query", "third") is not None
+    cache.close()
+
+
+def test_cache_version(tmp_path):
+    cache = resultcache.ResultCache(str(tmp_path))
+    cache.put("query", "digest", [])
+    cache.close()
+    connection = sqlite3.connect(cache.database)
+    connection.execute("PRAGMA user_version = 0")
+    connection.close()
+    cache = resultcache.ResultCache(str(tmp_path))
+    assert len(cache) == 0
+    cache.close()
+
+
+def test_query_key():
+    def key(query, case_insensitive=False):
+        return api.compile(
+            query, lal.GrammarRule.stmt_rule, case_insensitive
+        ).cache_key()
+
+    assert key("Put ($S_expr);") == key("Put   ( $S_expr ) ;")
+    assert key("Put ($S_expr);") != key("Put ($S_other);")
+    assert key("Put ($S_expr);") != key("Put ($S_expr);", True)
+
+
+def test_findall_files_cached(tmp_path):
+    filepaths = []
+    for name in ["dosort.adb", "copy.adb", "hello.adb"]:
+        filepaths.append(str(tmp_path / name))
+    shutil.copyfile("tests/test_programs/dosort.adb", filepaths[0])
+    shutil.copyfile("tests/test_programs/dosort.adb", filepaths[1])
+    shutil.copyfile("tests/test_programs/hello.adb", filepaths[2])
+    expected = {
+        filepath: repr(api.findall_file(QUERY, filepath, lal.GrammarRule.stmt_rule))
+        for filepath in filepaths
+    }
+    cache = resultcache.ResultCache(str(tmp_path))
+    for workers in [1, 2, 1]:
+        statistics = SearchStatistics()
+        found = {
+            filepath: repr(locations)
+            for filepath, locations in api.findall_files(
+                QUERY,
+                filepaths,
+                lal.GrammarRule.stmt_rule,
+                workers=workers,
+                statistics=statistics,
+                cache=cache,
+            )
+        }
+        assert found == expected
+        assert statistics.files_searched == 3
+    # The copy is never searched, and the last search takes everything from the cache
+    assert statistics.files_cached == 3 - statistics.files_rejected
+    assert len(cache) == 2 - statistics.files_rejected
+    cache.close()
@@ -0,0 +1,103 @@
+"""
+Tests for the rewriter, which applies a catalogue of rules until none of them matches.
+"""
+import json
+import os
+import shutil
+import stat
+import pytest
+import libadalang as lal  # type: ignore
+from Haystack import api
+from Haystack import exceptions
+from Haystack import rewriter
+
+# pylint: disable=missing-function-docstring
+
+
+def _rule(pattern, replacement, parse_rule=lal.GrammarRule.expr_rule):
+    return rewriter.Rule(api.compile(pattern, parse_rule), replacement)
+
+
+def test_rewrite_to_fixpoint():
+    rules = [_rule("not (not $S_Cond)", "$S_Cond")]
+    result = rewriter.Rewriter(rules).rewrite_string(
+        "X := not (not (not (not A)));", lal.GrammarRule.stmts_rule
+    )
+    assert result.text == "X := (A);"
+    assert result.applied == [2]
+    assert result.passes == 3 and result.converged
+
+
+def test_rewrite_overlap_first_rule_wins():
+    rules = [_rule("$S_X + 0", "$S_X"), _rule("A + $S_Y", "$S_Y")]
+    result = rewriter.Rewriter(rules).rewrite_string(
+        "Y := A + 0; Z := A + 1;", lal.GrammarRule.stmts_rule
+    )
+    assert result.text == "Y := A; Z := 1;"
+    assert result.applied == [1, 1]
+
+
+def test_rewrite_max_passes():
+    rules = [_rule("$S_X + 1", "$S_X + 1 + 1")]
+    result = rewriter.Rewriter(rules, max_passes=2).rewrite_string(
+        "Y := A + 1;", lal.GrammarRule.stmts_rule
+    )
+    assert not result.converged
+    assert result.applied == [2]
+
+
+def test_rewrite_file(tmp_path):
+    rule_file = tmp_path / "rules.json"
+    rule_file.write_text(
+        json.dumps(
+            [
+                {
+                    "pattern": "Put_Line ($S_Text)",
+                    "parse_rule": "expr_rule",
+                    "replacement": "Ada.Text_IO.Put_Line ($S_Text)",
+                },
+                {
+                    "name": "less than",
+                    "pattern": "$S_A > $S_B",
+                    "parse_rule": "expr_rule",
+                    "replacement": "$S_B < $S_A",
+                },
+            ]
+        )
+    )
+    source = str(tmp_path / "hello.adb")
+    output = str(tmp_path / "hello_out.adb")
+    shutil.copyfile("tests/test_programs/hello.adb", source)
+    rules = rewriter.load_rules(str(rule_file))
+    assert [rule.name for rule in rules] == ["Put_Line ($S_Text)", "less than"]
+    result = rewriter.Rewriter(rules).rewrite_file(source, output)
+    assert result.applied == [2, 1] and result.converged
+    with open(output, "r", encoding="UTF-8") as outfile:
+        text = outfile.read()
+    assert text == result.text
+    assert 'Ada.Text_IO.Put_Line ("Hello, World!");' in text
+    assert "if The_Time < The_Month then" in text
+    assert "Put(Arr(II).X);" in text
+    with open(source, "r", encoding="UTF-8") as infile:
+        assert "Ada.Text_IO" not in infile.read()
+
+
+def test_rewrite_file_in_place(tmp_path):
+    source = tmp_path / "hello.adb"
+    shutil.copyfile("tests/test_programs/hello.adb", str(source))
+    os.chmod(str(source), 0o640)
+    rules = [_rule("Put_Line ($S_Text);", "Put ($S_Text);", lal.GrammarRule.stmt_rule)]
+    result = rewriter.Rewriter(rules).rewrite_file(str(source))
+    assert result.changes
+    assert source.read_text() == result.text
+    assert stat.S_IMODE(os.stat(str(source)).st_mode) == 0o640
+    assert os.listdir(str(tmp_path)) == ["hello.adb"]
+
+
+def test_load_rules_unknown_parse_rule(tmp_path):
+    rule_file = tmp_path / "rules.json"
+    rule_file.write_text(
+        json.dumps([{"pattern": "A", "parse_rule": "no_rule", "replacement": "B"}])
+    )
+    with pytest.raises(exceptions.RuleFileException):
+        rewriter.load_rules(str(rule_file))
@@ -0,0 +1,75 @@
+"""
+Tests for guessing the parse rules of a search query from its shape.
+"""
+import os
+import libadalang as lal  # type: ignore
+from Haystack import api
+from Haystack import ruleguess
+
+# pylint: disable=missing-function-docstring
+# pylint: disable=protected-access
+
+
+def test_query_shape():
+    assert ruleguess.query_shape("procedure Hello is begin null; end Hello;") == (
+        "procedure;"
+    )
+    assert ruleguess.query_shape("  WHILE $S_Cond loop null; end loop;") == "while;"
+    assert ruleguess.query_shape("y := abs x;") == "assignment;"
+    assert ruleguess.query_shape("I : aliased Integer := 0;") == "declaration;"
+    assert ruleguess.query_shape("x : Integer") == "declaration"
+    assert ruleguess.query_shape("Put (X); Put (Y);") == "statements"
+    assert ruleguess.query_shape('Put ("a; b := c");') == "statement;"
+    assert ruleguess.query_shape("Put (';')") == "expression"
+    assert ruleguess.query_shape("Item => $S_X") == "association"
+    assert ruleguess.query_shape("if $S_A then 1 else 2") == "if"
+    assert ruleguess.query_shape("") == "expression"
+
+
+def test_likely_rules():
+    assert ruleguess.likely_rules("procedure;")[0] == "subp_body_rule"
+    assert ruleguess.likely_rules("assignment;")[0] == "assignment_stmt_rule"
+    assert ruleguess.likely_rules("expression")[0] == "expr_rule"
+    assert ruleguess.likely_rules("unknown") == ruleguess.likely_rules("expression")
+
+
+def test_rule_history(tmp_path):
+    filepath = str(tmp_path / "history" / "rules.json")
+    history = ruleguess.RuleHistory(filepath)
+    assert not history.ranked("statement;")
+    history.record("statement;", "stmt_rule")
+    history.record("statement;", "call_stmt_rule")
+    history.record("statement;", "call_stmt_rule")
+    assert not os.path.exists(filepath)
+    history.save()
+    history = ruleguess.RuleHistory(filepath)
+    assert history.ranked("statement;") == ["call_stmt_rule", "stmt_rule"]
+    (tmp_path / "history" / "rules.json").write_text("not json")
+    assert not ruleguess.RuleHistory(filepath).counts
+
+
+def test_guess_parse_rules(tmp_path):
+    guessed = api.guess_parse_rules("Put ($S_X);")
+    assert guessed[0] == lal.GrammarRule.call_stmt_rule
+    history = ruleguess.RuleHistory(str(tmp_path / "rules.json"))
+    history.record("statement;", str(lal.GrammarRule.stmts_rule))
+    guessed = api.guess_parse_rules("Put ($S_X);", history)
+    assert guessed[0] == lal.GrammarRule.stmts_rule
+    assert len(guessed) == len(set(guessed))
+
+
+def test_findall_file_try_rules_history(tmp_path):
+    api._TRY_RULES_MEMO.clear()
+    history = ruleguess.RuleHistory(str(tmp_path / "rules.json"))
+    found = api.findall_file_try_rules(
+        "Put ($S_X);",
+        "tests/test_programs/dosort.adb",
+        lal.GrammarRule._c_to_py,
+        False,
+        history,
+    )
+    assert found
+    history.save()
+    rule = api._TRY_RULES_MEMO["Put ($S_X);", False]
+    assert rule in api.guess_parse_rules("Put ($S_X);")
+    assert ruleguess.RuleHistory(history.filepath).ranked("statement;") == [str(rule)]
@@ -757,9 +757,6 @@ def test_list_elements_trails_repeat_success():
 
 
 def test_list_elements_anti_greedy1():
-    """
-    Test shows that we don't get the behaviour we expect!
-    """
     assert (
         run_test(
             "$M_Before; $M_Before;",
@@ -768,14 +765,11 @@ def test_list_elements_anti_greedy1():
             "begin A1; A1; end;",
             lal.GrammarRule.block_stmt_rule,
         )
-        != "begin A1; X; Y; A1; end;"
+        == "begin A1; X; Y; A1; end;"
     )
 
 
 def test_list_elements_anti_greedy2():
-    """
-    Test shows that we don't get the behaviour we expect!
-    """
     assert (
         run_test(
             "$M_Before; $M_Before;",
@@ -784,7 +778,20 @@ def test_list_elements_anti_greedy2():
             "begin A1; A2; A1; A2; end;",
             lal.GrammarRule.block_stmt_rule,
         )
-        != "begin A1; A2; X; Y; A1; A2; end;"
+        == "begin A1; A2; X; Y; A1; A2; end;"
+    )
+
+
+def test_list_elements_backtrack():
+    assert (
+        run_test(
+            "$M_Before; B; C; $M_After;",
+            lal.GrammarRule.stmts_rule,
+            "$M_Before; X; Y; $M_After;",
+            "begin B; A; B; C; end;",
+            lal.GrammarRule.block_stmt_rule,
+        )
+        == "begin B; A; X; Y;  end;"
     )
 
 
@@ -875,9 +882,6 @@ def test_extract_statement2():
 
 
 def test_assignment():
-    """
-    Test shows that we don't get the behaviour we expect!
-    """
     assert (
         run_test(
             "$S_Var : $S_Type := $M_Expr;",
@@ -886,7 +890,7 @@ def test_assignment():
             "X : Integer;",
             lal.GrammarRule.basic_decl_rule,
         )
-        != "Y : Integer;"
+        == "Y : Integer;"
     )
 
 
@@ -903,6 +907,85 @@ def test_multiple_matches_single_line():
     )
 
 
+def test_multiple_statement_matches():
+    assert (
+        run_test(
+            "Put ($S_expr);",
+            lal.GrammarRule.stmt_rule,
+            "Put_Line ($S_expr);",
+            'Put ("Hello"); Put ("World");',
+            lal.GrammarRule.stmts_rule,
+        )
+        == 'Put_Line ("Hello"); Put_Line ("World");'
+    )
+
+
+def test_wildcards_per_match():
+    locations = api.findall_string(
+        "Put ($S_expr);",
+        "Put (A); Put (B);",
+        lal.GrammarRule.stmt_rule,
+        lal.GrammarRule.stmts_rule,
+    )
+    assert [location.wildcards["$S_expr"].text for location in locations] == [
+        "A",
+        "B",
+    ]
+
+
+def test_plural_wildcard_root_location():
+    assert (
+        run_test(
+            "$M_Stmt;",
+            lal.GrammarRule.stmt_rule,
+            "null;",
+            "A;",
+            lal.GrammarRule.stmt_rule,
+        )
+        == "null;"
+    )
+
+
+def test_children_laid_out_differently():
+    assert (
+        run_test(
+            "$S_A.$S_B",
+            lal.GrammarRule.expr_rule,
+            "$S_B",
+            "X'First",
+            lal.GrammarRule.expr_rule,
+        )
+        == "X'First"
+    )
+
+
+def test_plural_binding_against_single_node():
+    assert (
+        run_test(
+            "F ($M_Args); G ($M_Args);",
+            lal.GrammarRule.stmts_rule,
+            "null;",
+            "F (A, B); G (C);",
+            lal.GrammarRule.stmts_rule,
+        )
+        == "F (A, B); G (C);"
+    )
+
+
+def test_deeply_nested_backreference():
+    nested = "X (" * 1000 + "0" + ")" * 1000
+    assert (
+        run_test(
+            "$S_Name := $S_Name;",
+            lal.GrammarRule.stmt_rule,
+            "null;",
+            nested + " := " + nested + ";",
+            lal.GrammarRule.stmt_rule,
+        )
+        == "null;"
+    )
+
+
 def test_file_substitution():
     filepath = "temp.adb"
     with open(filepath, "w", encoding="utf-8") as file:
@@ -0,0 +1,112 @@
+"""
+Tests for serialising search results as JSON Lines and in the packed binary form.
+"""
+import io
+import json
+import pytest
+from Haystack import exceptions
+from Haystack import serialization
+from Haystack.location import Capture, Location
+
+# pylint: disable=missing-function-docstring
+
+
+def _results():
+    wildcards = {
+        "$S_Var": Capture("Ü_Name", 42, 48, "Identifier"),
+        "$M_Args": [Capture("A", 50, 51, "Identifier"), Capture("B (1)")],
+        "$M_None": None,
+    }
+    return [
+        serialization.FileResults(
+            "src/main.adb",
+            [
+                Location(3, 4, 5, 2, wildcards, 40, 200, "CallStmt"),
+                Location(2000, 2000, 1, 300, {}),
+            ],
+            "0123456789abcdef0123456789abcdef01234567",
+        ),
+        serialization.FileResults("src/empty.adb", []),
+    ]
+
+
+def _fields(results):
+    def capture(value):
+        return value.text, value.start, value.end, value.kind
+
+    def wildcard(value):
+        if value is None:
+            return None
+        if isinstance(value, list):
+            return [capture(item) for item in value]
+        return capture(value)
+
+    return [
+        (
+            result.filepath,
+            result.digest,
+            [
+                (
+                    repr(location),
+                    location.start,
+                    location.end,
+                    location.kind,
+                    {key: wildcard(value) for key, value in location.wildcards.items()},
+                )
+                for location in result.locations
+            ],
+        )
+        for result in results
+    ]
+
+
+def test_jsonl_round_trip():
+    outfile = io.StringIO()
+    serialization.write_jsonl(_results(), outfile)
+    lines = outfile.getvalue().splitlines()
+    assert json.loads(lines[0]) == {"format": "haystack-results", "version": 1}
+    assert len(lines) == 3
+    results = list(serialization.read_jsonl(io.StringIO(outfile.getvalue())))
+    assert _fields(results) == _fields(_results())
+
+
+def test_binary_round_trip():
+    data = serialization.to_binary(_results())
+    assert data.startswith(serialization.BINARY_MAGIC)
+    assert _fields(serialization.from_binary(data)) == _fields(_results())
+    # Strings that occur again are referred to by number
+    twice = serialization.to_binary(_results() + _results())
+    assert len(twice) < 2 * len(data) - 40
+
+
+def test_unsupported_version():
+    with pytest.raises(exceptions.ResultFormatException):
+        list(
+            serialization.read_jsonl(
+                io.StringIO('{"format": "haystack-results", "version": 99}\n')
+            )
+        )
+    with pytest.raises(exceptions.ResultFormatException):
+        serialization.from_binary(serialization.BINARY_MAGIC + bytes([99]))
+
+
+def test_corrupt_binary():
+    data = serialization.to_binary(_results())
+    with pytest.raises(exceptions.ResultFormatException):
+        serialization.from_binary(data[:-3])
+    with pytest.raises(exceptions.ResultFormatException):
+        serialization.from_binary(b"not results")
+
+
+def test_is_current(tmp_path):
+    filepath = tmp_path / "hello.adb"
+    filepath.write_text("procedure Hello is begin null; end Hello;\n")
+    result = serialization.FileResults(
+        str(filepath), [], serialization.file_digest(str(filepath))
+    )
+    assert result.is_current()
+    filepath.write_text("procedure Hello is begin null; end;\n")
+    assert not result.is_current()
+    filepath.unlink()
+    assert not result.is_current()
+    assert not serialization.FileResults(str(filepath), []).is_current()
@@ -2,6 +2,7 @@
 Module containing all tests that tests whether the _try_rules method
 is able to find rules to parse various forms of valid ada code.
 """
+import pytest
 import libadalang as lal  # type: ignore
 from Haystack import api
 
@@ -148,3 +149,50 @@ def test_findall_file_try_rules():
         and loc.end_line == 31
         and loc.end_char == 15
     )
+
+
+def test_findall_file_try_rules_no_match():
+    assert not api.findall_file_try_rules(
+        'Put("no such text")',
+        "tests/test_programs/dosort.adb",
+        lal.GrammarRule._c_to_py,
+        False,
+    )
+
+
+def test_findall_file_try_rules_no_rule_parses():
+    with pytest.raises(ValueError):
+        api.findall_file_try_rules(
+            ") := (",
+            "tests/test_programs/dosort.adb",
+            lal.GrammarRule._c_to_py,
+            False,
+        )
+
+
+def test_findall_file_try_rules_memo():
+    api._TRY_RULES_MEMO.clear()
+    first = api.findall_file_try_rules(
+        'Put("[")', "tests/test_programs/dosort.adb", lal.GrammarRule._c_to_py, False
+    )
+    rule = api._TRY_RULES_MEMO['Put("[")', False]
+    assert repr(first) == repr(
+        api.findall_file('Put("[")', "tests/test_programs/dosort.adb", rule)
+    )
+    second = api.findall_file_try_rules(
+        'Put("[")', "tests/test_programs/dosort.adb", lal.GrammarRule._c_to_py, False
+    )
+    assert repr(first) == repr(second) == "[31:7-31:15]"
+
+
+def test_findall_file_try_rules_memo_case():
+    api._TRY_RULES_MEMO.clear()
+    api.findall_file_try_rules(
+        'Put("[")', "tests/test_programs/dosort.adb", lal.GrammarRule._c_to_py, False
+    )
+    assert list(api._TRY_RULES_MEMO) == [('Put("[")', False)]
+    api.findall_file_try_rules(
+        'PUT("[")', "tests/test_programs/dosort.adb", lal.GrammarRule._c_to_py, True
+    )
+    assert ('PUT("[")', True) in api._TRY_RULES_MEMO
+    assert ('PUT("[")', False) not in api._TRY_RULES_MEMO
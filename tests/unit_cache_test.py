@@ -0,0 +1,65 @@
+"""
+Tests for the cache of parsed operand files.
+"""
+import os
+import shutil
+from Haystack import unitcache
+
+# pylint: disable=missing-function-docstring
+# pylint: disable=protected-access
+
+
+def test_cache_hit():
+    cache = unitcache.UnitCache()
+    first = cache.get("tests/test_programs/hello.adb")
+    second = cache.get("tests/test_programs/hello.adb")
+    assert first is second
+    assert cache.hits == 1 and cache.misses == 1
+
+
+def test_cache_modified_file(tmp_path):
+    filepath = str(tmp_path / "hello.adb")
+    shutil.copyfile("tests/test_programs/hello.adb", filepath)
+    cache = unitcache.UnitCache(content_hash=True)
+    first = cache.get(filepath)
+    with open(filepath, "a", encoding="utf-8") as file:
+        file.write("\n-- changed\n")
+    second = cache.get(filepath)
+    assert first is not second
+    assert second.unit.root is not None
+    assert "-- changed" in second.lines()[-1]
+
+
+def test_cache_eviction():
+    cache = unitcache.UnitCache(max_entries=2)
+    for name in ("hello.adb", "dosort.adb", "obj1.adb"):
+        cache.get(os.path.join("tests", "test_programs", name))
+    assert len(cache) == 2
+    cache.get("tests/test_programs/hello.adb")
+    assert cache.misses == 4
+
+
+def test_cache_own_context():
+    cache = unitcache.UnitCache(max_entries=1)
+    first = cache.get("tests/test_programs/hello.adb")
+    second = cache.get("tests/test_programs/dosort.adb")
+    assert first.unit.context is not second.unit.context
+    assert len(cache) == 1
+
+
+def test_cache_contents_read_once(monkeypatch):
+    cache = unitcache.UnitCache()
+    read = unitcache._read
+    calls = []
+
+    def counting_read(filepath):
+        calls.append(filepath)
+        return read(filepath)
+
+    monkeypatch.setattr(unitcache, "_read", counting_read)
+    data = cache.contents("tests/test_programs/hello.adb")
+    entry = cache.get("tests/test_programs/hello.adb", data)
+    assert len(calls) == 1 and entry.data == data
+    assert cache.contents("tests/test_programs/hello.adb") is entry.data
+    assert cache.get("tests/test_programs/hello.adb") is entry
+    assert len(calls) == 1